@@ -1,8 +1,26 @@
 import json
+import os
 import re
+import time
 from pathlib import Path
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
 
+try:
+    from . import metrics
+    from .ingest_manifest import IngestManifest, carry_forward
+    from .jsonl_index import SHARD_MODES, iter_records, parse_shard, shard_path
+    from .structural_chunker import RecursiveSplitter, scan_markdown
+except ImportError:
+    import metrics
+    from ingest_manifest import IngestManifest, carry_forward
+    from jsonl_index import SHARD_MODES, iter_records, parse_shard, shard_path
+    from structural_chunker import RecursiveSplitter, scan_markdown
+
+# 分块引擎：native 为单遍结构化分块（默认），langchain 为原先的 LangChain 分块器链，两者输出一致
+ENGINES = ("native", "langchain")
+# 去除空白后短于该长度的行计为短行，用于判断文本密度
+SHORT_LINE_CHARS = 50
+
 def get_separators_for_language(language):
     """
     根据编程语言返回分割符（regex）
@@ -66,11 +84,17 @@ def determine_chunk_size(text, content_type):
         return 800 # 允许切分代码块，设置合理的长度
         
     #根据文本密度决定 chunk_size
-    #统计小于50个字符的行的占比，超过40%则视为高密度
     lines = text.split('\n')
-    short_lines = sum(1 for line in lines if len(line.strip()) < 50 and len(line.strip()) > 0)
-    density_ratio = short_lines / len(lines) if lines else 0
-    
+    short_lines = sum(1 for line in lines if len(line.strip()) < SHORT_LINE_CHARS and len(line.strip()) > 0)
+    return density_chunk_size(short_lines, len(lines))
+
+
+def density_chunk_size(short_lines, total_lines):
+    """
+    由短行数和总行数决定文本的 chunk_size：短行占比超过40%视为高密度
+    """
+    density_ratio = short_lines / total_lines if total_lines else 0
+
     if density_ratio > 0.4:
         # 高密度内容（列表、短句等），使用较小的 chunk_size
         return 300
@@ -78,146 +102,291 @@ def determine_chunk_size(text, content_type):
         # 叙述性文本，使用较大的 chunk_size
         return 800
 
-def chunk_documents(input_file, output_file):
-    # 1. 定义分块器
-    # Markdown分块配置
-    headers_to_split_on = [
-        ("#", "h1"),
-        ("##", "h2"),
-        ("###", "h3"),
-    ]
-    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-
-    chunks_data = []
+# Markdown分块配置
+HEADERS_TO_SPLIT_ON = [
+    ("#", "h1"),
+    ("##", "h2"),
+    ("###", "h3"),
+]
+
+# 分块器缓存：按 (chunk_size, language) 复用，language 为 None 表示普通文本
+_SPLITTERS = {}
+
+
+def get_splitter(chunk_size, language=None):
+    """
+    获取（并缓存）指定 chunk_size 和语言的 RecursiveCharacterTextSplitter
+    """
+    key = (chunk_size, language.lower() if language is not None else None)
+    splitter = _SPLITTERS.get(key)
+    if splitter is None:
+        chunk_overlap = int(chunk_size * 0.1) # 10% overlap
+        if language is not None:
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                separators=get_separators_for_language(language),
+                is_separator_regex=True
+            )
+        else:
+            # 统一使用 RecursiveCharacterTextSplitter
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap
+            )
+        _SPLITTERS[key] = splitter
+    return splitter
+
+
+# native 引擎的分块器缓存，键与 _SPLITTERS 相同
+_NATIVE_SPLITTERS = {}
+
+
+def get_native_splitter(chunk_size, language=None):
+    """
+    获取（并缓存）与 get_splitter 配置相同的 RecursiveSplitter
+    """
+    key = (chunk_size, language.lower() if language is not None else None)
+    splitter = _NATIVE_SPLITTERS.get(key)
+    if splitter is None:
+        chunk_overlap = int(chunk_size * 0.1) # 10% overlap
+        if language is not None:
+            splitter = RecursiveSplitter(chunk_size, chunk_overlap, get_separators_for_language(language),
+                                         is_separator_regex=True)
+        else:
+            splitter = RecursiveSplitter(chunk_size, chunk_overlap)
+        _NATIVE_SPLITTERS[key] = splitter
+    return splitter
+
+
+def _langchain_chunks(md_splitter, content, current_headers):
+    """
+    LangChain 分块器链：按标题切分，再切出代码块，最后逐段递归切分；产出 (正文, 标题, 内容类型, chunk_size)
+    """
+    with metrics.timer("chunk_split_seconds", splitter="markdown_header"):
+        md_docs = md_splitter.split_text(content)
+
+    for md_doc in md_docs:
+        # 更新当前上下文标题（如果当前块有标题，则更新；否则保留之前的标题）
+        # doc.metadata 包含了该内容所属的完整标题路径，直接合并/覆盖即可
+        # current_headers 主要服务于后续可能出现的表格或无标题文本
+        if md_doc.metadata:
+            current_headers.update(md_doc.metadata)
+
+        # 内容类型识别 (Code vs Text)
+        segments = split_code_and_text(md_doc.page_content)
+
+        for seg in segments:
+            content_type = "text"
+            if seg['type'] == 'code':
+                content_type = "code"
+
+            # 动态决定 chunk_size，复用同一配置的分块器
+            chunk_size = determine_chunk_size(seg['content'], content_type)
+            language = seg.get('language', '') if content_type == "code" else None
+            splitter = get_splitter(chunk_size, language)
+
+            with metrics.timer("chunk_split_seconds", splitter=content_type):
+                texts = splitter.split_text(seg['content'])
+
+            metrics.inc("chunks_total", len(texts), content_type=content_type)
+            for text in texts:
+                metrics.observe("chunk_size_chars", len(text), content_type=content_type)
+                yield text, md_doc.metadata, content_type, chunk_size
+
+
+def _structural_chunks(content, current_headers):
+    """
+    单遍结构化分块：scan_markdown 一次扫描得到标题分段，并已按 ``` 围栏切成文本段和代码段，
+    文本段按扫描时统计的行密度决定 chunk_size；返回 [(正文, 标题, 内容类型, chunk_size)]
+    """
+    start = time.perf_counter()
+    chunks = []
+    for headers, segments in scan_markdown(content, HEADERS_TO_SPLIT_ON, SHORT_LINE_CHARS):
+        if headers:
+            current_headers.update(headers)
+
+        for seg_text, language, line_count, short_count in segments:
+            if language is None:
+                content_type, chunk_size = "text", density_chunk_size(short_count, line_count)
+            else:
+                content_type, chunk_size = "code", determine_chunk_size(seg_text, "code")
+            for chunk in get_native_splitter(chunk_size, language).split_text(seg_text):
+                chunks.append((chunk, headers, content_type, chunk_size))
+    metrics.observe("chunk_split_seconds", time.perf_counter() - start, splitter="structural")
+
+    # 指标按文档批量记录
+    sizes = {}
+    for chunk, _, content_type, _ in chunks:
+        sizes.setdefault(content_type, []).append(len(chunk))
+    for content_type, values in sizes.items():
+        metrics.inc("chunks_total", len(values), content_type=content_type)
+        metrics.observe_many("chunk_size_chars", values, content_type=content_type)
+    return chunks
+
+
+def iter_chunks(docs, engine="native"):
+    """
+    对解析结果逐条分块，以生成器形式产出 {"text": ..., "metadata": ...}
+
+    docs 为 intelligent_parser 输出格式的字典序列；同一源文件的记录需连续出现，
+    以便在记录之间保持标题上下文。engine 见 ENGINES，两种引擎的输出相同。
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown chunking engine {engine!r}, expected one of {ENGINES}")
+    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON) if engine == "langchain" else None
     
     # 状态变量：用于在行之间保持标题上下文
     last_source = None
     current_headers = {}
 
-    # 读取输入文件
-    print(f"Reading from {input_file}...")
+    for doc in docs:
+        source = doc.get('source', '')
+        
+        # 如果切换了文件，重置标题上下文
+        if source != last_source:
+            current_headers = {}
+            last_source = source
+            
+        content = doc.get('content', '')
+        file_type = doc.get('file_type', '')
+        page = doc.get('page', None)
+        is_table = doc.get('is_table', False)
+
+        # 表格不切分
+        if is_table:
+            chunk_meta = {
+                "source": source,
+                "file_type": file_type,
+                "page": page,
+                "content_type": "table",
+                "chunk_size": len(content), # 记录实际长度
+                "chunk_index": 0 
+            }
+            # 注入当前上下文的标题
+            chunk_meta.update(current_headers)
+            metrics.inc("chunks_total", content_type="table")
+            metrics.observe("chunk_size_chars", len(content), content_type="table")
+            
+            yield {
+                "text": content,
+                "metadata": chunk_meta
+            }
+            continue
+
+        # Markdown 结构化分块
+        if engine == "native":
+            chunks = _structural_chunks(content, current_headers)
+        else:
+            chunks = _langchain_chunks(md_splitter, content, current_headers)
+
+        # 元数据富集，逐个产出分块
+        for chunk_global_index, (text, headers, content_type, chunk_size) in enumerate(chunks):
+            chunk_meta = dict(headers)
+            chunk_meta['source'] = source
+            chunk_meta['file_type'] = file_type
+            if page:
+                chunk_meta['page'] = page
+            chunk_meta['chunk_index'] = chunk_global_index
+            chunk_meta['content_type'] = content_type
+            chunk_meta['chunk_size'] = chunk_size # 记录使用的 chunk_size
+
+            yield {
+                "text": text,
+                "metadata": chunk_meta
+            }
+
+
+def read_docs(input_file, skip_sources=(), shard=None, shard_by="contiguous"):
+    """
+    逐行读取解析结果 JSONL，跳过 skip_sources 中的源文件；指定 shard 时只读取该分片
+    """
+    if shard is not None:
+        for _, doc in iter_records(input_file, shard, shard_by):
+            if doc.get('source', '') not in skip_sources:
+                yield doc
+        return
     with open(input_file, 'r', encoding='utf-8') as f:
         for line in f:
             if not line.strip():
                 continue
             doc = json.loads(line)
-            source = doc.get('source', '')
-            
-            # 如果切换了文件，重置标题上下文
-            if source != last_source:
-                current_headers = {}
-                last_source = source
-                
-            content = doc.get('content', '')
-            file_type = doc.get('file_type', '')
-            page = doc.get('page', None)
-            is_table = doc.get('is_table', False)
-
-            # 表格不切分
-            if is_table:
-                chunk_meta = {
-                    "source": source,
-                    "file_type": file_type,
-                    "page": page,
-                    "content_type": "table",
-                    "chunk_size": len(content), # 记录实际长度
-                    "chunk_index": 0 
-                }
-                # 注入当前上下文的标题
-                chunk_meta.update(current_headers)
-                
-                chunks_data.append({
-                    "text": content,
-                    "metadata": chunk_meta
-                })
+            if doc.get('source', '') in skip_sources:
                 continue
+            yield doc
 
-            # Markdown 结构化分块
-            md_docs = md_splitter.split_text(content)
-            
-            chunk_global_index = 0
-            
-            for md_doc in md_docs:
-                # 获取当前Markdown块的元数据（标题）
-                base_meta = md_doc.metadata.copy()
-                
-                # 更新当前上下文标题（如果当前块有标题，则更新；否则保留之前的标题）
-                # 注意：这里假设MarkdownHeaderTextSplitter返回的每个doc如果属于同一层级，会覆盖之前的
-                if md_doc.metadata:
-                    # 只有当出现了新的标题时才更新对应的层级
-                    # 但是由于结构化分块的特性，doc.metadata 包含了该内容所属的完整路径
-                    # 所以我们可以直接合并/覆盖
-                    current_headers.update(md_doc.metadata)
-                
-                # 将累积的标题信息合并回 base_meta (以防当前 doc metadata 不完整，尽管通常 split_text 会处理好)
-                # 但更重要的是，我们需要确保 base_meta 包含了所有必要的字段
-                # 实际上，对于 md_doc，它自己的 metadata 就是最准确的标题上下文
-                # 我们主要需要 current_headers 来服务于后续可能出现的表格或无标题文本
-                
-                base_meta['source'] = source
-                base_meta['file_type'] = file_type
-                if page:
-                    base_meta['page'] = page
-                
-                # 内容类型识别 (Code vs Text)
-                segments = split_code_and_text(md_doc.page_content)
-                
-                for seg in segments:
-                    content_type = "text"
-                    if seg['type'] == 'code':
-                        content_type = "code"
-                        
-                    # 动态决定 chunk_size
-                    chunk_size = determine_chunk_size(seg['content'], content_type)
-                    chunk_overlap = int(chunk_size * 0.1) # 10% overlap
-                    
-                    if content_type == "code":
-                        language = seg.get('language', '')
-                        separators = get_separators_for_language(language)
-                        print(f"DEBUG: Splitting code. Language: {language}, Size: {chunk_size}, Separators: {separators[:2]}")
-                        splitter = RecursiveCharacterTextSplitter(
-                            chunk_size=chunk_size,
-                            chunk_overlap=chunk_overlap,
-                            separators=separators,
-                            is_separator_regex=True
-                        )
-                    else:
-                        # 统一使用 RecursiveCharacterTextSplitter
-                        splitter = RecursiveCharacterTextSplitter(
-                            chunk_size=chunk_size,
-                            chunk_overlap=chunk_overlap
-                        )
-                        
-                    sub_docs = splitter.create_documents([seg['content']])
-                    
-                    # 4. 元数据富集与结果收集
-                    for sub_doc in sub_docs:
-                        chunk_meta = base_meta.copy()
-                        chunk_meta['chunk_index'] = chunk_global_index
-                        chunk_meta['content_type'] = content_type
-                        chunk_meta['chunk_size'] = chunk_size # 记录使用的 chunk_size
-                        
-                        chunks_data.append({
-                            "text": sub_doc.page_content,
-                            "metadata": chunk_meta
-                        })
-                        chunk_global_index += 1
-
-    # 写入输出文件
-    print(f"Writing to {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for chunk in chunks_data:
+
+def chunk_documents(input_file, output_file, manifest_path=None, shard=None, shard_by="contiguous", engine="native"):
+    # 分片模式：只对输入的一个分片分块，输出写入 <output>.shard-i-of-N.jsonl
+    if shard is not None:
+        if manifest_path:
+            raise ValueError("--manifest cannot be combined with --shard")
+        output_file = shard_path(output_file, shard)
+
+    # 增量模式：先沿用未变更文件的分块结果，只对其余文件重新分块
+    manifest = None
+    kept = set()
+    write_path = output_file
+    if manifest_path:
+        manifest = IngestManifest(manifest_path)
+        write_path = f"{output_file}.tmp"
+        with open(write_path, 'w', encoding='utf-8') as f:
+            kept = carry_forward(manifest, "chunked", output_file, f)
+        print(f"增量模式: 沿用 {len(kept)} 个未变更文件的分块结果")
+    chunked_sources = set()
+
+    # 流式读取、分块并写入，内存占用与语料规模无关
+    print(f"Reading from {input_file}, writing to {output_file}...")
+    chunk_count = 0
+    with open(write_path, 'a' if manifest is not None else 'w', encoding='utf-8') as f:
+        docs = read_docs(input_file, skip_sources=kept, shard=shard, shard_by=shard_by)
+        for chunk in iter_chunks(docs, engine=engine):
             f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            chunked_sources.add(chunk['metadata']['source'])
+            chunk_count += 1
+
+    if manifest is not None:
+        os.replace(write_path, output_file)
+        # 没有解析记录或没有产生分块的源文件同样记为已分块
+        empty = manifest.empty_sources("chunked", kept | chunked_sources)
+        for source in chunked_sources.union(empty):
+            manifest.mark(source, "chunked")
+        manifest.save()
             
-    print(f"分块完成，共生成 {len(chunks_data)} 个分块。结果已保存至 {output_file}")
+    print(f"分块完成，共生成 {chunk_count} 个分块。结果已保存至 {output_file}")
 
 import argparse
 
-if __name__ == "__main__":
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Advanced Chunker")
     parser.add_argument("--input_file", type=str, default="data/output/parsed.jsonl", help="Path to input JSONL file")
     parser.add_argument("--output_file", type=str, default="data/output/chunks.jsonl", help="Path to output JSONL file")
+    parser.add_argument("--manifest", type=str, default=None, help="Path to ingest manifest; enables incremental chunking")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only chunk shard i of N of the input (i/N); writes <output>.shard-i-of-N.jsonl")
+    parser.add_argument("--shard_by", type=str, default="contiguous", choices=SHARD_MODES,
+                        help="contiguous: byte-balanced ranges aligned to source boundaries; hash: by source path")
+    parser.add_argument("--engine", type=str, default="native", choices=ENGINES,
+                        help="native: single-pass structural chunker; langchain: the original LangChain splitter chain")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="Write splitter timings and chunk size distributions as Prometheus text (.prom) or JSON (.json)")
+    parser.add_argument("--profile", type=str, default=None, choices=["cprofile", "pyinstrument"],
+                        help="Profile the chunk stage")
+    parser.add_argument("--profile_dir", type=str, default="data/output/profiles")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.shard is not None and args.manifest:
+        parser.error("--manifest cannot be combined with --shard")
+    if args.profile:
+        metrics.configure_profiling(["chunk"], args.profile, args.profile_dir)
     
-    chunk_documents(args.input_file, args.output_file)
+    with metrics.stage("chunk"):
+        chunk_documents(args.input_file, args.output_file, manifest_path=args.manifest,
+                        shard=args.shard, shard_by=args.shard_by, engine=args.engine)
+    if args.metrics:
+        metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
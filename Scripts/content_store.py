@@ -0,0 +1,342 @@
+"""
+本地分块文本存储：把分块正文从 Milvus 中移出，Collection 只保存主键、向量和可过滤的元数据，
+检索得到 top-k 之后再按 chunk_id 批量取回正文。
+
+目录结构：
+    CURRENT               - 当前版本：{"data": 数据文件名, "index": 索引版本号}，每次提交时原子替换
+    blocks.<g>.zst        - 若干 zstd 压缩块首尾相接，每块约 block_size 字节的 UTF-8 正文
+    blocks.<n>.npy        - 每块在数据文件中的起始偏移（uint64），末尾附加文件的有效长度
+    ids.<n>.npy           - 按 chunk_id 排序的主键（int64）
+    locations.<n>.npy     - 与 ids 一一对应的 (块号, 块内偏移, 字节数)（uint32）
+
+追加只在当前数据文件末尾写入，close() 时写出新版本的索引文件，再替换 CURRENT；中途崩溃时数据文件末尾
+未登记的字节会在下次追加时截掉。全量重建写入新的数据文件，不会截断正在被读取的旧文件：已打开的 ContentStore
+继续读取旧版本（旧文件删除后 inode 仍由内存映射持有），refresh() 后切换到新版本。
+读取时内存映射数据文件与索引，按块解压（最近使用的块缓存在内存中）。
+同一 chunk_id 重复写入时以最后一次为准；被删除或更新的分块不会回收空间，全量导入时重建即可。
+
+python Scripts/content_store.py --input data/output/vectorized.jsonl --store data/output/content
+python Scripts/content_store.py --store data/output/content --stats
+"""
+import argparse
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+DEFAULT_LEVEL = 9
+# 读取端打开时恰逢写入端提交并删除旧版本文件，重新读取 CURRENT 的次数
+OPEN_RETRIES = 5
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The content store requires zstandard: pip install zstandard") from None
+    return zstandard
+
+
+def _fsync_write(path: Path, write):
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_current(directory: Path) -> Optional[dict]:
+    """
+    读取当前版本；目录为空时返回 None
+    """
+    try:
+        with open(directory / "CURRENT", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_current(directory: Path, current: dict):
+    tmp_path = directory / "CURRENT.tmp"
+    _fsync_write(tmp_path, lambda f: f.write(json.dumps(current).encode("utf-8")))
+    os.replace(tmp_path, directory / "CURRENT")
+    # 目录项也要落盘，否则掉电后可能仍指向旧版本
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _index_paths(directory: Path, version: int):
+    return [directory / f"{name}.{version}.npy" for name in ("blocks", "ids", "locations")]
+
+
+def _load_index(directory: Path, current: Optional[dict], mmap_mode=None):
+    """
+    读取 (块偏移, 主键, 位置)；没有当前版本时返回空索引
+    """
+    if current is None:
+        return (np.zeros(1, dtype=np.uint64), np.zeros(0, dtype=np.int64),
+                np.zeros((0, 3), dtype=np.uint32))
+    blocks_path, ids_path, locations_path = _index_paths(directory, current["index"])
+    return (np.load(blocks_path), np.load(ids_path, mmap_mode=mmap_mode),
+            np.load(locations_path, mmap_mode=mmap_mode))
+
+
+class ContentStoreWriter:
+    """
+    向内容存储追加 (chunk_id, 正文)；append=False 时重建（写入新的数据文件，读取端在 refresh() 前不受影响）
+    """
+
+    def __init__(self, directory, append: bool = True, block_size: int = DEFAULT_BLOCK_SIZE,
+                 level: int = DEFAULT_LEVEL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.block_size = block_size
+        self.compressor = _zstd().ZstdCompressor(level=level)
+        self.previous = _read_current(self.directory)
+        self.version = self.previous["index"] + 1 if self.previous is not None else 0
+        self.offsets, self.old_ids, self.old_locations = [0], np.zeros(0, dtype=np.int64), np.zeros((0, 3), np.uint32)
+        if append and self.previous is not None:
+            offsets, self.old_ids, self.old_locations = _load_index(self.directory, self.previous)
+            self.offsets = [int(o) for o in offsets]
+            self.data_name = self.previous["data"]
+            self.f = open(self.directory / self.data_name, "r+b")
+            # 截掉上次未登记到索引中的尾部（读取端只映射已登记的部分）
+            self.f.seek(self.offsets[-1])
+            self.f.truncate()
+        else:
+            # 新的数据文件：正在读取旧文件的进程持有的内存映射不受影响
+            self.data_name = f"blocks.{self.version}.zst"
+            self.f = open(self.directory / self.data_name, "wb")
+        self.ids = []
+        self.locations = []
+        self.buffer = bytearray()
+        self.raw_bytes = 0
+
+    def add(self, ids: Iterable[int], texts: Iterable[str]):
+        for chunk_id, text in zip(ids, texts):
+            data = text.encode("utf-8")
+            self.ids.append(int(chunk_id))
+            self.locations.append((len(self.offsets) - 1, len(self.buffer), len(data)))
+            self.buffer += data
+            self.raw_bytes += len(data)
+            if len(self.buffer) >= self.block_size:
+                self._write_block()
+
+    def _write_block(self):
+        if not self.buffer:
+            return
+        with metrics.timer("content_store_compress_seconds"):
+            frame = self.compressor.compress(bytes(self.buffer))
+        self.f.write(frame)
+        self.offsets.append(self.offsets[-1] + len(frame))
+        self.buffer = bytearray()
+
+    def close(self):
+        """
+        写出最后一块和新版本的索引，再原子替换 CURRENT；同一 chunk_id 以最后一次写入为准
+        """
+        self._write_block()
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+        ids = np.concatenate([np.asarray(self.old_ids), np.asarray(self.ids, dtype=np.int64)])
+        locations = np.concatenate([np.asarray(self.old_locations),
+                                    np.asarray(self.locations, dtype=np.uint32).reshape(-1, 3)])
+        order = np.argsort(ids, kind="stable")
+        ids, locations = ids[order], locations[order]
+        last = np.append(ids[1:] != ids[:-1], True)
+        blocks_path, ids_path, locations_path = _index_paths(self.directory, self.version)
+        _fsync_write(blocks_path, lambda f: np.save(f, np.asarray(self.offsets, dtype=np.uint64)))
+        _fsync_write(ids_path, lambda f: np.save(f, ids[last]))
+        _fsync_write(locations_path, lambda f: np.save(f, locations[last]))
+        _write_current(self.directory, {"data": self.data_name, "index": self.version})
+        # 旧版本的文件不再被新打开的读取端使用；已打开的读取端通过内存映射继续持有它们
+        if self.previous is not None:
+            stale = _index_paths(self.directory, self.previous["index"])
+            if self.previous["data"] != self.data_name:
+                stale.append(self.directory / self.previous["data"])
+            for path in stale:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        print(f"Content store {self.directory}: {int(last.sum())} chunks, {len(self.offsets) - 1} blocks, "
+              f"{self.offsets[-1] / 1024 / 1024:.1f} MB compressed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ContentStore:
+    """
+    只读访问：get_many 一次取回一批 chunk_id 的正文，每个涉及的块只解压一次
+    """
+
+    def __init__(self, directory, cache_blocks: int = 256):
+        self.directory = Path(directory)
+        if _read_current(self.directory) is None:
+            raise FileNotFoundError(f"{self.directory} is not a content store; import with --content_store first")
+        self.decompressor = _zstd().ZstdDecompressor()
+        self.cache_blocks = cache_blocks
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"lookups": 0, "missing": 0, "blocks_read": 0, "block_hits": 0}
+        self.data = None
+        self._open()
+
+    def _open(self):
+        for attempt in range(OPEN_RETRIES):
+            current = _read_current(self.directory)
+            try:
+                self.offsets, self.ids, self.locations = _load_index(self.directory, current, mmap_mode="r")
+                data_file = open(self.directory / current["data"], "rb")
+            except FileNotFoundError:
+                # 读取 CURRENT 之后写入端恰好提交了新版本并删除了旧文件，重新读取
+                if attempt == OPEN_RETRIES - 1:
+                    raise
+                continue
+            break
+        self._version = current
+        size = int(self.offsets[-1])
+        with data_file:
+            if size:
+                self.data = mmap.mmap(data_file.fileno(), size, access=mmap.ACCESS_READ)
+
+    def refresh(self) -> bool:
+        """
+        写入端提交过新版本时（如导入之后）重新打开，返回是否重新打开；全量重建会重新编号，因此同时清空块缓存
+        """
+        if _read_current(self.directory) == self._version:
+            return False
+        with self.lock:
+            self.close()
+            self._open()
+            self.cache.clear()
+        return True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _block(self, block: int) -> bytes:
+        data = self.cache.get(block)
+        if data is not None:
+            self.cache.move_to_end(block)
+            self.stats["block_hits"] += 1
+            return data
+        start, end = int(self.offsets[block]), int(self.offsets[block + 1])
+        data = self.decompressor.decompress(self.data[start:end])
+        self.stats["blocks_read"] += 1
+        if self.cache_blocks > 0:
+            self.cache[block] = data
+            while len(self.cache) > self.cache_blocks:
+                self.cache.popitem(last=False)
+        return data
+
+    def get_many(self, ids: Iterable[int]) -> List[Optional[str]]:
+        """
+        按 chunk_id 批量取回正文，找不到的返回 None
+        """
+        ids = np.asarray(list(ids), dtype=np.int64)
+        texts = [None] * len(ids)
+        if not len(ids) or not len(self.ids):
+            return texts
+        with metrics.timer("content_store_get_seconds"):
+            positions = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+            found = np.asarray(self.ids[positions]) == ids
+            locations = np.asarray(self.locations[positions[found]])
+            # 按块号排序，同一块内的分块只解压一次
+            order = np.argsort(locations[:, 0], kind="stable")
+            targets = np.flatnonzero(found)[order].tolist()
+            with self.lock:
+                for target, (block, start, length) in zip(targets, locations[order].tolist()):
+                    data = self._block(block)
+                    texts[target] = data[start:start + length].decode("utf-8")
+                self.stats["lookups"] += len(ids)
+                self.stats["missing"] += int((~found).sum())
+        return texts
+
+    def get(self, chunk_id: int) -> Optional[str]:
+        return self.get_many([chunk_id])[0]
+
+    def hydrate(self, hits: List[Dict], field: str = "text") -> List[Dict]:
+        """
+        为检索结果（含 "id" 字段的 dict 列表）填入正文
+        """
+        for hit, text in zip(hits, self.get_many(hit["id"] for hit in hits)):
+            hit[field] = text
+        return hits
+
+    def size_stats(self) -> Dict[str, float]:
+        return {
+            "chunks": len(self.ids),
+            "blocks": len(self.offsets) - 1,
+            "compressed_bytes": int(self.offsets[-1]),
+            "index_bytes": int(self.ids.nbytes + self.locations.nbytes + self.offsets.nbytes),
+        }
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+def build_from_jsonl(input_file, directory, append: bool = False, block_size: int = DEFAULT_BLOCK_SIZE,
+                     level: int = DEFAULT_LEVEL) -> int:
+    """
+    由分块或向量 JSONL 建立内容存储（主键与 import_to_milvus 的 chunk_id 一致），返回写入的分块数
+    """
+    try:
+        from .import_to_milvus import item_chunk_id
+    except ImportError:
+        from import_to_milvus import item_chunk_id
+
+    count = 0
+    with ContentStoreWriter(directory, append=append, block_size=block_size, level=level) as writer:
+        with open(input_file, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                writer.add([item_chunk_id(item)], [item.get("text", "")])
+                count += 1
+        print(f"Compressed {writer.raw_bytes / 1024 / 1024:.1f} MB of text")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the local chunk text store")
+    parser.add_argument("--store", type=str, default="data/output/content", help="Content store directory")
+    parser.add_argument("--input", type=str, default=None, help="Chunk or vectorized JSONL to add to the store")
+    parser.add_argument("--append", action="store_true", help="Append to the store instead of rebuilding it")
+    parser.add_argument("--block_size", type=int, default=DEFAULT_BLOCK_SIZE, help="Uncompressed bytes per zstd block")
+    parser.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="zstd compression level")
+    parser.add_argument("--stats", action="store_true", help="Print the store size")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        build_from_jsonl(args.input, args.store, append=args.append, block_size=args.block_size, level=args.level)
+    if args.stats or not args.input:
+        store = ContentStore(args.store)
+        print(json.dumps(store.size_stats(), indent=2))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+分块去重：在分块与向量化之间去掉完全重复和近似重复的分块
+
+    完全重复 - 规范化文本（去掉 "# 第N页" 页码行、NFKC、小写、合并空白）的哈希相同
+    近似重复 - 中日韩文字逐字、其他文字按词切分后取 shingle_size 个词元的 shingle，计算 MinHash 签名，
+              用 LSH 分桶找候选，签名估计的 Jaccard 相似度不低于 threshold 时视为重复
+
+只在 content_type 相同的分块之间比较。按输入顺序处理，第一次出现的分块作为规范分块保留；
+被去掉的分块连同其规范分块的 chunk_id 与相似度写入去重日志（默认 <output>.dups.jsonl），来源信息不会丢失。
+
+python Scripts/dedup.py --input data/output/chunks.jsonl --output data/output/chunks.dedup.jsonl --report data/output/dedup_report.json
+"""
+import argparse
+import hashlib
+import json
+import re
+import unicodedata
+import zlib
+from typing import Optional
+
+import numpy as np
+
+try:
+    from . import metrics
+    from .import_to_milvus import item_chunk_id
+except ImportError:
+    import metrics
+    from import_to_milvus import item_chunk_id
+
+# 中日韩文字按单字切分（汉字、假名、谚文）
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+TOKEN_PATTERN = re.compile(f"[{CJK}]|[^\\W_{CJK}]+")
+PAGE_PREFIX_PATTERN = re.compile(r"^#\s*第\d+页\s*$", re.MULTILINE)
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text):
+    """
+    去重用的规范化文本：去掉解析器加的页码行，NFKC（全角转半角等）、小写并合并空白
+    """
+    text = PAGE_PREFIX_PATTERN.sub("", text)
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def shingle_hashes(text, shingle_size=5):
+    """
+    规范化文本的 shingle 集合（32 位哈希）；词元数不足 shingle_size 时返回空数组
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    if len(tokens) < shingle_size:
+        return np.empty(0, dtype=np.uint64)
+    hashes = {zlib.crc32("\x1f".join(tokens[i:i + shingle_size]).encode("utf-8"))
+              for i in range(len(tokens) - shingle_size + 1)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def lsh_params(threshold, num_perm, false_negative_weight=0.8):
+    """
+    选择 LSH 的 (bands, rows)：在 bands * rows = num_perm 的组合中，使相似度低于 threshold 的误报概率
+    与高于 threshold 的漏报概率的加权和最小。候选还要经签名相似度复核，误报只多花一次比较，因此漏报权重更高
+    """
+    best, best_error = None, None
+    grid = np.linspace(0, 1, 201)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        collide = 1 - (1 - grid ** rows) ** bands
+        # 等距网格上的均值即积分的近似
+        error = np.where(grid < threshold, (1 - false_negative_weight) * collide,
+                         false_negative_weight * (1 - collide)).mean()
+        if best_error is None or error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class Deduplicator:
+    """
+    流式去重：keep(chunk) 返回是否保留该分块；被去掉的分块记录到 log_path（JSONL）
+
+    threshold 为近似重复的 Jaccard 相似度阈值；near=False 时只去掉完全重复的分块。
+    内存占用为每个保留分块一个 num_perm 维的 uint32 签名加 LSH 桶。
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 5, near: bool = True,
+                 log_path: Optional[str] = None, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.near = near
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        # 规范化文本哈希 -> 规范分块下标；每个 content_type 一组 LSH 桶
+        self._exact = {}
+        self._buckets = {}
+        self._signatures = []
+        self._canonical = []
+        self.log = open(log_path, "w", encoding="utf-8") if log_path else None
+        self.stats = {"chunks_in": 0, "chunks_out": 0, "exact_duplicates": 0, "near_duplicates": 0,
+                      "chars_in": 0, "chars_out": 0, "bytes_in": 0, "bytes_out": 0, "by_content_type": {}}
+
+    def signature(self, hashes):
+        """
+        shingle 哈希集合的 MinHash 签名（num_perm 个 uint32）
+        """
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def keep(self, chunk) -> bool:
+        text = chunk.get("text", "")
+        meta = chunk.get("metadata", {})
+        content_type = meta.get("content_type", "text")
+        size = len(text.encode("utf-8"))
+        self._count(content_type, "in", text, size)
+
+        normalized = normalize_text(text)
+        digest = hashlib.blake2b(f"{content_type}\0{normalized}".encode("utf-8"), digest_size=16).digest()
+        canonical = self._exact.get(digest)
+        if canonical is not None:
+            self._drop(chunk, canonical, "exact", 1.0)
+            return False
+
+        signature = None
+        keys = None
+        if self.near:
+            hashes = shingle_hashes(normalized, self.shingle_size)
+            if len(hashes):
+                signature = self.signature(hashes)
+                keys = [(content_type, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                        for band in range(self.bands)]
+                candidates = {i for key in keys for i in self._buckets.get(key, ())}
+                best, best_similarity = None, 0.0
+                for i in candidates:
+                    similarity = float(np.mean(self._signatures[i] == signature))
+                    if similarity > best_similarity:
+                        best, best_similarity = i, similarity
+                if best is not None and best_similarity >= self.threshold:
+                    self._drop(chunk, best, "near", best_similarity)
+                    return False
+
+        index = len(self._canonical)
+        self._exact[digest] = index
+        self._canonical.append({"chunk_id": item_chunk_id(chunk), "source": meta.get("source"),
+                                "page": meta.get("page"), "chunk_index": meta.get("chunk_index")})
+        self._signatures.append(signature)
+        for key in keys or ():
+            self._buckets.setdefault(key, []).append(index)
+        self._count(content_type, "out", text, size)
+        metrics.inc("dedup_chunks_total", result="kept")
+        return True
+
+    def filter(self, chunks):
+        """
+        以生成器形式产出保留的分块
+        """
+        for chunk in chunks:
+            if self.keep(chunk):
+                yield chunk
+
+    def _count(self, content_type, direction, text, size):
+        by_type = self.stats["by_content_type"].setdefault(content_type, {"chunks_in": 0, "chunks_out": 0})
+        by_type[f"chunks_{direction}"] += 1
+        self.stats[f"chunks_{direction}"] += 1
+        self.stats[f"chars_{direction}"] += len(text)
+        self.stats[f"bytes_{direction}"] += size
+
+    def _drop(self, chunk, canonical, kind, similarity):
+        self.stats[f"{kind}_duplicates"] += 1
+        metrics.inc("dedup_chunks_total", result=kind)
+        if self.log is not None:
+            record = {"chunk_id": item_chunk_id(chunk), "text": chunk.get("text", ""),
+                      "metadata": chunk.get("metadata", {}), "kind": kind, "similarity": round(similarity, 4),
+                      "canonical": self._canonical[canonical]}
+            self.log.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def report(self, dim: int = 768) -> dict:
+        """
+        去重前后的分块数、待编码字符数（编码计算量）以及 Collection 体积估计（float32 向量 + 文本）
+        """
+        stats = self.stats
+        report = {key: value for key, value in stats.items() if key != "by_content_type"}
+        report["by_content_type"] = {k: dict(v) for k, v in stats["by_content_type"].items()}
+        report["dim"] = dim
+        report["collection_bytes_in"] = stats["chunks_in"] * dim * 4 + stats["bytes_in"]
+        report["collection_bytes_out"] = stats["chunks_out"] * dim * 4 + stats["bytes_out"]
+        for name, before, after in (("chunks", "chunks_in", "chunks_out"), ("embed_chars", "chars_in", "chars_out"),
+                                    ("collection_bytes", "collection_bytes_in", "collection_bytes_out")):
+            report[f"{name}_reduction"] = 1 - report[after] / report[before] if report[before] else 0.0
+        return report
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def print_report(report):
+    print(f"Dedup: {report['chunks_in']} -> {report['chunks_out']} chunks "
+          f"({report['exact_duplicates']} exact, {report['near_duplicates']} near duplicates, "
+          f"-{report['chunks_reduction']:.1%})")
+    print(f"  Characters to embed: {report['chars_in']} -> {report['chars_out']} (-{report['embed_chars_reduction']:.1%})")
+    print(f"  Collection size at dim {report['dim']}: {report['collection_bytes_in'] / 1024 / 1024:.1f} -> "
+          f"{report['collection_bytes_out'] / 1024 / 1024:.1f} MB (-{report['collection_bytes_reduction']:.1%})")
+    for content_type, counts in sorted(report["by_content_type"].items()):
+        print(f"  {content_type}: {counts['chunks_in']} -> {counts['chunks_out']}")
+
+
+def dedup_file(input_path, output_path, log_path=None, report_path=None, dim=768, **kwargs):
+    """
+    对分块 JSONL 去重并写出，返回报告；kwargs 传给 Deduplicator
+    """
+    log_path = log_path or f"{output_path}.dups.jsonl"
+    deduplicator = Deduplicator(log_path=log_path, **kwargs)
+    print(f"Reading from {input_path}, writing to {output_path} (duplicates logged to {log_path})...")
+    with open(input_path, "r", encoding="utf-8") as f_in, open(output_path, "w", encoding="utf-8") as f_out:
+        chunks = (json.loads(line) for line in f_in if line.strip())
+        for chunk in deduplicator.filter(chunks):
+            f_out.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    deduplicator.close()
+
+    report = deduplicator.report(dim)
+    print_report(report)
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {report_path}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove exact and near-duplicate chunks before embedding")
+    parser.add_argument("--input", type=str, default="data/output/chunks.jsonl", help="Path to input chunks JSONL")
+    parser.add_argument("--output", type=str, default="data/output/chunks.dedup.jsonl", help="Path to output chunks JSONL")
+    parser.add_argument("--log", type=str, default=None,
+                        help="Where to record dropped chunks and their canonical chunk (default: <output>.dups.jsonl)")
+    parser.add_argument("--report", type=str, default=None, help="Write the reduction report as JSON")
+    parser.add_argument("--threshold", type=float, default=0.9, help="Jaccard similarity above which chunks are near duplicates")
+    parser.add_argument("--num_perm", type=int, default=128, help="MinHash permutations")
+    parser.add_argument("--shingle_size", type=int, default=5, help="Tokens per shingle (CJK characters count as tokens)")
+    parser.add_argument("--exact_only", action="store_true", help="Only remove exact duplicates after normalization")
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimension used to estimate collection size")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="Write dedup counters as Prometheus text (.prom) or JSON (.json)")
+    parser.add_argument("--profile", type=str, default=None, choices=["cprofile", "pyinstrument"],
+                        help="Profile the dedup stage")
+    parser.add_argument("--profile_dir", type=str, default="data/output/profiles")
+    args = parser.parse_args(argv)
+    if args.profile:
+        metrics.configure_profiling(["dedup"], args.profile, args.profile_dir)
+
+    with metrics.stage("dedup"):
+        dedup_file(args.input, args.output, log_path=args.log, report_path=args.report, dim=args.dim,
+                   threshold=args.threshold, num_perm=args.num_perm, shingle_size=args.shingle_size,
+                   near=not args.exact_only)
+    if args.metrics:
+        metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def cache_key(model_name: str, truncate_dim: Optional[int], normalize_embeddings: bool, text: str) -> bytes:
+    """
+    按 (模型, 截断维度, 是否归一化, 文本) 计算内容寻址的缓存键
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{model_name}\0{truncate_dim}\0{int(normalize_embeddings)}\0".encode("utf-8"))
+    digest.update(text.encode("utf-8"))
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的持久化向量缓存
+
+    向量以 float32 原始字节存储；超过 max_bytes 时按最近使用时间淘汰，
+    直到总大小回落到上限的 90%。总大小由触发器维护在 cache_meta 表中，写入时无需扫描全表。
+    """
+
+    # SQLite 单条语句的参数个数有限，批量查询时分批进行
+    QUERY_BATCH = 500
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # INSERT OR REPLACE 替换已有键时也要触发删除触发器，总大小才不会重复计入
+        self.conn.execute("PRAGMA recursive_triggers=ON")
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS embeddings_size_insert AFTER INSERT ON embeddings BEGIN "
+            "UPDATE cache_meta SET value = value + LENGTH(NEW.vector) + LENGTH(NEW.key) WHERE name = 'size_bytes'; END"
+        )
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS embeddings_size_delete AFTER DELETE ON embeddings BEGIN "
+            "UPDATE cache_meta SET value = value - LENGTH(OLD.vector) - LENGTH(OLD.key) WHERE name = 'size_bytes'; END"
+        )
+        # 旧版本建立的缓存没有计数，首次打开时统计一次
+        self.conn.execute(
+            "INSERT OR IGNORE INTO cache_meta (name, value) "
+            "SELECT 'size_bytes', COALESCE(SUM(LENGTH(vector) + LENGTH(key)), 0) FROM embeddings"
+        )
+        self.conn.commit()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        批量查询，返回命中的 {key: vector}
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), self.QUERY_BATCH):
+            batch = unique_keys[i:i + self.QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+            self.conn.commit()
+
+        hits = sum(1 for k in keys if k in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        now = time.time()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(k, v.tobytes(), now) for k, v in zip(keys, vectors)],
+        )
+        self.conn.commit()
+        if self.max_bytes is not None:
+            self.evict()
+
+    def size_bytes(self) -> int:
+        row = self.conn.execute("SELECT value FROM cache_meta WHERE name = 'size_bytes'").fetchone()
+        return row[0]
+
+    def evict(self):
+        """
+        按最近使用时间淘汰，直到缓存大小不超过上限的 90%
+        """
+        total = self.size_bytes()
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        cursor = self.conn.execute(
+            "SELECT key, LENGTH(vector) + LENGTH(key) FROM embeddings ORDER BY last_used ASC"
+        )
+        victims = []
+        for key, size in cursor:
+            if total - removed <= target:
+                break
+            victims.append((key,))
+            removed += size
+        self.conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self.conn.commit()
+        print(f"Embedding cache evicted {len(victims)} entries ({removed / 1024 / 1024:.1f} MB).")
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size_bytes": self.size_bytes(),
+        }
+
+    def close(self):
+        self.conn.close()
@@ -1,27 +1,320 @@
 import argparse
 import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import torch
 from typing import List, Union, Optional
-from sentence_transformers import SentenceTransformer
-from sklearn.preprocessing import normalize
 from tqdm import tqdm
 
+try:
+    from . import metrics
+    from .embedding_cache import EmbeddingCache, cache_key
+    from .ingest_manifest import IngestManifest, carry_forward, record_source
+    from .embedding_server import RemoteEmbeddingClient
+    from .jsonl_index import SHARD_MODES, hash_shard, parse_shard, shard_byte_range, shard_path
+    from .onnx_backend import DEFAULT_CACHE_DIR as DEFAULT_ONNX_DIR, OnnxEncoder, export_onnx
+    from .quantization import quantize_file
+    from .vector_store import NPY_HEADER_LEN, NpyVectorWriter, load_vectors, mrl_prefix, vector_path_for, write_prefix_vectors
+except ImportError:
+    import metrics
+    from embedding_cache import EmbeddingCache, cache_key
+    from ingest_manifest import IngestManifest, carry_forward, record_source
+    from embedding_server import RemoteEmbeddingClient
+    from jsonl_index import SHARD_MODES, hash_shard, parse_shard, shard_byte_range, shard_path
+    from onnx_backend import DEFAULT_CACHE_DIR as DEFAULT_ONNX_DIR, OnnxEncoder, export_onnx
+    from quantization import quantize_file
+    from vector_store import NPY_HEADER_LEN, NpyVectorWriter, load_vectors, mrl_prefix, vector_path_for, write_prefix_vectors
+
+# torch、sentence-transformers 和 sklearn 导入耗时数秒，只在真正需要模型时导入：
+# 经 --server 编码、缓存全部命中或只导入本模块的检索进程都不会加载它们
+
+
+def l2_normalize(embeddings):
+    from sklearn.preprocessing import normalize
+
+    return normalize(embeddings)
+
+
+def register_metrics_hooks(model):
+    """
+    在模型首尾模块上注册前向钩子，记录每个批次的延迟、条数和 token 数（有效 token 与含 padding 的 token）
+    """
+    first, last = model[0], model[len(model) - 1]
+    batch = {}
+
+    def before(module, args):
+        # features 可能是 dict 或 BatchEncoding
+        mask = args[0].get("attention_mask") if args and hasattr(args[0], "get") else None
+        batch["size"] = mask.shape[0] if mask is not None else 0
+        batch["tokens"] = int(mask.sum()) if mask is not None else 0
+        batch["padded_tokens"] = mask.numel() if mask is not None else 0
+        batch["start"] = time.perf_counter()
+
+    def after(module, args, output):
+        if "start" not in batch:
+            return
+        # GPU 上的计算是异步的，同步后计时才是该批次的真实耗时
+        if model.device.type == "cuda":
+            import torch
+
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - batch.pop("start")
+        metrics.observe("encode_batch_seconds", elapsed)
+        metrics.observe("encode_batch_size", batch["size"])
+        metrics.inc("encode_tokens_total", batch["tokens"])
+        metrics.inc("encode_padded_tokens_total", batch["padded_tokens"])
+        if elapsed > 0:
+            metrics.observe("encode_batch_tokens_per_second", batch["tokens"] / elapsed)
+
+    first.register_forward_pre_hook(before)
+    last.register_forward_hook(after)
+
+
+def load_tokenizer(model_name: str):
+    """
+    只加载 SentenceTransformer 中 Transformer 模块的分词器和配置（不加载权重），
+    返回 (tokenizer, max_seq_length, do_lower_case)；编码池的父进程只需要它来统计 token 数
+    """
+    from transformers import AutoConfig, AutoTokenizer
+
+    model_dir = model_name
+    if not os.path.isdir(model_dir):
+        from huggingface_hub import snapshot_download
+
+        model_dir = snapshot_download(model_name, allow_patterns=["*.json", "*.txt", "*.model"])
+    path = model_dir
+    modules_path = os.path.join(model_dir, "modules.json")
+    if os.path.exists(modules_path):
+        with open(modules_path, "r", encoding="utf-8") as f:
+            modules = json.load(f)
+        transformer = next((m for m in modules if m["type"].endswith(".Transformer")), None)
+        if transformer is not None:
+            path = os.path.join(model_dir, transformer["path"])
+    options = {}
+    config_path = os.path.join(path, "sentence_bert_config.json")
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            options = json.load(f)
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    max_seq_length = options.get("max_seq_length")
+    if max_seq_length is None:
+        # 与 sentence-transformers 相同：取模型位置编码长度与分词器上限中较小者
+        config = AutoConfig.from_pretrained(path)
+        max_seq_length = min(getattr(config, "max_position_embeddings", tokenizer.model_max_length),
+                             tokenizer.model_max_length)
+    return tokenizer, max_seq_length, bool(options.get("do_lower_case", False))
+
+
+# 编码进程中的模型（onnx 后端时另有 ONNX Runtime 会话）
+_pool_model = None
+_pool_onnx = None
+
+
+def _init_pool_worker(model_name, threads, onnx_options=None):
+    global _pool_model, _pool_onnx
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 已经执行过并行计算时不能再修改
+        pass
+    _pool_model = SentenceTransformer(model_name, device="cpu")
+    if onnx_options is not None:
+        # 父进程已完成导出，这里只加载缓存的 ONNX 模型
+        _pool_onnx = OnnxEncoder(_pool_model, model_name, threads=threads, **onnx_options)
+    else:
+        register_metrics_hooks(_pool_model)
+
+
+def _pool_ready():
+    return True
+
+
+def _pool_embedding_dim():
+    dim = getattr(_pool_model, "get_embedding_dimension", None) or _pool_model.get_sentence_embedding_dimension
+    return dim()
+
+
+def _pool_encode_batch(texts, normalize_embeddings):
+    if _pool_onnx is not None:
+        embeddings = _pool_onnx.encode_batch(texts)
+        if normalize_embeddings:
+            embeddings = l2_normalize(embeddings)
+    else:
+        embeddings = _pool_model.encode(texts, batch_size=len(texts), show_progress_bar=False,
+                                        normalize_embeddings=normalize_embeddings)
+    return embeddings, metrics.drain()
+
+
+class EncodePool:
+    """
+    多进程 CPU 编码池：批次分发给各进程编码，再按原始下标拼回
+
+    使用 spawn 启动进程（fork 已初始化 OpenMP 线程池的 torch 进程可能死锁），因此调用方的主模块需要
+    if __name__ == "__main__" 保护。模型在各进程启动时加载一次，构造时即开始启动，与其他工作重叠。
+    onnx_options 不为 None 时各进程改用 ONNX Runtime 编码（OnnxEncoder 的 cache_dir/quantize 参数）。
+    """
+
+    def __init__(self, model_name: str, workers: int, threads_per_worker: Optional[int] = None,
+                 onnx_options: Optional[dict] = None):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        print(f"Starting {workers} encode processes with {self.threads_per_worker} threads each...")
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_pool_worker,
+                                            initargs=(model_name, self.threads_per_worker, onnx_options))
+        for _ in range(workers):
+            self.executor.submit(_pool_ready)
+        self.dim = None
+
+    def embedding_dim(self) -> int:
+        """
+        模型输出维度（由编码进程查询，父进程不加载模型）
+        """
+        if self.dim is None:
+            self.dim = self.executor.submit(_pool_embedding_dim).result()
+        return self.dim
+
+    def encode(self, texts: List[str], batches: List[List[int]], normalize_embeddings: bool,
+               show_progress_bar: bool = True) -> np.ndarray:
+        """
+        按 batches（texts 的下标列表）分发编码，返回与 texts 顺序一致的向量
+        """
+        futures = [self.executor.submit(_pool_encode_batch, [texts[i] for i in batch], normalize_embeddings)
+                   for batch in batches]
+        embeddings = None
+        for batch, future in tqdm(zip(batches, futures), total=len(batches), desc="Batches",
+                                  disable=not show_progress_bar):
+            batch_embeddings, snapshot = future.result()
+            metrics.merge(snapshot)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[batch] = batch_embeddings
+        return embeddings
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
 class EmbeddingClient:
-    def __init__(self, model_name: str = "fangxq/XYZ-embedding", device: str = "cpu", truncate_dim: Optional[int] = None):
-        """嵌入客户端模型"""
+    def __init__(self, model_name: str = "fangxq/XYZ-embedding", device: str = "cpu", truncate_dim: Optional[int] = None,
+                 cache_path: Optional[str] = None, cache_max_bytes: Optional[int] = None, workers: int = 1,
+                 threads_per_worker: Optional[int] = None, backend: str = "torch", onnx_quantize: bool = False,
+                 onnx_dir: str = DEFAULT_ONNX_DIR):
+        """
+        嵌入客户端模型
+
+        workers > 1 时（仅 CPU）启动 workers 个编码进程，每个进程加载自己的模型副本并把 torch 线程数固定为
+        threads_per_worker（默认 CPU 核数 / workers），当前进程只加载分词器用于组批；encode() 的接口和输出与
+        单进程相同。workers == 1 时 threads_per_worker 设置当前进程的 torch 线程数
+
+        backend="onnx" 时用 ONNX Runtime 在 CPU 上编码：首次使用时导出到 onnx_dir 并缓存，onnx_quantize=True
+        时使用动态 int8 量化的模型；MRL 截断与归一化和 torch 后端相同
+
+        模型（及编码进程池）在第一次缓存未命中时才加载，也可以调用 load_model() 提前加载
+        """
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unsupported backend: {backend}")
+
+        self.model_name = model_name
+        self.device = device
+        self.truncate_dim = truncate_dim
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        # int8 模型的输出与 fp32 略有差异，缓存键中区分开
+        self.cache_model = f"{model_name}#onnx-int8" if backend == "onnx" and onnx_quantize else model_name
+        # 可选的持久化向量缓存，只有未命中的文本才会送入模型
+        self.cache = EmbeddingCache(cache_path, max_bytes=cache_max_bytes) if cache_path else None
+        self.onnx_options = {"cache_dir": onnx_dir, "quantize": onnx_quantize} if backend == "onnx" else None
+        # 模型在第一次缓存未命中时才加载，全部命中的重跑不必付出加载模型的开销
+        self.model = None
+        # CPU 上可选的多进程编码池，每个进程持有一份模型
+        self.pool = None
+        self.onnx = None
+        # 组批用的分词器：单进程时为模型自带的分词器，编码池模式下单独加载
+        self.tokenizer = None
+        self.max_seq_length = None
+        self.do_lower_case = False
+        # 未加载模型时由缓存命中的向量得到输出维度
+        self.cached_dim = None
+
+    def load_model(self):
+        """
+        加载模型（或启动编码进程池）以及 ONNX 会话，已加载时什么也不做；encode 在第一次缓存未命中时自动调用
+        """
+        if self.model is not None or self.pool is not None:
+            return
+        import torch
+        from sentence_transformers import SentenceTransformer
+
         #使用GPU
         if torch.cuda.is_available():
-            device = "cuda:0"
-        
-        print(f"Loading model: {model_name}...")
-        self.model = SentenceTransformer(model_name, device=device)
-        self.truncate_dim = truncate_dim
-        
-    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True) -> np.ndarray:
+            self.device = "cuda:0"
+        if self.workers > 1 and torch.device(self.device).type == "cpu":
+            if self.onnx_options is not None:
+                # 先在当前进程导出，避免各编码进程重复导出；导出后模型随即释放
+                export_onnx(SentenceTransformer(self.model_name, device="cpu"), self.model_name, **self.onnx_options)
+            # 父进程只需要分词器（组批）和输出维度（由编码进程查询），不再持有一份完整模型
+            self.tokenizer, self.max_seq_length, self.do_lower_case = load_tokenizer(self.model_name)
+            self.pool = EncodePool(self.model_name, self.workers, self.threads_per_worker, self.onnx_options)
+            return
+        if self.workers > 1:
+            print("Encode pool is CPU-only; encoding on the GPU in this process instead.")
+        elif self.threads_per_worker:
+            torch.set_num_threads(self.threads_per_worker)
+        print(f"Loading model: {self.model_name}...")
+        self.model = SentenceTransformer(self.model_name, device=self.device)
+        self.tokenizer, self.max_seq_length = self.model.tokenizer, self.model.max_seq_length
+        self.do_lower_case = getattr(self.model[0], "do_lower_case", False)
+        register_metrics_hooks(self.model)
+        if self.onnx_options is not None:
+            self.onnx = OnnxEncoder(self.model, self.model_name, threads=self.threads_per_worker, **self.onnx_options)
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True,
+               max_batch_tokens: Optional[int] = None, show_progress_bar: bool = True) -> np.ndarray:
         """
         批量编码文本
+
+        max_batch_tokens 不为 None 时，按分词长度排序并以 token 预算代替固定 batch_size 组批，
+        输出顺序仍与输入一致
         """
+        if self.cache is None:
+            return self._encode_model(texts, batch_size, normalize_embeddings, max_batch_tokens, show_progress_bar)
+
+        keys = [cache_key(self.cache_model, self.truncate_dim, normalize_embeddings, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # 只编码未命中的文本（相同文本只编码一次）
+        miss_index = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in miss_index:
+                miss_index[key] = text
+        if miss_index:
+            miss_keys = list(miss_index)
+            miss_vectors = self._encode_model(list(miss_index.values()), batch_size, normalize_embeddings,
+                                              max_batch_tokens, show_progress_bar)
+            self.cache.put_many(miss_keys, miss_vectors)
+            cached.update(zip(miss_keys, np.asarray(miss_vectors, dtype=np.float32)))
+        if cached:
+            self.cached_dim = len(next(iter(cached.values())))
+
+        if not texts:
+            return np.empty((0, self.embedding_dim()), dtype=np.float32)
+        return np.stack([cached[key] for key in keys])
+
+    def _encode_model(self, texts: List[str], batch_size: int, normalize_embeddings: bool,
+                      max_batch_tokens: Optional[int] = None, show_progress_bar: bool = True) -> np.ndarray:
+        """
+        调用模型编码（含 MRL 截断与归一化）
+        """
+        if not texts:
+            # 各后端在没有批次时都不产生输出，这里直接返回形状正确的空矩阵
+            return np.empty((0, self.embedding_dim()), dtype=np.float32)
         # 如果设置了截断维度，我们需要特殊处理：
         # 1. encode(normalize_embeddings=False)
         # 2. 截断到 truncate_dim 维
@@ -29,74 +322,429 @@ class EmbeddingClient:
         
         if self.truncate_dim is not None:
              # 获取原始向量
-            embeddings = self.model.encode(
+            embeddings = self._model_encode(
                 texts, 
                 batch_size=batch_size, 
-                show_progress_bar=True, 
-                normalize_embeddings=False #先不进行归一化，后续截断后进行
+                normalize_embeddings=False, #先不进行归一化，后续截断后进行
+                max_batch_tokens=max_batch_tokens,
+                show_progress_bar=show_progress_bar
             )
             # 截断到指定维度
             embeddings = embeddings[:, :self.truncate_dim]
             # 归一化
             if normalize_embeddings:
-                embeddings = normalize(embeddings)
+                embeddings = l2_normalize(embeddings)
             return embeddings
         else:
             # 普通模型直接调用
+            return self._model_encode(
+                texts, 
+                batch_size=batch_size, 
+                normalize_embeddings=normalize_embeddings,
+                max_batch_tokens=max_batch_tokens,
+                show_progress_bar=show_progress_bar
+            )
+
+    def _model_encode(self, texts: List[str], batch_size: int, normalize_embeddings: bool,
+                      max_batch_tokens: Optional[int] = None, show_progress_bar: bool = True) -> np.ndarray:
+        """
+        调用 SentenceTransformer 编码；设置 max_batch_tokens 时按 token 预算组批
+        """
+        self.load_model()
+        if self.pool is not None:
+            if max_batch_tokens is None:
+                batches = self.length_sorted_batches(texts, batch_size)
+            else:
+                batches = self.token_budget_batches(texts, max_batch_tokens)
+            return self.pool.encode(texts, batches, normalize_embeddings, show_progress_bar)
+
+        if self.onnx is not None:
+            if max_batch_tokens is None:
+                batches = self.length_sorted_batches(texts, batch_size)
+            else:
+                batches = self.token_budget_batches(texts, max_batch_tokens)
+            embeddings = self.onnx.encode(texts, batches=tqdm(batches, desc="Batches", disable=not show_progress_bar))
+            return l2_normalize(embeddings) if normalize_embeddings else embeddings
+
+        if max_batch_tokens is None:
             return self.model.encode(
                 texts, 
                 batch_size=batch_size, 
-                show_progress_bar=True, 
+                show_progress_bar=show_progress_bar, 
+                normalize_embeddings=normalize_embeddings
+            )
+
+        batches = self.token_budget_batches(texts, max_batch_tokens)
+        embeddings = None
+        for batch in tqdm(batches, desc="Batches", disable=not show_progress_bar):
+            batch_embeddings = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False,
                 normalize_embeddings=normalize_embeddings
             )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            # 按原始下标写回，保证输出顺序与输入一致
+            embeddings[batch] = batch_embeddings
+        return embeddings
+
+    @staticmethod
+    def length_sorted_batches(texts: List[str], batch_size: int) -> List[List[int]]:
+        """
+        与 SentenceTransformer.encode 相同，按字符长度降序排列后每 batch_size 条组成一批
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """
+        计算每条文本分词后的长度（按模型最大序列长度截断）
+        """
+        self.load_model()
+        if self.do_lower_case:
+            texts = [text.lower() for text in texts]
+        encoded = self.tokenizer(
+            texts,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_attention_mask=False,
+            return_token_type_ids=False
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def token_budget_batches(self, texts: List[str], max_batch_tokens: int) -> List[List[int]]:
+        """
+        按分词长度排序后组批，每批的 (条数 × 批内最大长度) 不超过 max_batch_tokens，
+        使同一批内长度接近，减少 padding
+        """
+        lengths = self.token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        batch = []
+        for i in order:
+            # 降序排列，批内最大长度即第一条的长度
+            if batch and (len(batch) + 1) * lengths[batch[0]] > max_batch_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
 
     def encode_single(self, text: str) -> np.ndarray:
         """
         编码单个文本
         """
-        return self.encode([text])[0]
+        return self.encode([text], show_progress_bar=False)[0]
 
-def process_file(input_path: str, output_path: str, model_name: str, batch_size: int = 32, truncate_dim: Optional[int] = None):
-    client = EmbeddingClient(model_name=model_name, truncate_dim=truncate_dim)
-    
-    # 读取所有数据
-    data_list = []
-    texts = []
-    print(f"Reading from {input_path}...")
-    with open(input_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if not line.strip():
-                continue
-            item = json.loads(line)
-            data_list.append(item)
-            texts.append(item['text'])
-            
-    if not texts:
+    def embedding_dim(self) -> int:
+        """
+        输出向量的维度（模型维度，设置 truncate_dim 时取两者较小值）；模型尚未加载时取缓存命中的向量维度
+        """
+        if self.model is None and self.pool is None and self.cached_dim is not None:
+            return self.cached_dim
+        self.load_model()
+        if self.pool is not None:
+            dim = self.pool.embedding_dim()
+            return min(dim, self.truncate_dim) if self.truncate_dim else dim
+        # 新版 sentence-transformers 将 get_sentence_embedding_dimension 更名为 get_embedding_dimension
+        dim = getattr(self.model, "get_embedding_dimension", None) or self.model.get_sentence_embedding_dimension
+        dim = dim()
+        return min(dim, self.truncate_dim) if self.truncate_dim else dim
+
+    def close(self):
+        """
+        关闭编码进程池（未启用时什么也不做）
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def encode_prefixes(self, texts: List[str], dims: List[int], **kwargs) -> dict:
+        """
+        一次编码得到多个 MRL 分辨率：返回 {dim: 前 dim 维重新归一化后的向量}，
+        不超过 truncate_dim 的全维向量也包含在内
+        """
+        embeddings = self.encode(texts, **kwargs)
+        return {dim: embeddings if dim >= embeddings.shape[1] else mrl_prefix(embeddings, dim) for dim in dims}
+
+def _read_window(f, window: int, skip_sources, end_offset: Optional[int] = None, shard=None):
+    """
+    从以二进制方式打开的 JSONL 中读取至多 window 条待编码记录，返回 (items, eof)；
+    读到 end_offset 即视为结束，shard 不为 None 时只保留按源文件哈希分到该分片的记录
+    """
+    items = []
+    while len(items) < window:
+        if end_offset is not None and f.tell() >= end_offset:
+            return items, True
+        line = f.readline()
+        if not line:
+            return items, True
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if record_source(item) in skip_sources:
+            continue
+        if shard is not None and hash_shard(record_source(item), shard[1]) != shard[0]:
+            continue
+        items.append(item)
+    return items, False
+
+
+def _load_checkpoint(checkpoint_path: str, input_path: str, shard=None) -> Optional[dict]:
+    if not os.path.exists(checkpoint_path):
+        print("No checkpoint found, starting from the beginning.")
+        return None
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if (state["input"] != str(input_path) or state["input_size"] != os.path.getsize(input_path)
+            or state.get("shard") != shard):
+        print("Checkpoint does not match the input file, starting from the beginning.")
+        return None
+    return state
+
+
+def _checkpoint_outputs_ok(state: dict, write_path, vector_write_path, output_format: str) -> bool:
+    """
+    检查点记录的输出是否都已完整落盘：JSONL 至少有 output_offset 字节，npy 至少有 rows 行向量的数据
+    """
+    if not os.path.exists(write_path) or os.path.getsize(write_path) < state["output_offset"]:
+        return False
+    if output_format != "npy" or not state["rows"]:
+        return True
+    if state["dim"] is None or not os.path.exists(vector_write_path):
+        return False
+    return os.path.getsize(vector_write_path) >= NPY_HEADER_LEN + state["rows"] * state["dim"] * 4
+
+
+def _save_checkpoint(checkpoint_path: str, state: dict):
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def process_file(input_path: str, output_path: str, model_name: str, batch_size: int = 32, truncate_dim: Optional[int] = None,
+                 manifest_path: Optional[str] = None, cache_path: Optional[str] = None, cache_max_bytes: Optional[int] = None,
+                 max_batch_tokens: Optional[int] = None, output_format: str = "jsonl", window: int = 4096,
+                 resume: bool = False, quantize: Optional[str] = None, prefix_dims: Optional[List[int]] = None,
+                 workers: int = 1, threads_per_worker: Optional[int] = None, backend: str = "torch",
+                 onnx_quantize: bool = False, onnx_dir: str = DEFAULT_ONNX_DIR, server: Optional[str] = None,
+                 shard=None, shard_by: str = "contiguous"):
+    """
+    按窗口流式编码：每次读取 window 条分块，编码后立即追加写出，并记录检查点
+    （输入字节偏移、输出字节偏移、已写入向量行数），内存占用与语料规模无关。
+    resume=True 时从上一次中断处的检查点继续。
+
+    output_format:
+        jsonl - 向量以浮点数列表写入每行 JSON
+        npy   - JSONL 只保存分块元数据，向量按行顺序写入同名 .npy 文件（连续 float32）
+    quantize 为 int8/binary 时（要求 npy 格式），完成后另外写出量化向量及校准参数
+    prefix_dims 不为空时（要求 npy 格式），由全维向量另外写出各前缀维度的向量文件 <output>.d<dim>.npy
+    workers > 1 时在 CPU 上使用多进程编码池，backend="onnx" 时用 ONNX Runtime 编码（见 EmbeddingClient）
+    server 不为 None 时改由常驻嵌入服务编码（见 embedding_server.py），模型相关参数以服务端为准
+    shard=(i, N) 时只编码输入的第 i 个分片，输出写入 <output>.shard-i-of-N.jsonl（见 jsonl_index.py）
+    """
+    if (quantize or prefix_dims) and output_format != "npy":
+        raise ValueError("Quantized and prefix outputs require output_format='npy'")
+    start_offset, end_offset, hash_filter = 0, None, None
+    if shard is not None:
+        # 量化校准与前缀向量需要全部向量，合并分片后再生成（jsonl_index.py merge --quantize/--prefix_dims）
+        if manifest_path or quantize or prefix_dims:
+            raise ValueError("manifest, quantize and prefix_dims cannot be combined with shard")
+        output_path = shard_path(output_path, shard)
+        if shard_by == "hash":
+            hash_filter = shard
+        else:
+            start_offset, end_offset = shard_byte_range(input_path, shard)
+        shard = [shard[0], shard[1], shard_by]
+    vector_path = vector_path_for(output_path)
+    manifest = IngestManifest(manifest_path) if manifest_path else None
+    # 增量模式先写入临时文件，全部完成后再替换
+    write_path = f"{output_path}.tmp" if manifest is not None else output_path
+    vector_write_path = vector_path_for(write_path)
+    checkpoint_path = f"{output_path}.ckpt"
+
+    writer = None
+    state = _load_checkpoint(checkpoint_path, input_path, shard) if resume else None
+    if state is not None and not _checkpoint_outputs_ok(state, write_path, vector_write_path, output_format):
+        # 例如向量文件被删除或未刷盘：在其基础上续跑会错位或补出全零向量
+        print("Checkpoint output is missing or incomplete, starting from the beginning.")
+        state = None
+    if state is not None:
+        print(f"Resuming from input offset {state['input_offset']} ({state['rows']} vectors written)...")
+        with open(write_path, 'r+b') as f:
+            f.truncate(state["output_offset"])
+        if output_format == "npy" and state["dim"] is not None:
+            writer = NpyVectorWriter(vector_write_path, state["dim"], append=True, rows=state["rows"])
+    else:
+        # 增量模式：沿用未变更文件的向量，只编码其余文件的分块
+        # 上一次输出格式与本次不同时无法沿用，全部重新编码
+        kept = set()
+        kept_rows = []
+        with open(write_path, 'w', encoding='utf-8') as f:
+            if manifest is not None and vector_path.exists() == (output_format == "npy"):
+                kept = carry_forward(manifest, "embedded", output_path, f, rows=kept_rows)
+                print(f"增量模式: 沿用 {len(kept)} 个未变更文件的向量")
+        if output_format == "npy" and kept_rows:
+            old_vectors = load_vectors(vector_path)
+            writer = NpyVectorWriter(vector_write_path, old_vectors.shape[1])
+            writer.write(old_vectors[kept_rows])
+        state = {
+            "input": str(input_path),
+            "input_size": os.path.getsize(input_path),
+            "input_offset": start_offset,
+            "output_offset": os.path.getsize(write_path),
+            "rows": len(kept_rows),
+            "dim": writer.dim if writer is not None else None,
+            "kept": sorted(kept),
+            "embedded": [],
+            "shard": shard,
+        }
+
+    kept = set(state["kept"])
+    embedded = set(state["embedded"])
+    client = None
+    print(f"Reading from {input_path}, writing to {output_path}...")
+    with open(input_path, 'rb') as f_in, open(write_path, 'ab') as out:
+        f_in.seek(state["input_offset"])
+        eof = False
+        while not eof:
+            items, eof = _read_window(f_in, window, kept, end_offset, hash_filter)
+            if items:
+                if client is None and server:
+                    client = RemoteEmbeddingClient(server)
+                elif client is None:
+                    client = EmbeddingClient(model_name=model_name, truncate_dim=truncate_dim,
+                                             cache_path=cache_path, cache_max_bytes=cache_max_bytes,
+                                             workers=workers, threads_per_worker=threads_per_worker,
+                                             backend=backend, onnx_quantize=onnx_quantize, onnx_dir=onnx_dir)
+
+                # 批量生成向量
+                print(f"Encoding {len(items)} chunks...")
+                with metrics.timer("encode_window_seconds"):
+                    embeddings = client.encode([item['text'] for item in items], batch_size=batch_size,
+                                               max_batch_tokens=max_batch_tokens)
+                metrics.inc("encode_chunks_total", len(items))
+
+                # 写入结果
+                with metrics.timer("encode_write_seconds", format=output_format):
+                    if output_format == "npy":
+                        if writer is None:
+                            writer = NpyVectorWriter(vector_write_path, embeddings.shape[1])
+                        writer.write(embeddings)
+                    for item, vector in zip(items, embeddings):
+                        if output_format != "npy":
+                            # 将 numpy array 转换为 list 以便序列化
+                            item['vector'] = vector.tolist()
+                        out.write((json.dumps(item, ensure_ascii=False) + "\n").encode('utf-8'))
+                        embedded.add(record_source(item))
+                state["rows"] += len(items)
+
+            # 先落盘输出，再记录检查点
+            out.flush()
+            os.fsync(out.fileno())
+            if writer is not None:
+                writer.flush()
+                state["dim"] = writer.dim
+            state["input_offset"] = f_in.tell()
+            state["output_offset"] = out.tell()
+            state["embedded"] = sorted(embedded)
+            _save_checkpoint(checkpoint_path, state)
+
+    if writer is not None:
+        writer.close()
+    elif vector_path.exists():
+        # 删除旧格式遗留的向量文件，避免导入时误用
+        os.remove(vector_path)
+
+    if client is not None:
+        client.close()
+    if client is not None and client.cache is not None:
+        stats = client.cache.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.1%}, {stats['size_bytes'] / 1024 / 1024:.1f} MB)")
+    if not embedded and not kept:
         print("No data found.")
-        return
 
-    # 批量生成向量
-    print(f"Encoding {len(texts)} chunks...")
-    embeddings = client.encode(texts, batch_size=batch_size)
-    
-    # 写入结果
-    print(f"Writing to {output_path}...")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for item, vector in zip(data_list, embeddings):
-            # 将 numpy array 转换为 list 以便序列化
-            item['vector'] = vector.tolist()
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
-            
+    if manifest is not None:
+        os.replace(write_path, output_path)
+        if writer is not None:
+            os.replace(vector_write_path, vector_path)
+        # 没有分块的源文件同样记为已编码
+        for source in embedded.union(manifest.empty_sources("embedded", kept | embedded)):
+            manifest.mark(source, "embedded")
+        manifest.save()
+    os.remove(checkpoint_path)
+    if quantize and vector_path.exists():
+        quantize_file(output_path, quantize)
+    if prefix_dims and vector_path.exists():
+        write_prefix_vectors(output_path, prefix_dims)
+
     print("Done!")
 
-if __name__ == "__main__":
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Embedding Client")
     parser.add_argument("--input", type=str, default=r"data/output/chunks.jsonl", help="Path to input JSONL file")
     parser.add_argument("--output", type=str, default=r"data/output/vectorized.jsonl", help="Path to output JSONL file")
     parser.add_argument("--model", type=str, default="fangxq/XYZ-embedding", help="Model name")
     parser.add_argument("--batch_size", type=int, default=32, help="Batch size for encoding")
+    parser.add_argument("--max_batch_tokens", type=int, default=None,
+                        help="Build length-sorted batches under this token budget instead of a fixed batch size")
     parser.add_argument("--truncate_dim", type=int, default=768, help="Dimension to truncate embeddings to")
+    parser.add_argument("--manifest", type=str, default=None, help="Path to ingest manifest; enables incremental embedding")
+    parser.add_argument("--cache", type=str, default=None, help="Path to SQLite embedding cache")
+    parser.add_argument("--cache_max_mb", type=int, default=None, help="Evict least recently used cache entries above this size")
+    parser.add_argument("--format", type=str, default="jsonl", choices=["jsonl", "npy"],
+                        help="jsonl: vectors inline as float lists; npy: metadata JSONL plus a float32 .npy sidecar")
+    parser.add_argument("--window", type=int, default=4096, help="Number of chunks to read, encode and write per step")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted run from its checkpoint")
+    parser.add_argument("--quantize", type=str, default=None, choices=["int8", "binary"],
+                        help="Also write int8 or binary quantized vectors (requires --format npy)")
+    parser.add_argument("--prefix_dims", type=int, nargs="+", default=None,
+                        help="Also write renormalized MRL prefixes of these dims, e.g. 128 256 (requires --format npy)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Encode in this many CPU processes, each with its own model copy (1 = in-process)")
+    parser.add_argument("--threads_per_worker", type=int, default=None,
+                        help="Torch (or ONNX Runtime) threads per encode process (default: CPU cores / workers)")
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx"],
+                        help="onnx: export the model once and encode with ONNX Runtime on the CPU")
+    parser.add_argument("--onnx_quantize", action="store_true", help="Use a dynamically int8-quantized ONNX model")
+    parser.add_argument("--onnx_dir", type=str, default=DEFAULT_ONNX_DIR, help="Directory for exported ONNX models")
+    parser.add_argument("--server", type=str, default=None,
+                        help="Encode with a running embedding server (http://host:port or unix:/path) instead of loading the model")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only encode shard i of N of the input (i/N); writes <output>.shard-i-of-N.jsonl")
+    parser.add_argument("--shard_by", type=str, default="contiguous", choices=SHARD_MODES,
+                        help="contiguous: byte-balanced ranges aligned to source boundaries; hash: by source path")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="Write batch latency and token throughput as Prometheus text (.prom) or JSON (.json)")
+    parser.add_argument("--profile", type=str, default=None, choices=["cprofile", "pyinstrument"],
+                        help="Profile the encode stage")
+    parser.add_argument("--profile_dir", type=str, default="data/output/profiles")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if (args.quantize or args.prefix_dims) and args.format != "npy":
+        parser.error("--quantize and --prefix_dims require --format npy")
+    if args.shard is not None and (args.manifest or args.quantize or args.prefix_dims):
+        parser.error("--manifest, --quantize and --prefix_dims cannot be combined with --shard; "
+                     "pass --quantize/--prefix_dims to 'jsonl_index.py merge' instead")
+    if args.profile:
+        metrics.configure_profiling(["encode"], args.profile, args.profile_dir)
     
-    process_file(args.input, args.output, args.model, args.batch_size, args.truncate_dim)
+    cache_max_bytes = args.cache_max_mb * 1024 * 1024 if args.cache_max_mb else None
+    with metrics.stage("encode"):
+        process_file(args.input, args.output, args.model, args.batch_size, args.truncate_dim, manifest_path=args.manifest,
+                     cache_path=args.cache, cache_max_bytes=cache_max_bytes, max_batch_tokens=args.max_batch_tokens, output_format=args.format,
+                     window=args.window, resume=args.resume, quantize=args.quantize,
+                     prefix_dims=args.prefix_dims, workers=args.workers,
+                     threads_per_worker=args.threads_per_worker, backend=args.backend,
+                     onnx_quantize=args.onnx_quantize, onnx_dir=args.onnx_dir, server=args.server,
+                     shard=args.shard, shard_by=args.shard_by)
+    if args.metrics:
+        metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""
+常驻嵌入服务：模型只加载一次并保持预热，通过 localhost HTTP 或 Unix socket 提供编码接口
+
+并发到达的请求在后台线程中合并成动态微批：收到第一个请求后至多等待 --max_wait_ms，
+或累计 token 数达到 --max_batch_tokens 时立即编码，再把结果按请求拆分返回。
+
+    POST /embed    {"texts": [...], "normalize": true} -> float32 向量（Accept: application/octet-stream 时为
+                   原始字节，形状在 X-Shape 头中；否则为 JSON 列表）
+    GET  /info     模型名、截断维度、向量维度
+    GET  /stats    请求数、微批数、队列深度、排队与请求延迟分位数
+    GET  /metrics  Prometheus 文本格式的指标
+    GET  /health
+
+python Scripts/embedding_server.py --model fangxq/XYZ-embedding --truncate_dim 768 --port 8765
+python Scripts/embedding_server.py --socket /tmp/embedding.sock --backend onnx
+
+RemoteEmbeddingClient 提供与 EmbeddingClient 相同的 encode 接口，各脚本的 --server 参数即使用它，
+不再在每次运行时加载模型。本模块在导入时不依赖 torch，模型只在启动服务时加载。
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+from tqdm import tqdm
+
+try:
+    from . import metrics
+    from .vector_store import mrl_prefix
+except ImportError:
+    import metrics
+    from vector_store import mrl_prefix
+
+DEFAULT_PORT = 8765
+# 客户端单个请求的最大文本条数，过大的输入拆成多个请求
+DEFAULT_REQUEST_SIZE = 512
+
+
+class MicroBatcher:
+    """
+    把并发提交的编码请求合并成微批
+
+    submit() 返回 Future；后台线程取出第一个请求后，在 max_wait 秒内继续收集请求，
+    直到累计 token 数达到 max_batch_tokens，然后按 normalize 参数分组调用 client.encode。
+    单个请求本身超过 max_batch_tokens 时单独成批，由 client.encode 按 token 预算再拆分。
+    """
+
+    def __init__(self, client, max_wait: float = 0.005, max_batch_tokens: int = 16384, batch_size: int = 32,
+                 latency_window: int = 10000):
+        self.client = client
+        self.max_wait = max_wait
+        self.max_batch_tokens = max_batch_tokens
+        self.batch_size = batch_size
+        self.latencies = deque(maxlen=latency_window)
+        self.queue_waits = deque(maxlen=latency_window)
+        self.stats = {"requests": 0, "texts": 0, "tokens": 0, "batches": 0, "errors": 0,
+                      "pending_requests": 0, "pending_texts": 0}
+        self.stats_lock = threading.Lock()
+        self._requests = queue.Queue()
+        # 超出当前微批 token 预算的请求留到下一批
+        self._carry = None
+        self._worker = threading.Thread(target=self._batch_loop, daemon=True)
+        self._worker.start()
+
+    def submit(self, texts: List[str], normalize_embeddings: bool = True) -> Future:
+        future = Future()
+        with self.stats_lock:
+            self.stats["pending_requests"] += 1
+            self.stats["pending_texts"] += len(texts)
+        self._requests.put((texts, normalize_embeddings, time.perf_counter(), future))
+        return future
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True) -> np.ndarray:
+        return self.submit(texts, normalize_embeddings).result()
+
+    def latency_stats(self) -> Dict[str, float]:
+        # 微批线程会并发追加，先在锁内复制，避免迭代时 deque 被修改
+        with self.stats_lock:
+            stats = dict(self.stats)
+            latencies = list(self.latencies)
+            queue_waits = list(self.queue_waits)
+        latencies = np.asarray(latencies) * 1000
+        queue_waits = np.asarray(queue_waits) * 1000
+        if stats["batches"]:
+            stats["texts_per_batch"] = stats["texts"] / stats["batches"]
+        if len(latencies):
+            stats.update(p50_ms=float(np.percentile(latencies, 50)), p99_ms=float(np.percentile(latencies, 99)),
+                         queue_wait_p50_ms=float(np.percentile(queue_waits, 50)),
+                         queue_wait_p99_ms=float(np.percentile(queue_waits, 99)))
+        return stats
+
+    def _fail(self, requests, error, pending=False):
+        """
+        以 error 结束尚未完成的请求；pending=True 时这些请求还计在排队数中
+        """
+        requests = [request for request in requests if not request[3].done()]
+        with self.stats_lock:
+            self.stats["errors"] += len(requests)
+            if pending:
+                self.stats["pending_requests"] -= len(requests)
+                self.stats["pending_texts"] -= sum(len(request[0]) for request in requests)
+        for request in requests:
+            request[3].set_exception(error)
+
+    def _with_tokens(self, request):
+        """
+        附上请求的 token 数；分词失败（如 texts 不是字符串列表）时直接以该错误结束这个请求，返回 None
+        """
+        # 分词器不保证线程安全，token 数只在微批线程中计算
+        try:
+            return request + (sum(self.client.token_lengths(request[0])),)
+        except Exception as e:
+            self._fail([request], e, pending=True)
+            return None
+
+    def _next_batch(self):
+        """
+        收集一个微批：第一个请求到达后至多再等 max_wait 秒，累计 token 数不超过 max_batch_tokens
+        """
+        first, self._carry = self._carry, None
+        while first is None:
+            first = self._with_tokens(self._requests.get())
+        requests = [first]
+        tokens = first[4]
+        deadline = time.perf_counter() + self.max_wait
+        while tokens < self.max_batch_tokens:
+            # 已在排队的请求直接并入，max_wait 只限制等待新请求的时间
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            request = self._with_tokens(request)
+            if request is None:
+                continue
+            if tokens + request[4] > self.max_batch_tokens:
+                self._carry = request
+                break
+            requests.append(request)
+            tokens += request[4]
+        return requests
+
+    def _batch_loop(self):
+        while True:
+            requests = []
+            try:
+                requests = self._next_batch()
+                self._run_batch(requests)
+            except Exception as e:
+                # 后台线程一旦退出，排队中和之后的请求都会永远等待；意外错误只结束本批尚未完成的请求
+                self._fail(requests, e)
+
+    def _run_batch(self, requests):
+        """
+        按 normalize 参数分组编码一个微批，并把结果按请求拆分返回
+        """
+        start = time.perf_counter()
+        texts = sum(len(r[0]) for r in requests)
+        with self.stats_lock:
+            metrics.observe("server_queue_depth", self.stats["pending_requests"])
+            self.stats["pending_requests"] -= len(requests)
+            self.stats["pending_texts"] -= texts
+        metrics.observe("server_microbatch_requests", len(requests))
+        metrics.observe("server_microbatch_texts", texts)
+
+        groups = {}
+        for request in requests:
+            groups.setdefault(request[1], []).append(request)
+        for normalize_embeddings, items in groups.items():
+            batch_texts = [text for item in items for text in item[0]]
+            try:
+                with metrics.timer("server_encode_seconds"):
+                    embeddings = self.client.encode(batch_texts, batch_size=self.batch_size,
+                                                    normalize_embeddings=normalize_embeddings,
+                                                    max_batch_tokens=self.max_batch_tokens,
+                                                    show_progress_bar=False)
+            except Exception as e:
+                self._fail(items, e)
+                continue
+            offset = 0
+            for item in items:
+                item[3].set_result(np.asarray(embeddings[offset:offset + len(item[0])], dtype=np.float32))
+                offset += len(item[0])
+
+        end = time.perf_counter()
+        for request in requests:
+            metrics.observe("server_queue_wait_seconds", start - request[2])
+            metrics.observe("server_request_seconds", end - request[2])
+        with self.stats_lock:
+            self.queue_waits.extend(start - request[2] for request in requests)
+            self.latencies.extend(end - request[2] for request in requests)
+            self.stats["requests"] += len(requests)
+            self.stats["texts"] += texts
+            self.stats["tokens"] += sum(r[4] for r in requests)
+            self.stats["batches"] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket 的 client_address 为空字符串
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body: bytes, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/info":
+            self._send_json(200, self.server.info)
+        elif path == "/stats":
+            self._send_json(200, self.server.batcher.latency_stats())
+        elif path == "/metrics":
+            self._send(200, metrics.METRICS.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path != "/embed":
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            texts = request["texts"]
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("'texts' must be a list of strings")
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+            return
+        try:
+            if texts:
+                embeddings = self.server.batcher.encode(texts, bool(request.get("normalize", True)))
+            else:
+                embeddings = np.empty((0, self.server.info["dim"]), dtype=np.float32)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        if "application/octet-stream" in self.headers.get("Accept", ""):
+            shape = ",".join(str(n) for n in embeddings.shape)
+            self._send(200, np.ascontiguousarray(embeddings, dtype="<f4").tobytes(), "application/octet-stream",
+                       {"X-Shape": shape})
+        else:
+            self._send_json(200, {"embeddings": embeddings.tolist(), "dim": int(embeddings.shape[1])})
+
+
+# 默认的 listen 队列只有 5，并发客户端较多时连接会被拒绝
+LISTEN_BACKLOG = 128
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+def make_server(batcher: MicroBatcher, info: dict, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                socket_path: Optional[str] = None, verbose: bool = False):
+    """
+    创建 HTTP 服务（socket_path 不为 None 时监听 Unix socket）
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = _TCPHTTPServer((host, port), _Handler)
+    server.batcher = batcher
+    server.info = info
+    server.verbose = verbose
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RemoteEmbeddingClient:
+    """
+    嵌入服务的客户端，可替代 EmbeddingClient（encode / encode_single / encode_prefixes / embedding_dim / close）
+
+    address 为 http://host:port 或 unix:/path/to/socket。大批输入按 request_size 条拆成多个请求，
+    各请求与其他客户端的请求一起在服务端合并成微批。
+    """
+
+    def __init__(self, address: str, timeout: float = 600.0, request_size: int = DEFAULT_REQUEST_SIZE):
+        self.address = address
+        self.timeout = timeout
+        self.request_size = request_size
+        self._local = threading.local()
+        info = self._request("GET", "/info")
+        self.model_name = info["model"]
+        self.truncate_dim = info["truncate_dim"]
+        self.dim = info["dim"]
+        # 向量缓存在服务端（--cache），客户端不另外缓存
+        self.cache = None
+        print(f"Connected to embedding server {address} ({self.model_name}, dim {self.dim})")
+
+    def _connection(self):
+        # 每个线程一个长连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.address.startswith("unix:"):
+                conn = _UnixHTTPConnection(self.address[len("unix:"):], timeout=self.timeout)
+            else:
+                parsed = urlparse(self.address if "://" in self.address else f"http://{self.address}")
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or DEFAULT_PORT, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method, path, body=None, headers=None, raw=False):
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # 服务端关闭了空闲连接时重连一次
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"Embedding server error {response.status}: {data.decode('utf-8', 'replace')}")
+        if raw:
+            return response, data
+        return json.loads(data)
+
+    def _embed(self, texts: List[str], normalize_embeddings: bool) -> np.ndarray:
+        body = json.dumps({"texts": texts, "normalize": normalize_embeddings}, ensure_ascii=False).encode("utf-8")
+        response, data = self._request("POST", "/embed", body,
+                                       {"Content-Type": "application/json", "Accept": "application/octet-stream"},
+                                       raw=True)
+        shape = tuple(int(n) for n in response.getheader("X-Shape").split(","))
+        return np.frombuffer(data, dtype="<f4").reshape(shape)
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True,
+               max_batch_tokens: Optional[int] = None, show_progress_bar: bool = True) -> np.ndarray:
+        """
+        与 EmbeddingClient.encode 相同的接口；组批由服务端决定，batch_size / max_batch_tokens 不起作用
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        parts = [texts[i:i + self.request_size] for i in range(0, len(texts), self.request_size)]
+        return np.concatenate([self._embed(part, normalize_embeddings)
+                               for part in tqdm(parts, desc="Requests", disable=not show_progress_bar)])
+
+    def encode_single(self, text: str) -> np.ndarray:
+        return self.encode([text], show_progress_bar=False)[0]
+
+    def encode_prefixes(self, texts: List[str], dims: List[int], **kwargs) -> dict:
+        embeddings = self.encode(texts, **kwargs)
+        return {dim: embeddings if dim >= embeddings.shape[1] else mrl_prefix(embeddings, dim) for dim in dims}
+
+    def embedding_dim(self) -> int:
+        return self.dim
+
+    def stats(self) -> dict:
+        return self._request("GET", "/stats")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve embeddings from a warm model with dynamic micro-batching")
+    parser.add_argument("--model", type=str, default="fangxq/XYZ-embedding", help="Model name")
+    parser.add_argument("--truncate_dim", type=int, default=768, help="Dimension to truncate embeddings to")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", type=str, default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--max_wait_ms", type=float, default=5.0,
+                        help="How long the first request of a micro-batch waits for others")
+    parser.add_argument("--max_batch_tokens", type=int, default=16384, help="Token budget per micro-batch")
+    parser.add_argument("--batch_size", type=int, default=32, help="Model batch size within a micro-batch")
+    parser.add_argument("--cache", type=str, default=None, help="Path to SQLite embedding cache")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Encode in this many CPU processes, each with its own model copy (1 = in-process)")
+    parser.add_argument("--threads_per_worker", type=int, default=None)
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx"])
+    parser.add_argument("--onnx_quantize", action="store_true")
+    parser.add_argument("--onnx_dir", type=str, default="data/cache/onnx")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    try:
+        from .embedding_client import EmbeddingClient
+    except ImportError:
+        from embedding_client import EmbeddingClient
+
+    client = EmbeddingClient(model_name=args.model, truncate_dim=args.truncate_dim, cache_path=args.cache,
+                             workers=args.workers, threads_per_worker=args.threads_per_worker, backend=args.backend,
+                             onnx_quantize=args.onnx_quantize, onnx_dir=args.onnx_dir)
+    # 预热，首个请求不承担初始化开销
+    client.encode(["warmup"], show_progress_bar=False)
+    batcher = MicroBatcher(client, max_wait=args.max_wait_ms / 1000, max_batch_tokens=args.max_batch_tokens,
+                           batch_size=args.batch_size)
+    info = {"model": args.model, "truncate_dim": args.truncate_dim, "dim": client.embedding_dim(),
+            "backend": args.backend}
+    server = make_server(batcher, info, args.host, args.port, args.socket, args.verbose)
+    address = f"unix:{args.socket}" if args.socket else f"http://{args.host}:{args.port}"
+
+    # SIGTERM 与 Ctrl+C 一样正常退出
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"Embedding server listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        client.close()
+        print(f"Stopped. {batcher.latency_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,120 @@
+import hashlib
 import json
 import argparse
+import queue
+import threading
+import time
+from pathlib import Path
 from pymilvus import (
     connections,
     utility,
+    BulkInsertState,
     FieldSchema,
     CollectionSchema,
     DataType,
     Collection,
 )
 
-def connect_milvus(host="localhost", port="19530"):
-    print(f"Connecting to Milvus at {host}:{port}...")
-    connections.connect("default", host=host, port=port)
+import numpy as np
+
+try:
+    from . import metrics
+    from .content_store import ContentStoreWriter
+    from .ingest_manifest import IngestManifest
+    from .jsonl_index import SHARD_MODES, iter_records, parse_shard
+    from .quantization import Quantizer, calibration_path_for, quantized_path_for
+    from .vector_store import load_vectors, prefix_path_for, vector_path_for
+except ImportError:
+    import metrics
+    from content_store import ContentStoreWriter
+    from ingest_manifest import IngestManifest
+    from jsonl_index import SHARD_MODES, iter_records, parse_shard
+    from quantization import Quantizer, calibration_path_for, quantized_path_for
+    from vector_store import load_vectors, prefix_path_for, vector_path_for
+
+# 默认索引配置
+DEFAULT_INDEX_TYPE = "HNSW"
+DEFAULT_INDEX_PARAMS = {"M": 16, "efConstruction": 256}
+# 二值向量的默认索引（HAMMING 距离）
+DEFAULT_BINARY_INDEX_TYPE = "BIN_IVF_FLAT"
+DEFAULT_BINARY_INDEX_PARAMS = {"nlist": 1024}
+
+# 向量类型对应的 Milvus 字段类型
+VECTOR_DTYPES = {
+    "float": DataType.FLOAT_VECTOR,
+    "int8": DataType.INT8_VECTOR,
+    "binary": DataType.BINARY_VECTOR,
+}
+
+
+def connect_milvus(host="localhost", port="19530", uri=None):
+    # uri 可指向 milvus-lite 的本地数据库文件，如 ./milvus.db
+    if uri:
+        print(f"Connecting to Milvus at {uri}...")
+        connections.connect("default", uri=uri)
+    else:
+        print(f"Connecting to Milvus at {host}:{port}...")
+        connections.connect("default", host=host, port=port)
     print("Connected.")
 
-def create_collection(collection_name, dim):
+def make_index_params(index_type=DEFAULT_INDEX_TYPE, params=None, metric_type="IP"):
+    return {
+        "metric_type": metric_type, # 内积相似度，通常用于归一化后的向量 (相当于Cosine)
+        "index_type": index_type,
+        "params": dict(DEFAULT_INDEX_PARAMS if params is None else params)
+    }
+
+def build_index(collection, index_params=None, wait=True):
+    """
+    在 vector 字段上创建索引，并等待构建完成
+    """
+    index_params = index_params or make_index_params()
+    print(f"Creating {index_params['index_type']} index {index_params['params']}...")
+    start = time.perf_counter()
+    collection.create_index(field_name="vector", index_params=index_params)
+    if wait:
+        utility.wait_for_index_building_complete(collection.name)
+        metrics.observe("index_build_seconds", time.perf_counter() - start, index_type=index_params["index_type"])
+    print(f"Index created in {time.perf_counter() - start:.1f}s.")
+
+def chunk_id(source, page, content_type, chunk_index, text):
+    """
+    由源文件、页码、内容类型、分块序号和文本内容计算确定性的主键（63 位正整数，适配 INT64）
+    同一分块内容不变时 id 不变，可据此判断哪些分块需要重新写入
+    """
+    key = f"{source}\0{page}\0{content_type}\0{chunk_index}\0{text}"
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") >> 1
+
+def item_chunk_id(item):
+    """
+    向量文件中一条记录的 chunk_id，与导入时写入的主键一致
+    """
+    meta = item.get('metadata', {})
+    page = meta.get('page', -1)
+    return chunk_id(str(meta.get('source', '')), int(page) if page is not None else -1,
+                    str(meta.get('content_type', 'text')), meta.get('chunk_index', 0), item.get('text', ''))
+
+def create_collection(collection_name, dim, drop_existing=True, index_params=None, with_index=True, auto_id=True,
+                      vector_type="float", with_text=True):
+    """
+    with_index=False 时只创建 Collection 不建索引（批量导入模式），
+    数据全部写入后再调用 build_index 一次性构建
+    auto_id=False 时主键由 chunk_id 生成，支持按源文件 upsert
+    vector_type 为 int8/binary 时 vector 字段使用 INT8_VECTOR/BINARY_VECTOR（二值向量的 dim 为位数）
+    with_text=False 时不建 text 字段，正文保存在本地内容存储中（见 content_store.py），要求 auto_id=False
+    """
     if utility.has_collection(collection_name):
+        if not drop_existing:
+            print(f"Collection {collection_name} already exists. Reusing it.")
+            collection = Collection(collection_name)
+            if collection.schema.auto_id != auto_id:
+                raise ValueError(f"Collection {collection_name} has auto_id={collection.schema.auto_id}; "
+                                 f"recreate it once with auto_id={auto_id}")
+            if any(field.name == "text" for field in collection.schema.fields) != with_text:
+                raise ValueError(f"Collection {collection_name} was created {'without' if with_text else 'with'} "
+                                 f"a text field; recreate it once to change where chunk text is stored")
+            return collection
         print(f"Collection {collection_name} already exists. Dropping it...")
         utility.drop_collection(collection_name)
 
@@ -23,13 +122,15 @@ def create_collection(collection_name, dim):
     
     # 1. 定义Schema
     fields = [
-        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=auto_id),
         FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535), # 使用较大的长度以适应长文本
-        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+        FieldSchema(name="vector", dtype=VECTOR_DTYPES[vector_type], dim=dim),
         FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=512),
         FieldSchema(name="page", dtype=DataType.INT64), # 存储页码信息
         FieldSchema(name="content_type", dtype=DataType.VARCHAR, max_length=50) # 存储内容类型
     ]
+    if not with_text:
+        fields.pop(1)
     
     schema = CollectionSchema(fields, description="RAG Documents Collection")
     
@@ -38,71 +139,464 @@ def create_collection(collection_name, dim):
     print(f"Collection {collection_name} created.")
     
     # 3. 创建索引
-    print("Creating HNSW index...")
-    index_params = {
-        "metric_type": "IP", # 内积相似度，通常用于归一化后的向量 (相当于Cosine)
-        "index_type": "HNSW",
-        "params": {"M": 16, "efConstruction": 256}
-    }
-    collection.create_index(field_name="vector", index_params=index_params)
-    print("Index created.")
+    if with_index:
+        build_index(collection, index_params, wait=False)
     return collection
 
-def import_data(collection, input_file):
-    print(f"Reading data from {input_file}...")
-    
+def delete_sources(collection, sources, batch_size=100):
+    """
+    删除指定源文件的全部实体
+    """
+    sources = list(sources)
+    for i in range(0, len(sources), batch_size):
+        batch = sources[i:i + batch_size]
+        collection.delete(expr=f"source in {json.dumps(batch, ensure_ascii=False)}")
+    print(f"Deleted entities of {len(sources)} stale sources.")
+
+
+def offload_text(batch, content_store):
+    """
+    把带 ids 列的批次中的正文写入内容存储，返回去掉 text 列的批次（与 with_text=False 的 Schema 一致）
+    """
+    content_store.add(batch[0], batch[1])
+    return [batch[0]] + batch[2:]
+
+
+def iter_batches(input_file, batch_size=1000, sources_filter=None, with_ids=False, vector_type="float", coarse_dim=None,
+                 shard=None, shard_by="contiguous"):
+    """
+    逐行读取向量文件，按 batch_size 产出列式批次
+    [texts, vectors, sources, pages, content_types]，与 Schema 中除 id 外的字段顺序一致；
+    with_ids=True 时在最前面加上 chunk_id 生成的 ids 列
+    vector_type 为 int8/binary 时从量化向量文件读取，并转换为 Milvus 接受的格式；
+    coarse_dim 不为 None 时从对应的 MRL 前缀向量文件读取
+    shard=(i, N) 时只读取输入的第 i 个分片（见 jsonl_index.py），向量仍按整个文件中的行号取出
+    """
+    # 若存在同名 .npy 向量文件，则以内存映射方式读取向量，JSONL 只包含元数据
+    vector_file = None
+    quantizer = None
+    vector_path = vector_path_for(input_file)
+    if vector_type != "float":
+        vector_path = quantized_path_for(input_file, vector_type)
+        if not vector_path.exists():
+            raise FileNotFoundError(f"{vector_path} not found; quantize the vectors first (--quantize {vector_type})")
+        quantizer = Quantizer.load(calibration_path_for(input_file, vector_type))
+    elif coarse_dim is not None:
+        vector_path = prefix_path_for(input_file, coarse_dim)
+        if not vector_path.exists():
+            raise FileNotFoundError(f"{vector_path} not found; embed with --prefix_dims {coarse_dim}")
+    if vector_path.exists():
+        vector_file = load_vectors(vector_path)
+        print(f"Using vectors from {vector_path} {vector_file.shape}")
+
+    def make_batch(ids, texts, vectors, sources, pages, content_types):
+        # 按行号一次性取出连续的 float32 矩阵，避免逐个浮点数的 Python 转换
+        if vector_file is not None:
+            vectors = np.ascontiguousarray(vector_file[np.asarray(vectors)])
+        if quantizer is not None:
+            vectors = quantizer.to_milvus(vectors)
+        if with_ids:
+            return [ids, texts, vectors, sources, pages, content_types]
+        return [texts, vectors, sources, pages, content_types]
+
     # 准备数据
+    ids = []
     texts = []
     vectors = []
     sources = []
     pages = []
     content_types = []
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if not line.strip():
-                continue
-            item = json.loads(line)
+    for row, item in iter_records(input_file, shard, shard_by):
+        # 提取字段
+        text = item.get('text', '')
+        vector = item.get('vector', []) if vector_file is None else row
+        meta = item.get('metadata', {})
+        source = meta.get('source', '')
+        page = meta.get('page', -1) # -1 表示未知
+        content_type = meta.get('content_type', 'text')
+        if sources_filter is not None and source not in sources_filter:
+            continue
+        
+        # 简单验证
+        if vector_file is None and not vector:
+            print("Skipping item with empty vector.")
+            continue
             
-            # 提取字段
-            text = item.get('text', '')
-            vector = item.get('vector', [])
-            meta = item.get('metadata', {})
-            source = meta.get('source', '')
-            page = meta.get('page', -1) # -1 表示未知
-            content_type = meta.get('content_type', 'text')
-            
-            # 简单验证
-            if not vector:
-                print("Skipping item with empty vector.")
+        texts.append(text)
+        vectors.append(vector)
+        sources.append(str(source))
+        pages.append(int(page) if page is not None else -1)
+        content_types.append(str(content_type))
+        if with_ids:
+            ids.append(item_chunk_id(item))
+
+        if len(texts) >= batch_size:
+            yield make_batch(ids, texts, vectors, sources, pages, content_types)
+            ids, texts, vectors, sources, pages, content_types = [], [], [], [], [], []
+
+    if texts:
+        yield make_batch(ids, texts, vectors, sources, pages, content_types)
+
+
+def items_to_batch(items, vectors, with_ids=False):
+    """
+    将内存中的分块记录与对应的向量转换为与 iter_batches 相同的列式批次
+    """
+    texts, sources, pages, content_types = [], [], [], []
+    for item in items:
+        meta = item.get('metadata', {})
+        page = meta.get('page', -1)
+        texts.append(item.get('text', ''))
+        sources.append(str(meta.get('source', '')))
+        pages.append(int(page) if page is not None else -1)
+        content_types.append(str(meta.get('content_type', 'text')))
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if with_ids:
+        return [[item_chunk_id(item) for item in items], texts, vectors, sources, pages, content_types]
+    return [texts, vectors, sources, pages, content_types]
+
+
+def existing_ids(collection, source, batch_size=1000):
+    """
+    查询某个源文件在 Collection 中已有的全部主键
+    """
+    ids = set()
+    iterator = collection.query_iterator(batch_size=batch_size, expr=f"source == {json.dumps(source, ensure_ascii=False)}",
+                                         output_fields=["id"])
+    while True:
+        rows = iterator.next()
+        if not rows:
+            iterator.close()
+            return ids
+        ids.update(row["id"] for row in rows)
+
+
+def delete_ids(collection, ids, batch_size=1000):
+    ids = list(ids)
+    for i in range(0, len(ids), batch_size):
+        collection.delete(expr=f"id in {ids[i:i + batch_size]}")
+
+
+def collection_sources(collection, batch_size=1000):
+    """
+    查询 Collection 中出现过的全部源文件
+    """
+    sources = set()
+    iterator = collection.query_iterator(batch_size=batch_size, expr="id >= 0", output_fields=["source"])
+    while True:
+        rows = iterator.next()
+        if not rows:
+            iterator.close()
+            return sources
+        sources.update(row["source"] for row in rows)
+
+
+def input_sources(input_file):
+    """
+    向量文件中出现的全部源文件（与导入时写入的 source 字段一致）
+    """
+    return {str(item.get('metadata', {}).get('source', '')) for _, item in iter_records(input_file)}
+
+
+def iter_upsert_batches(collection, input_file, batch_size=1000, sources_filter=None, finished=None, vector_type="float",
+                        coarse_dim=None, shard=None, shard_by="contiguous", stale_ids=None):
+    """
+    按源文件比对确定性主键：已存在的分块跳过，只产出新增或内容变化的分块。输入中同一源文件的记录必须连续出现。
+    完成比对的源文件会加入 finished 集合，其中不再出现的分块主键记入 stale_ids（{source: ids}），
+    由调用方在该源文件的批次全部写入成功后再删除，避免更新期间文档只剩一部分可检索、写入失败时旧分块已被删掉。
+    """
+    columns = [[] for _ in range(6)]
+    finished = set() if finished is None else finished
+    stale_ids = {} if stale_ids is None else stale_ids
+    current = {"source": None, "existing": set(), "seen": set()}
+    stats = {"unchanged": 0, "stale": 0}
+
+    def finish_source():
+        stale = current["existing"] - current["seen"]
+        if stale:
+            stale_ids[current["source"]] = stale
+            stats["stale"] += len(stale)
+        finished.add(current["source"])
+
+    def take_batch():
+        batch = [list(col) for col in columns]
+        if vector_type == "float":
+            batch[2] = np.asarray(batch[2], dtype=np.float32)
+        for col in columns:
+            col.clear()
+        return batch
+
+    for batch in iter_batches(input_file, batch_size, sources_filter, with_ids=True, vector_type=vector_type,
+                              coarse_dim=coarse_dim, shard=shard, shard_by=shard_by):
+        for row in zip(*batch):
+            row_id, source = row[0], row[3]
+            if source != current["source"]:
+                if current["source"] is not None:
+                    finish_source()
+                if source in finished:
+                    raise ValueError(f"Rows of {source} are not contiguous in {input_file}")
+                current = {"source": source, "existing": existing_ids(collection, source), "seen": set()}
+            current["seen"].add(row_id)
+            if row_id in current["existing"]:
+                # 内容未变化，无需重新写入
+                stats["unchanged"] += 1
                 continue
-                
-            texts.append(text)
-            vectors.append(vector)
-            sources.append(str(source))
-            pages.append(int(page) if page is not None else -1)
-            content_types.append(str(content_type))
-            
-    if not texts:
-        print("No data to import.")
-        return
+            for col, value in zip(columns, row):
+                col.append(value)
+            if len(columns[0]) >= batch_size:
+                yield take_batch()
+
+    if current["source"] is not None:
+        finish_source()
+    if columns[0]:
+        yield take_batch()
+    print(f"Upsert diff: {stats['unchanged']} unchanged chunks skipped, {stats['stale']} stale chunks to delete.")
+
+
+def insert_with_retry(write, entities, max_retries=3, backoff=1.0):
+    """
+    用 write（collection.insert 或 collection.upsert）写入一个批次，失败时按指数退避重试
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with metrics.timer("insert_batch_seconds"):
+                write(entities)
+            return
+        except Exception as e:
+            metrics.inc("insert_batch_errors_total")
+            if attempt == max_retries:
+                raise
+            wait = backoff * (2 ** attempt)
+            print(f"Insert of {len(entities[0])} rows failed ({e}), retrying in {wait:.1f}s...")
+            time.sleep(wait)
+
+
+def import_data(collection, input_file, manifest=None, batch_size=1000, workers=2, max_retries=3, upsert=False,
+                vector_type="float", coarse_dim=None, shard=None, shard_by="contiguous", content_store=None):
+    """
+    流水线式导入：读取线程解析下一批数据的同时，workers 个插入线程并发写入之前的批次。
+    队列有界，读取速度超过插入速度时会被阻塞，内存占用与文件大小无关。
+    collection 只需提供 insert/flush 方法，便于用 milvus-lite 或本地替身对象测试。
+
+    upsert=True 时（要求 Collection 使用确定性主键）按源文件比对，只写入变化的分块，某个源文件的批次全部写入成功后
+    再删除它的过期分块，Collection 始终保持加载状态，可在更新期间继续提供检索。没有 manifest 时，
+    Collection 中存在而输入中已没有的源文件整体删除（分片导入时只由第 0 个分片对照整个输入执行）。
+    vector_type 为 int8/binary 时导入量化向量文件（Collection 需以相同 vector_type 创建）；
+    coarse_dim 不为 None 时导入该维度的 MRL 前缀向量（Collection 的 dim 需为 coarse_dim）。
+    shard=(i, N) 时只导入输入的第 i 个分片；分片不会拆开同一源文件，多个分片可并发导入同一 Collection。
+    传入 content_store（ContentStoreWriter）时正文写入内容存储而不写入 Collection（需以 with_text=False 创建），
+    调用方负责在导入结束后 close()。
+    """
+    print(f"Reading data from {input_file}...")
+
+    stale = None
+    if manifest is not None:
+        stale = set(manifest.stale_sources("imported"))
+
+    with_ids = not collection.schema.auto_id
+    source_col = 3 if with_ids else 2
+    if content_store is not None:
+        if not with_ids:
+            raise ValueError("A content store requires a collection created with auto_id=False")
+        source_col -= 1
+    if upsert:
+        if not with_ids:
+            raise ValueError("Upsert mode requires a collection created with auto_id=False")
+        collection.load()
+        # 已删除的源文件整体删除，变更的源文件按分块比对
+        if stale:
+            removed = [source for source in manifest.removed_sources() if source in stale]
+            if removed:
+                delete_sources(collection, removed)
+        upsert_sources = set()
+        stale_ids = {}
+        batch_iter = iter_upsert_batches(collection, input_file, batch_size, sources_filter=stale, finished=upsert_sources,
+                                         vector_type=vector_type, coarse_dim=coarse_dim, shard=shard, shard_by=shard_by,
+                                         stale_ids=stale_ids)
+        write = collection.upsert
+    else:
+        # 增量模式：先删除新增/变更/已删除文件的旧实体，只导入这些文件的数据
+        if stale:
+            delete_sources(collection, stale)
+        batch_iter = iter_batches(input_file, batch_size, sources_filter=stale, with_ids=with_ids, vector_type=vector_type,
+                                  coarse_dim=coarse_dim, shard=shard, shard_by=shard_by)
+        write = collection.insert
+    if content_store is not None:
+        # 正文在对应批次写入 Collection 之前落入内容存储
+        batch_iter = (offload_text(batch, content_store) for batch in batch_iter)
+
+    batches = queue.Queue(maxsize=workers * 2)
+    lock = threading.Lock()
+    reader_error = []
+    stats = {"rows": 0, "batches": 0, "failed_rows": 0}
+    imported_sources = set()
+    failed_sources = set()
+
+    def reader():
+        try:
+            for batch in batch_iter:
+                batches.put(batch)
+        except Exception as e:
+            reader_error.append(e)
+        finally:
+            for _ in range(workers):
+                batches.put(None)
+
+    def inserter():
+        while True:
+            entities = batches.get()
+            if entities is None:
+                return
+            rows = len(entities[0])
+            try:
+                insert_with_retry(write, entities, max_retries=max_retries)
+            except Exception as e:
+                print(f"Batch of {rows} rows failed after {max_retries} retries: {e}")
+                metrics.inc("insert_failed_rows_total", rows)
+                with lock:
+                    stats["failed_rows"] += rows
+                    failed_sources.update(entities[source_col])
+                continue
+            metrics.inc("insert_rows_total", rows)
+            metrics.observe("insert_batch_rows", rows)
+            with lock:
+                stats["rows"] += rows
+                stats["batches"] += 1
+                imported_sources.update(entities[source_col])
+                elapsed = time.perf_counter() - start
+                print(f"Inserted {stats['rows']} rows ({stats['rows'] / elapsed:.0f} rows/s)")
 
     # 插入数据
     # Schema: id, text, vector, source, page, content_type
     # Insert: [texts, vectors, sources, pages, content_types]
-    
-    print(f"Inserting {len(texts)} entities...")
-    entities = [
-        texts,
-        vectors,
-        sources,
-        pages,
-        content_types
-    ]
-    
-    collection.insert(entities)
-    collection.flush()
-    print(f"Inserted {collection.num_entities} entities.")
+    start = time.perf_counter()
+    threads = [threading.Thread(target=reader, daemon=True)]
+    threads += [threading.Thread(target=inserter, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if reader_error:
+        raise reader_error[0]
+
+    if upsert:
+        # 只删除批次全部写入成功的源文件的过期分块；失败的源文件保留旧分块，下次运行再比对
+        deleted = 0
+        for source, ids in stale_ids.items():
+            if source not in failed_sources:
+                delete_ids(collection, ids)
+                deleted += len(ids)
+        if deleted:
+            print(f"Deleted {deleted} stale chunks.")
+        if manifest is None and (shard is None or shard[0] == 0):
+            current_sources = upsert_sources if shard is None else input_sources(input_file)
+            removed = collection_sources(collection) - current_sources
+            if removed:
+                delete_sources(collection, removed)
+
+    if stats["rows"] == 0 and stats["failed_rows"] == 0:
+        print("No data to import.")
+        if upsert:
+            collection.flush()
+    else:
+        collection.flush()
+        elapsed = time.perf_counter() - start
+        print(f"Inserted {stats['rows']} entities in {stats['batches']} batches, "
+              f"{elapsed:.1f}s ({stats['rows'] / elapsed:.0f} rows/s).")
+        if stats["failed_rows"]:
+            print(f"Failed to insert {stats['failed_rows']} rows from {len(failed_sources)} sources.")
+
+    # 只有全部批次都成功的源文件才记为已导入（upsert 模式下内容未变的源文件没有写入批次，同样视为已导入）
+    if manifest is not None:
+        if upsert:
+            imported_sources = upsert_sources
+        # 没有任何分块的源文件（空文件、无法解析）不会出现在批次中：非 upsert 模式下其旧实体已在开头删除，
+        # upsert 模式下在这里整体删除，然后同样记为已导入
+        empty = manifest.empty_sources("imported", imported_sources | failed_sources)
+        if upsert and empty:
+            delete_sources(collection, empty)
+        _finish_manifest(manifest, stale, (imported_sources - failed_sources).union(empty))
+
+
+def write_parquet_files(input_file, output_dir, rows_per_file=100000, sources_filter=None, with_ids=False):
+    """
+    将向量文件转换为 Milvus 批量导入所需的 Parquet 行文件，返回文件路径列表
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    files = []
+    for batch in iter_batches(input_file, rows_per_file, sources_filter, with_ids=with_ids):
+        columns = {}
+        if with_ids:
+            columns["id"] = pa.array(batch.pop(0), type=pa.int64())
+        texts, vectors, sources, pages, content_types = batch
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        offsets = np.arange(0, vectors.size + 1, vectors.shape[1], dtype=np.int32)
+        table = pa.table({
+            **columns,
+            "text": pa.array(texts, type=pa.string()),
+            "vector": pa.ListArray.from_arrays(pa.array(offsets), pa.array(vectors.ravel())),
+            "source": pa.array(sources, type=pa.string()),
+            "page": pa.array(pages, type=pa.int64()),
+            "content_type": pa.array(content_types, type=pa.string()),
+        })
+        path = output_dir / f"part-{len(files):05d}.parquet"
+        pq.write_table(table, path)
+        files.append(str(path))
+    print(f"Wrote {len(files)} parquet files to {output_dir}.")
+    return files
+
+
+def upload_to_minio(files, endpoint, bucket, prefix="bulk", access_key="minioadmin", secret_key="minioadmin"):
+    """
+    将 Parquet 文件上传到 Milvus 使用的 MinIO bucket，返回 bucket 内的对象路径
+    """
+    from minio import Minio
+
+    client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=False)
+    remote_files = []
+    for path in files:
+        object_name = f"{prefix}/{Path(path).name}"
+        client.fput_object(bucket, object_name, path)
+        remote_files.append(object_name)
+    print(f"Uploaded {len(remote_files)} files to {bucket}/{prefix}.")
+    return remote_files
+
+
+def bulk_insert_files(collection_name, remote_files, poll_interval=2.0):
+    """
+    对每个文件提交 do_bulk_insert 任务，并等待全部任务结束，返回导入的行数
+    """
+    task_ids = [utility.do_bulk_insert(collection_name=collection_name, files=[f]) for f in remote_files]
+    pending = set(task_ids)
+    rows = 0
+    while pending:
+        time.sleep(poll_interval)
+        for task_id in list(pending):
+            state = utility.get_bulk_insert_state(task_id=task_id)
+            if state.state == BulkInsertState.ImportCompleted:
+                rows += state.row_count
+                pending.discard(task_id)
+            elif state.state in (BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned):
+                raise RuntimeError(f"Bulk insert task {task_id} failed: {state.failed_reason}")
+    print(f"Bulk inserted {rows} rows from {len(remote_files)} files.")
+    return rows
+
+
+def _finish_manifest(manifest, stale, imported_sources):
+    """
+    标记已导入的源文件，并将已删除的源文件移出清单
+    """
+    for source in set(imported_sources):
+        manifest.mark(source, "imported")
+    for source in manifest.removed_sources():
+        if source in stale:
+            manifest.forget(source)
+    manifest.save()
 
 
 #模拟查询向量，测试查询结果
@@ -133,20 +627,115 @@ def search_test(collection, dim):
         print(f"Score: {hit.score:.4f}, Type: {hit.entity.get('content_type')}, Source: {hit.entity.get('source')}")
         # print(f"Text: {hit.entity.get('text')[:50]}...")
 
-if __name__ == "__main__":
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Import data to Milvus")
     parser.add_argument("--input", type=str, default="data/output/vectorized.jsonl")
     parser.add_argument("--collection", type=str, default="rag_collection")
     parser.add_argument("--dim", type=int, default=768)
     parser.add_argument("--host", type=str, default="localhost")
     parser.add_argument("--port", type=str, default="19530")
+    parser.add_argument("--uri", type=str, default=None, help="Milvus URI, e.g. a milvus-lite file ./milvus.db")
+    parser.add_argument("--index_type", type=str, default=DEFAULT_INDEX_TYPE)
+    parser.add_argument("--index_params", type=str, default=json.dumps(DEFAULT_INDEX_PARAMS),
+                        help="Index build parameters as JSON")
+    parser.add_argument("--bulk_load", choices=["insert", "parquet"], default=None,
+                        help="Load into a collection without an index (via batched inserts or parquet bulk insert), "
+                             "then build the index once")
+    parser.add_argument("--bulk_dir", type=str, default="data/output/bulk", help="Local directory for parquet files")
+    parser.add_argument("--minio_endpoint", type=str, default="localhost:9000")
+    parser.add_argument("--minio_bucket", type=str, default="a-bucket")
+    parser.add_argument("--upsert", action="store_true",
+                        help="Use deterministic chunk ids; keep the collection loaded and only write changed chunks per source")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Path to ingest manifest; keeps the collection and only replaces changed sources")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Rows per insert call")
+    parser.add_argument("--insert_workers", type=int, default=2, help="Number of concurrent insert threads")
+    parser.add_argument("--max_retries", type=int, default=3, help="Retries per failed insert batch")
+    parser.add_argument("--vector_type", type=str, default="float", choices=["float", "int8", "binary"],
+                        help="Store quantized vectors (INT8_VECTOR/IP or BINARY_VECTOR/HAMMING) produced by --quantize; "
+                             "implies deterministic chunk ids so results can be rescored with the float vectors")
+    parser.add_argument("--coarse_dim", type=int, default=None,
+                        help="Index only this MRL prefix (written by --prefix_dims) and rerank with the full vectors on disk; "
+                             "implies deterministic chunk ids")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only import shard i of N of the input (i/N); never drops the collection, so shards can run concurrently")
+    parser.add_argument("--shard_by", type=str, default="contiguous", choices=SHARD_MODES,
+                        help="contiguous: byte-balanced ranges aligned to source boundaries; hash: by source path")
+    parser.add_argument("--content_store", type=str, default=None,
+                        help="Keep chunk text out of Milvus: write it to this local zstd content store directory and "
+                             "create the collection without a text field; implies deterministic chunk ids")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="Write insert batch latency and row counts as Prometheus text (.prom) or JSON (.json)")
+    parser.add_argument("--profile", type=str, default=None, choices=["cprofile", "pyinstrument"],
+                        help="Profile the import stage")
+    parser.add_argument("--profile_dir", type=str, default="data/output/profiles")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.bulk_load and args.manifest:
+        parser.error("--bulk_load performs a full reload and cannot be combined with --manifest")
+    if (args.vector_type != "float" or args.coarse_dim) and args.bulk_load == "parquet":
+        parser.error("--bulk_load parquet only supports full-dim float vectors")
+    if args.vector_type != "float" and args.coarse_dim:
+        parser.error("--vector_type and --coarse_dim cannot be combined")
+    if args.shard is not None and (args.bulk_load or args.manifest):
+        parser.error("--bulk_load and --manifest cannot be combined with --shard")
+    if args.content_store and (args.shard is not None or args.bulk_load == "parquet"):
+        parser.error("--content_store cannot be combined with --shard or --bulk_load parquet")
+    # 量化向量和前缀向量检索后按 chunk_id 取回全维 float 向量重新打分，内容存储按 chunk_id 取回正文，因此主键必须是确定性的
+    use_chunk_ids = (args.upsert or args.vector_type != "float" or args.coarse_dim is not None
+                     or args.content_store is not None)
+    with_text = args.content_store is None
+    dim = args.coarse_dim or args.dim
+    if args.profile:
+        metrics.configure_profiling(["import"], args.profile, args.profile_dir)
     
+    content_store = None
     try:
-        connect_milvus(args.host, args.port)
-        collection = create_collection(args.collection, args.dim)
-        import_data(collection, args.input)
+        connect_milvus(args.host, args.port, args.uri)
+        manifest = IngestManifest(args.manifest) if args.manifest else None
+        # 全量导入（删除重建 Collection）时同时重建内容存储，否则在末尾追加
+        full_reload = args.bulk_load is not None or (manifest is None and not args.upsert and args.shard is None)
+        if args.content_store:
+            content_store = ContentStoreWriter(args.content_store, append=not full_reload)
+        index_type, params = args.index_type, json.loads(args.index_params)
+        if args.vector_type == "binary" and index_type == DEFAULT_INDEX_TYPE and params == DEFAULT_INDEX_PARAMS:
+            index_type, params = DEFAULT_BINARY_INDEX_TYPE, DEFAULT_BINARY_INDEX_PARAMS
+        metric_type = "HAMMING" if args.vector_type == "binary" else "IP"
+        index_params = make_index_params(index_type, params, metric_type=metric_type)
+        with metrics.stage("import"):
+            if args.bulk_load:
+                # 批量导入：先无索引写入全部数据，再一次性构建索引
+                collection = create_collection(args.collection, dim, with_index=False, auto_id=not use_chunk_ids,
+                                               vector_type=args.vector_type, with_text=with_text)
+                start = time.perf_counter()
+                if args.bulk_load == "parquet":
+                    files = write_parquet_files(args.input, args.bulk_dir, with_ids=args.upsert)
+                    remote_files = upload_to_minio(files, args.minio_endpoint, args.minio_bucket)
+                    bulk_insert_files(args.collection, remote_files)
+                else:
+                    import_data(collection, args.input, batch_size=args.batch_size,
+                                workers=args.insert_workers, max_retries=args.max_retries, vector_type=args.vector_type,
+                                coarse_dim=args.coarse_dim, content_store=content_store)
+                build_index(collection, index_params)
+                print(f"Bulk load finished in {time.perf_counter() - start:.1f}s.")
+            else:
+                collection = create_collection(args.collection, dim,
+                                               drop_existing=full_reload,
+                                               index_params=index_params, auto_id=not use_chunk_ids,
+                                               vector_type=args.vector_type, with_text=with_text)
+                import_data(collection, args.input, manifest=manifest, batch_size=args.batch_size,
+                            workers=args.insert_workers, max_retries=args.max_retries, upsert=args.upsert,
+                            vector_type=args.vector_type, coarse_dim=args.coarse_dim,
+                            shard=args.shard, shard_by=args.shard_by, content_store=content_store)
         #search_test(collection, args.dim)
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        if content_store is not None:
+            content_store.close()
+        if args.metrics:
+            metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
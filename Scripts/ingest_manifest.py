@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# 流水线各阶段，按执行顺序排列
+STAGES = ("parsed", "chunked", "embedded", "imported")
+
+
+def file_hash(file_path, block_size=1 << 20):
+    """
+    计算文件内容的 sha256
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def record_source(item):
+    """
+    获取一条记录对应的源文件（parsed 记录在顶层，chunk/向量记录在 metadata 中）
+    """
+    if "source" in item:
+        return item["source"]
+    return item.get("metadata", {}).get("source", "")
+
+
+class IngestManifest:
+    """
+    增量入库清单
+
+    按源文件记录其内容哈希，以及每个阶段完成时对应的哈希：
+    {"files": {source: {"hash": "...", "stages": {"parsed": "...", ...}}}}
+    某阶段记录的哈希与当前哈希一致时，说明该文件在此阶段已是最新，无需重复处理。
+    源文件被删除后 hash 置为 None，待入库阶段删除对应实体后再移出清单。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, file_paths):
+        """
+        重新计算源文件哈希，返回 (changed, removed) 两个列表
+        """
+        current = set()
+        changed = []
+        for file_path in file_paths:
+            source = str(file_path)
+            current.add(source)
+            digest = file_hash(file_path)
+            entry = self.files.setdefault(source, {"hash": None, "stages": {}})
+            if entry["hash"] != digest:
+                entry["hash"] = digest
+                changed.append(source)
+
+        removed = []
+        for source, entry in self.files.items():
+            if source not in current and entry["hash"] is not None:
+                entry["hash"] = None
+                removed.append(source)
+        return changed, removed
+
+    def is_current(self, source, stage):
+        entry = self.files.get(source)
+        if entry is None or entry["hash"] is None:
+            return False
+        return entry["stages"].get(stage) == entry["hash"]
+
+    def mark(self, source, stage):
+        entry = self.files.get(source)
+        if entry is not None and entry["hash"] is not None:
+            entry["stages"][stage] = entry["hash"]
+
+    def empty_sources(self, stage, processed):
+        """
+        返回上一阶段已是最新、本阶段仍待处理却不在 processed 中的源文件：
+        它们在上一阶段没有产出任何记录（空文件、无法解析或没有分块），本阶段不会读到它们。
+        调用方标记这些源文件后，在内容变化前不再被当作新文件重复处理
+        """
+        previous = STAGES[STAGES.index(stage) - 1]
+        return [source for source, entry in self.files.items()
+                if entry["hash"] is not None and source not in processed
+                and self.is_current(source, previous) and not self.is_current(source, stage)]
+
+    def stale_sources(self, stage):
+        """
+        返回在该阶段需要重新处理的源文件（新增、变更或已删除）
+        """
+        return [source for source in self.files if not self.is_current(source, stage)]
+
+    def removed_sources(self):
+        return [source for source, entry in self.files.items() if entry["hash"] is None]
+
+    def forget(self, source):
+        self.files.pop(source, None)
+
+
+def carry_forward(manifest, stage, previous_output, f, rows=None):
+    """
+    将上一次输出中、本阶段已是最新的源文件的记录原样写入 f
+    返回被沿用的源文件集合；若传入 rows 列表，则追加被沿用记录在原文件中的行号（不含空行）
+    """
+    kept = set()
+    if not Path(previous_output).exists():
+        return kept
+    with open(previous_output, "r", encoding="utf-8") as prev:
+        row = -1
+        for line in prev:
+            if not line.strip():
+                continue
+            row += 1
+            source = record_source(json.loads(line))
+            if manifest.is_current(source, stage):
+                f.write(line if line.endswith("\n") else line + "\n")
+                kept.add(source)
+                if rows is not None:
+                    rows.append(row)
+    return kept
@@ -1,10 +1,13 @@
 from argparse import FileType
 from docx import Document
 import json
+import multiprocessing
 from pathlib import Path
 import pymupdf
-import pandas as pd
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 # 禁用 unstructured 的 analytics
 os.environ["SCARF_NO_ANALYTICS"] = "true"
 
@@ -12,6 +15,15 @@ from unstructured.partition.html import partition_html
 from unstructured.partition.md import partition_md
 from unstructured.documents.elements import Title, NarrativeText
 
+try:
+    from . import metrics
+    from .ingest_manifest import IngestManifest, carry_forward
+    from .jsonl_index import SHARD_MODES, parse_shard, shard_files, shard_path
+except ImportError:
+    import metrics
+    from ingest_manifest import IngestManifest, carry_forward
+    from jsonl_index import SHARD_MODES, parse_shard, shard_files, shard_path
+
 import argparse
 
 
@@ -48,43 +60,160 @@ def parse_docx(file_path):
     return text
 
 
-def parse_pdf(file_path):
+def table_to_markdown(data):
+    """
+    将 table.extract() 的二维列表直接渲染为 Markdown 表格（不依赖 pandas）
+    """
+    if len(data) > 1:
+        header, rows = data[0], data[1:]
+    else:
+        header, rows = list(range(len(data[0]))), data
+
+    def cell(value):
+        if value is None:
+            return ""
+        return str(value).replace("|", "\\|").replace("\n", " ").strip()
+
+    header = [cell(v) for v in header]
+    rows = [[cell(v) for v in row] for row in rows]
+
+    # 数值列右对齐，其余左对齐
+    aligns = []
+    for col in range(len(header)):
+        values = [row[col] for row in rows if col < len(row) and row[col]]
+        numeric = bool(values) and all(_is_number(v) for v in values)
+        aligns.append("---:" if numeric else "---")
+
+    lines = [
+        "| " + " | ".join(header) + " |",
+        "| " + " | ".join(aligns) + " |",
+    ]
+    for row in rows:
+        row = row + [""] * (len(header) - len(row))
+        lines.append("| " + " | ".join(row[:len(header)]) + " |")
+    return "\n".join(lines)
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def page_may_have_tables(page):
+    """
+    快速预检：find_tables 默认按矢量线条识别表格，
+    页面上没有足够的水平/垂直线段（或矩形）时可以直接跳过表格提取
+    """
+    get_drawings = getattr(page, "get_cdrawings", page.get_drawings)
+    horizontal = vertical = 0
+    for path in get_drawings():
+        for item in path["items"]:
+            kind = item[0]
+            if kind in ("re", "qu"):
+                horizontal += 2
+                vertical += 2
+            elif kind == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1[1] - p2[1]) < 1:
+                    horizontal += 1
+                elif abs(p1[0] - p2[0]) < 1:
+                    vertical += 1
+            if horizontal >= 2 and vertical >= 2:
+                return True
+    return False
+
+
+def _parse_pdf_pages(file_path, start, end):
+    """
+    解析 PDF 的 [start, end) 页，每个工作进程自行打开文档
+    """
     doc = pymupdf.open(file_path)
     results = []
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        
-        # 提取页面文本
-        text = page.get_text()
-        if text:
-            results.append({
-                "content": f"# 第{page_num+1}页\n{text}",
-                "page": page_num + 1,
-                "is_table": False
-            })
-            
-        # 提取表格
+    for page_num in range(start, end):
+        with metrics.timer("parse_pdf_page_seconds"):
+            _parse_pdf_page(doc[page_num], page_num, results)
+    doc.close()
+    return results
+
+
+def _parse_pdf_page(page, page_num, results):
+    """
+    提取单页的文本和表格，追加到 results
+    """
+    # 提取页面文本
+    text = page.get_text()
+    if text:
+        results.append({
+            "content": f"# 第{page_num+1}页\n{text}",
+            "page": page_num + 1,
+            "is_table": False
+        })
+
+    # 无线条的纯文本页跳过表格提取
+    if not page_may_have_tables(page):
+        metrics.inc("parse_pdf_table_prechecks_skipped_total")
+        return
+
+    # 提取表格
+    with metrics.timer("parse_table_seconds"):
         tables = page.find_tables()
         for table in tables:
             data = table.extract()
             if data:
                 try:
-                    # 尝试将表格转换为Markdown
-                    if len(data) > 1:
-                        df = pd.DataFrame(data[1:], columns=data[0])
-                    else:
-                        df = pd.DataFrame(data)
-                        
-                    markdown_table = df.to_markdown(index=False)
-                    
+                    # 将表格转换为Markdown
+                    markdown_table = table_to_markdown(data)
+
                     results.append({
                         "content": f"[TABLE] Page {page_num+1}\n{markdown_table}",
                         "page": page_num + 1,
                         "is_table": True
                     })
+                    metrics.inc("parse_tables_total")
                 except Exception as e:
                     print(f"Error processing table on page {page_num+1}: {e}")
-                    
+
+
+def _process_pool(workers):
+    """
+    解析用的进程池：用 spawn 启动工作进程。pipeline 调用时父进程已加载 torch（OpenMP 线程）并建立了
+    pymilvus 的 gRPC 连接，fork 这样的多线程进程可能死锁，与 EncodePool 的做法一致
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _parse_pdf_pages_worker(file_path, start, end):
+    """
+    进程池任务：返回页面解析结果和本进程的指标增量
+    """
+    return _parse_pdf_pages(file_path, start, end), metrics.drain()
+
+
+# 每个工作进程至少处理的页数，页数太少时多进程的开销得不偿失
+MIN_PAGES_PER_WORKER = 16
+
+
+def parse_pdf(file_path, workers=1):
+    with pymupdf.open(file_path) as doc:
+        page_count = len(doc)
+
+    workers = min(workers, page_count // MIN_PAGES_PER_WORKER)
+    if workers <= 1:
+        return _parse_pdf_pages(file_path, 0, page_count)
+
+    # 按连续页码区间切分，保证结果顺序与页码一致
+    step = -(-page_count // workers)
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    results = []
+    with _process_pool(workers) as executor:
+        futures = [executor.submit(_parse_pdf_pages_worker, file_path, start, end) for start, end in ranges]
+        for future in futures:
+            pages, snapshot = future.result()
+            results.extend(pages)
+            metrics.merge(snapshot)
     return results
     
 
@@ -99,52 +228,203 @@ PARSER = {
     "txt": parse_txt,
 }
 
-def parse_file(file_path):
+def parse_file(file_path, pdf_workers=1):
     filetype = Path(file_path).suffix.lstrip(".").lower()
     parser = PARSER.get(filetype)
-    if parser:
+    if parser is parse_pdf:
+        return parser(file_path, workers=pdf_workers)
+    elif parser:
         return parser(file_path)
     else:
         raise ValueError(f"不支持的文件类型: {filetype}")
 
 
-def process_directory(input_path, output_path):
-    with open(output_path, "w", encoding="utf-8") as f:
-        for file_path in Path(input_path).iterdir():
-            if file_path.is_file():
-                try:
-                    parsed_data = parse_file(str(file_path))
-                    
-                    # 统一转换为列表格式
-                    if not isinstance(parsed_data, list):
-                        parsed_data = [{"content": parsed_data}]
-                        
-                    for item in parsed_data:
-                        obj = {
-                            "source": str(file_path),
-                            "file_type": file_path.suffix.lstrip(".").lower(),
-                        }
-                        
-                        # 如果是字典（如PDF解析结果），则合并元数据
-                        if isinstance(item, dict):
-                            obj.update(item)
-                        else:
-                            # 字符串内容（其他格式）
-                            obj["content"] = item
-                            
-                        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-                        
-                    print(f"成功解析文件: {file_path}")
-                except Exception as e:
-                    print(f"Error processing {file_path}: {e}")
+def build_records(file_path, parsed_data):
+    """
+    将解析结果统一转换为输出记录列表
+    """
+    file_path = Path(file_path)
+    # 统一转换为列表格式
+    if not isinstance(parsed_data, list):
+        parsed_data = [{"content": parsed_data}]
 
+    records = []
+    for item in parsed_data:
+        obj = {
+            "source": str(file_path),
+            "file_type": file_path.suffix.lstrip(".").lower(),
+        }
 
+        # 如果是字典（如PDF解析结果），则合并元数据
+        if isinstance(item, dict):
+            obj.update(item)
+        else:
+            # 字符串内容（其他格式）
+            obj["content"] = item
 
-if __name__ == "__main__":
+        records.append(obj)
+    return records
+
+
+def _parse_to_records(file_path, pdf_workers=1):
+    """
+    解析单个文件（可在子进程中运行），异常被限制在当前文件内
+    返回 (file_path, records, error)
+    """
+    file_type = Path(file_path).suffix.lstrip(".").lower()
+    try:
+        with metrics.timer("parse_file_seconds", file_type=file_type):
+            records = build_records(file_path, parse_file(file_path, pdf_workers=pdf_workers))
+    except Exception as e:
+        metrics.inc("parse_errors_total", file_type=file_type)
+        return file_path, None, str(e)
+    metrics.inc("parse_files_total", file_type=file_type)
+    metrics.inc("parse_records_total", len(records), file_type=file_type)
+    metrics.inc("parse_bytes_total", os.path.getsize(file_path), file_type=file_type)
+    return file_path, records, None
+
+
+def _parse_worker(file_path, pdf_workers=1):
+    """
+    进程池任务：返回解析结果和本进程的指标增量
+    """
+    return _parse_to_records(file_path, pdf_workers), metrics.drain()
+
+
+def iter_parsed_files(file_paths, workers=1, pdf_workers=1):
+    """
+    按输入顺序逐个产出 (file_path, records, error)
+
+    workers > 1 时使用进程池并行解析，结果按文件顺序流式返回。
+    若某个工作进程异常退出（如段错误），尚未完成的文件会被标记为嫌疑文件，
+    在新的进程池中逐个单独重试，从而只让真正导致崩溃的文件失败。
+    """
+    file_paths = [str(p) for p in file_paths]
+    if workers <= 1:
+        for file_path in file_paths:
+            yield _parse_to_records(file_path, pdf_workers)
+        return
+
+    pending = deque(file_paths)
+    inflight = deque()
+    suspects = set()
+    window = workers * 2
+    executor = _process_pool(workers)
+    try:
+        while pending or inflight:
+            # 填充提交窗口；嫌疑文件必须单独运行
+            while pending and len(inflight) < window:
+                if pending[0] in suspects and inflight:
+                    break
+                file_path = pending.popleft()
+                inflight.append((file_path, executor.submit(_parse_worker, file_path, pdf_workers)))
+                if file_path in suspects:
+                    break
+
+            file_path, future = inflight.popleft()
+            try:
+                result, snapshot = future.result()
+            except BrokenProcessPool as e:
+                executor.shutdown(wait=False)
+                executor = _process_pool(workers)
+                if file_path in suspects:
+                    # 单独运行仍然崩溃，确认是该文件导致的
+                    yield file_path, None, f"worker process crashed: {e}"
+                    continue
+                unfinished = [file_path] + [fp for fp, _ in inflight]
+                inflight.clear()
+                suspects.update(unfinished)
+                pending.extendleft(reversed(unfinished))
+                continue
+            metrics.merge(snapshot)
+            yield result
+    finally:
+        executor.shutdown(wait=True)
+
+
+def process_directory(input_path, output_path, workers=1, pdf_workers=1, manifest_path=None,
+                      shard=None, shard_by="contiguous"):
+    file_paths = sorted(p for p in Path(input_path).iterdir() if p.is_file())
+
+    # 分片模式：只解析分到本分片的文件，输出写入 <output>.shard-i-of-N.jsonl
+    if shard is not None:
+        if manifest_path:
+            raise ValueError("--manifest cannot be combined with --shard")
+        file_paths = shard_files(file_paths, shard, shard_by)
+        output_path = shard_path(output_path, shard)
+        print(f"分片 {shard[0]}/{shard[1]}: {len(file_paths)} 个文件 -> {output_path}")
+
+    # 增量模式：只解析新增或变更的文件，其余沿用上一次的解析结果
+    manifest = None
+    write_path = output_path
+    if manifest_path:
+        manifest = IngestManifest(manifest_path)
+        changed, removed = manifest.refresh(file_paths)
+        print(f"增量模式: {len(changed)} 个文件新增或变更, {len(removed)} 个文件已删除")
+        write_path = f"{output_path}.tmp"
+
+    with open(write_path, "w", encoding="utf-8") as f:
+        if manifest is not None:
+            kept = carry_forward(manifest, "parsed", output_path, f)
+            if Path(output_path).exists():
+                # 上一次没有解析结果的文件（空文件、无法解析）同样已是最新，不在 kept 中
+                file_paths = [p for p in file_paths if not manifest.is_current(str(p), "parsed")]
+            else:
+                file_paths = [p for p in file_paths if str(p) not in kept]
+            print(f"沿用 {len(kept)} 个未变更文件的解析结果")
+
+        for file_path, records, error in iter_parsed_files(file_paths, workers=workers, pdf_workers=pdf_workers):
+            if error is not None:
+                print(f"Error processing {file_path}: {error}")
+                if manifest is not None:
+                    # 同样记入清单（没有解析结果），文件变更前不再重复解析
+                    manifest.mark(file_path, "parsed")
+                continue
+
+            for obj in records:
+                f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+            f.flush()
+            if manifest is not None:
+                manifest.mark(file_path, "parsed")
+
+            print(f"成功解析文件: {file_path}")
+
+    if manifest is not None:
+        os.replace(write_path, output_path)
+        manifest.save()
+
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Intelligent Parser")
     parser.add_argument("--input_dir", type=str, default="data/input", help="Path to input directory")
     parser.add_argument("--output_file", type=str, default="data/output/parsed.jsonl", help="Path to output JSONL file")
+    parser.add_argument("--workers", type=int, default=1, help="Number of parser processes (1 = serial)")
+    parser.add_argument("--pdf_workers", type=int, default=1, help="Number of processes per PDF, split by page ranges")
+    parser.add_argument("--manifest", type=str, default=None, help="Path to ingest manifest; enables incremental parsing")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only parse shard i of N input files (i/N); writes <output>.shard-i-of-N.jsonl")
+    parser.add_argument("--shard_by", type=str, default="contiguous", choices=SHARD_MODES,
+                        help="contiguous: size-balanced ranges of the sorted files; hash: by file path")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="Write per-file/per-page timings as Prometheus text (.prom) or a JSON summary (.json)")
+    parser.add_argument("--profile", type=str, default=None, choices=["cprofile", "pyinstrument"],
+                        help="Profile the parse stage")
+    parser.add_argument("--profile_dir", type=str, default="data/output/profiles")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.shard is not None and args.manifest:
+        parser.error("--manifest cannot be combined with --shard")
+    if args.profile:
+        metrics.configure_profiling(["parse"], args.profile, args.profile_dir)
     
-    process_directory(args.input_dir, args.output_file)
+    with metrics.stage("parse"):
+        process_directory(args.input_dir, args.output_file, workers=args.workers,
+                          pdf_workers=args.pdf_workers, manifest_path=args.manifest,
+                          shard=args.shard, shard_by=args.shard_by)
+    if args.metrics:
+        metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+JSONL 行偏移索引与分片处理
+
+    <file>.offsets.npy - 每个非空行的起始字节偏移（uint64），末尾再加上文件大小；首次需要时构建，
+                         JSONL 的大小或修改时间变化后自动重建。行数为 len - 1，第 i 行可直接 seek 读取
+    --shard i/N        - 各阶段脚本只处理输入的第 i 个分片（0 <= i < N），输出写入 <output>.shard-i-of-N.jsonl，
+                         全部分片完成后用 merge 按分片顺序合并（含 .npy 向量文件）
+                           contiguous - 按字节数大致均分为连续区间，边界对齐到两个源文件之间（默认）
+                           hash       - 按源文件路径的哈希分配，同一源文件总在同一分片
+
+python Scripts/jsonl_index.py count data/output/chunks.jsonl
+python Scripts/jsonl_index.py merge data/output/vectorized.jsonl --shards 4 --quantize int8
+"""
+import argparse
+import json
+import os
+import shutil
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from .ingest_manifest import record_source
+    from .vector_store import NpyVectorWriter, load_vectors, vector_path_for, write_prefix_vectors
+except ImportError:
+    from ingest_manifest import record_source
+    from vector_store import NpyVectorWriter, load_vectors, vector_path_for, write_prefix_vectors
+
+SHARD_MODES = ("contiguous", "hash")
+
+
+def offsets_path_for(jsonl_path):
+    """
+    JSONL 对应的行偏移索引路径（同名 .offsets.npy）
+    """
+    return Path(jsonl_path).with_suffix(".offsets.npy")
+
+
+def build_offsets(jsonl_path):
+    """
+    扫描一遍 JSONL，返回每个非空行的起始偏移，末尾附加文件大小
+    """
+    offsets = []
+    position = 0
+    with open(jsonl_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                offsets.append(position)
+            position += len(line)
+    offsets.append(position)
+    return np.asarray(offsets, dtype=np.uint64)
+
+
+def load_offsets(jsonl_path):
+    """
+    读取行偏移索引；索引不存在或已过期时重新构建并保存
+    """
+    jsonl_path = Path(jsonl_path)
+    index_path = offsets_path_for(jsonl_path)
+    stat = jsonl_path.stat()
+    if index_path.exists() and index_path.stat().st_mtime_ns >= stat.st_mtime_ns:
+        offsets = np.load(index_path)
+        if len(offsets) and int(offsets[-1]) == stat.st_size:
+            return offsets
+    offsets = build_offsets(jsonl_path)
+    tmp_path = index_path.with_name(f"{index_path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, offsets)
+    os.replace(tmp_path, index_path)
+    return offsets
+
+
+def count_lines(jsonl_path):
+    """
+    非空行数（使用行偏移索引，索引建好后为 O(1)）
+    """
+    return len(load_offsets(jsonl_path)) - 1
+
+
+def read_line(jsonl_path, row, offsets=None):
+    """
+    随机读取第 row 个非空行并解析
+    """
+    offsets = load_offsets(jsonl_path) if offsets is None else offsets
+    with open(jsonl_path, "rb") as f:
+        f.seek(int(offsets[row]))
+        return json.loads(f.readline())
+
+
+# ---------- 分片 ----------
+
+def parse_shard(value):
+    """
+    argparse 参数类型："i/N" -> (i, N)
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard like 0/4, got {value!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be in [0, {count}), got {value!r}")
+    return index, count
+
+
+def shard_path(path, shard):
+    """
+    分片输出路径：chunks.jsonl -> chunks.shard-1-of-4.jsonl
+    """
+    path = Path(path)
+    index, count = shard
+    return path.with_name(f"{path.stem}.shard-{index}-of-{count}{path.suffix}")
+
+
+def hash_shard(key, count):
+    """
+    按键（源文件路径）的稳定哈希分配分片，与进程和机器无关
+    """
+    return zlib.crc32(str(key).encode("utf-8")) % count
+
+
+def shard_files(file_paths, shard, shard_by="contiguous"):
+    """
+    从已排序的文件列表中选出第 shard 个分片：contiguous 按文件大小均分为连续区间，hash 按路径哈希
+    """
+    index, count = shard
+    file_paths = list(file_paths)
+    if shard_by == "hash":
+        return [p for p in file_paths if hash_shard(str(p), count) == index]
+    sizes = np.asarray([os.path.getsize(p) for p in file_paths], dtype=np.float64)
+    if not len(sizes) or sizes.sum() == 0:
+        sizes = np.ones(len(file_paths))
+    # 文件归入其字节区间中点所在的分片
+    midpoints = np.cumsum(sizes) - sizes / 2
+    owners = np.minimum((midpoints * count / sizes.sum()).astype(int), count - 1)
+    return [p for p, owner in zip(file_paths, owners) if owner == index]
+
+
+def _aligned_boundary(f, offsets, target):
+    """
+    第一个起始偏移不小于 target 的行，再向后移到源文件切换处，保证同一源文件的记录不被拆到两个分片
+    """
+    rows = len(offsets) - 1
+    row = int(np.searchsorted(offsets[:-1], target))
+    if row == 0 or row >= rows:
+        return row
+    f.seek(int(offsets[row - 1]))
+    previous = record_source(json.loads(f.readline()))
+    while row < rows and record_source(json.loads(f.readline())) == previous:
+        row += 1
+    return row
+
+
+def shard_row_range(jsonl_path, shard):
+    """
+    contiguous 分片对应的行区间 [start, stop)（按非空行计数）
+    """
+    index, count = shard
+    offsets = load_offsets(jsonl_path)
+    total = int(offsets[-1])
+    with open(jsonl_path, "rb") as f:
+        start = _aligned_boundary(f, offsets, total * index / count) if index else 0
+        stop = _aligned_boundary(f, offsets, total * (index + 1) / count) if index + 1 < count else len(offsets) - 1
+    return start, stop
+
+
+def shard_byte_range(jsonl_path, shard):
+    """
+    contiguous 分片对应的字节区间 [start, stop)
+    """
+    offsets = load_offsets(jsonl_path)
+    start, stop = shard_row_range(jsonl_path, shard)
+    return int(offsets[start]), int(offsets[stop])
+
+
+def iter_records(jsonl_path, shard=None, shard_by="contiguous"):
+    """
+    逐行产出 (行号, 记录)；行号为在整个文件中的非空行序号（与 .npy 向量文件的行一致）。
+    shard 不为 None 时只产出该分片的记录
+    """
+    start, stop = 0, None
+    if shard is not None and shard_by == "contiguous":
+        start, stop = shard_row_range(jsonl_path, shard)
+    with open(jsonl_path, "rb") as f:
+        if start:
+            f.seek(int(load_offsets(jsonl_path)[start]))
+        row = start
+        for line in f:
+            if stop is not None and row >= stop:
+                return
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if shard is None or shard_by != "hash" or hash_shard(record_source(item), shard[1]) == shard[0]:
+                yield row, item
+            row += 1
+
+
+def merge_shards(output_path, count, remove=False):
+    """
+    按分片顺序把 <output>.shard-i-of-N.jsonl（及其 .npy 向量文件）合并为 output_path，返回合并的行数
+    """
+    output_path = Path(output_path)
+    shard_paths = [shard_path(output_path, (i, count)) for i in range(count)]
+    missing = [str(p) for p in shard_paths if not p.exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing shard outputs: {', '.join(missing)}")
+
+    rows = [len(build_offsets(p)) - 1 for p in shard_paths]
+    vector_paths = [vector_path_for(p) for p in shard_paths]
+    with_vectors = [p.exists() for p in vector_paths]
+    if any(with_vectors) and not all(v or n == 0 for v, n in zip(with_vectors, rows)):
+        raise ValueError("Some shards have .npy vectors and others do not; re-run them with the same --format")
+
+    tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+    with open(tmp_path, "wb") as out:
+        for path in shard_paths:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+    if any(with_vectors):
+        vector_tmp = vector_path_for(tmp_path)
+        writer = None
+        for path, exists in zip(vector_paths, with_vectors):
+            if not exists:
+                continue
+            vectors = load_vectors(path)
+            if writer is None:
+                writer = NpyVectorWriter(vector_tmp, vectors.shape[1])
+            for i in range(0, len(vectors), 65536):
+                writer.write(vectors[i:i + 65536])
+        writer.close()
+        os.replace(vector_tmp, vector_path_for(output_path))
+    os.replace(tmp_path, output_path)
+    print(f"Merged {count} shards ({sum(rows)} rows) into {output_path}")
+
+    if remove:
+        for path, vector_path in zip(shard_paths, vector_paths):
+            for p in (path, vector_path):
+                if p.exists():
+                    os.remove(p)
+    return sum(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSONL line-offset index and shard merging")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    count = subparsers.add_parser("count", help="Build (or reuse) the offset index and print the number of records")
+    count.add_argument("files", nargs="+")
+    merge = subparsers.add_parser("merge", help="Concatenate <output>.shard-i-of-N outputs (and .npy vectors) in order")
+    merge.add_argument("output", help="Merged output path, e.g. data/output/vectorized.jsonl")
+    merge.add_argument("--shards", type=int, required=True, help="Number of shards N")
+    merge.add_argument("--remove_shards", action="store_true", help="Delete the shard files after merging")
+    merge.add_argument("--quantize", type=str, default=None, choices=["int8", "binary"],
+                       help="Quantize the merged vectors (one calibration for the whole file)")
+    merge.add_argument("--prefix_dims", type=int, nargs="+", default=None,
+                       help="Write renormalized MRL prefixes of the merged vectors")
+    args = parser.parse_args(argv)
+
+    if args.command == "count":
+        for path in args.files:
+            print(f"{path}: {count_lines(path)}")
+        return
+
+    merge_shards(args.output, args.shards, remove=args.remove_shards)
+    if args.quantize or args.prefix_dims:
+        if not vector_path_for(args.output).exists():
+            parser.error("--quantize and --prefix_dims require .npy vectors (embed with --format npy)")
+        if args.quantize:
+            try:
+                from .quantization import quantize_file
+            except ImportError:
+                from quantization import quantize_file
+            quantize_file(args.output, args.quantize)
+        if args.prefix_dims:
+            write_prefix_vectors(args.output, args.prefix_dims)
+
+
+if __name__ == "__main__":
+    main()
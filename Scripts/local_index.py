@@ -0,0 +1,310 @@
+import json
+import re
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 与 import_to_milvus 中 Schema 的字段顺序一致（不含 id）
+FIELDS = ("text", "vector", "source", "page", "content_type")
+
+# 支持 import_to_milvus / retriever 生成的简单表达式：field in [...]、field == value，以 and 连接
+_CLAUSE = re.compile(r'(\w+)\s*(in|==)\s*(\[(?:"(?:[^"\\]|\\.)*"|[^\]"])*\]|"(?:[^"\\]|\\.)*"|-?\d+)')
+
+
+class Hit:
+    __slots__ = ("id", "score", "entity")
+
+    def __init__(self, id, score, entity):
+        self.id = id
+        self.score = score
+        self.entity = entity
+
+
+class LocalIndex:
+    """
+    进程内的 NumPy 向量索引，提供与 pymilvus Collection 相同的 insert/delete/search/flush 接口，
+    可直接传给 import_data 和 Retriever，在没有 Milvus 服务时使用
+
+    - 精确检索：分块矩阵乘法计算内积，逐块合并 top-k
+    - 近似检索：build_ivf() 以球面 k-means 构建倒排表，search 的 param 中 nprobe 控制探测的簇数；
+      未指定 nprobe 时使用 build_ivf 设置的默认值；建表之后新插入的向量作为未索引尾部，仍以精确方式扫描
+    - save()/load()：向量以 .npy 保存，加载时内存映射
+    - vector_type 为 int8/binary 时按量化格式存储（见 quantization.Quantizer），检索时逐块解码后计算；
+      binary 的得分与 Milvus 一致为 HAMMING 距离（越小越相似）
+    - with_text=False 时与不含 text 字段的 Collection 相同（正文在 content_store 中），insert 的批次中没有 text 列
+    """
+
+    def __init__(self, dim: int, name: str = "local_index", auto_id: bool = True, block_size: int = 16384,
+                 vector_type: str = "float", with_text: bool = True):
+        self.dim = dim
+        self.with_text = with_text
+        self.name = name
+        self.schema = SimpleNamespace(auto_id=auto_id)
+        self.block_size = block_size
+        self.vector_type = vector_type
+        self.width = dim // 8 if vector_type == "binary" else dim
+        self.dtype = {"float": np.float32, "int8": np.int8, "binary": np.uint8}[vector_type]
+        self.ids = []
+        self.columns = {field: [] for field in FIELDS if field != "vector" and (with_text or field != "text")}
+        self._vectors = np.empty((0, self.width), dtype=self.dtype)
+        self._pending = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self.centroids = None
+        self.list_offsets = None
+        self.list_rows = None
+        self.ivf_rows = 0
+        self.nprobe = None
+        self.lock = threading.Lock()
+
+    # ---------- 写入 ----------
+
+    def insert(self, entities):
+        # import_data 会从多个线程并发调用 insert
+        with self.lock:
+            self._insert(entities)
+
+    def _insert(self, entities):
+        if not self.schema.auto_id:
+            ids, entities = list(entities[0]), entities[1:]
+        else:
+            ids = list(range(len(self.ids), len(self.ids) + len(entities[0])))
+        if self.with_text:
+            texts, vectors, sources, pages, content_types = entities
+            self.columns["text"].extend(texts)
+        else:
+            vectors, sources, pages, content_types = entities
+        vectors = self._as_array(vectors)
+        self.ids.extend(ids)
+        self.columns["source"].extend(sources)
+        self.columns["page"].extend(pages)
+        self.columns["content_type"].extend(content_types)
+        self._pending.append(vectors)
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(ids), dtype=bool)])
+
+    def delete(self, expr: str):
+        self.deleted |= self._mask(expr)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._vectors = np.concatenate([np.asarray(self._vectors)] + self._pending)
+            self._pending = []
+
+    def load(self):
+        self.flush()
+
+    def _as_array(self, vectors) -> np.ndarray:
+        """
+        接受 ndarray 或 pymilvus 格式（二值向量为每行一个 bytes）的向量
+        """
+        if len(vectors) and isinstance(vectors[0], bytes):
+            vectors = np.frombuffer(b"".join(vectors), dtype=np.uint8)
+        return np.asarray(vectors, dtype=self.dtype).reshape(-1, self.width)
+
+    def _decode(self, vectors) -> np.ndarray:
+        """
+        解码为 float32 矩阵：int8 直接转换（内积只差常数倍），binary 展开为 ±1（内积 = dim - 2 * HAMMING）
+        """
+        vectors = np.asarray(vectors)
+        if self.vector_type == "binary":
+            return np.unpackbits(vectors, axis=-1).astype(np.float32) * 2 - 1
+        return vectors.astype(np.float32, copy=False)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        self.flush()
+        return self._vectors
+
+    @property
+    def num_entities(self) -> int:
+        return int((~self.deleted).sum())
+
+    # ---------- 过滤 ----------
+
+    def _mask(self, expr: Optional[str]) -> np.ndarray:
+        """
+        计算满足表达式的行（True 表示命中）
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        if not expr:
+            return mask
+        clauses = _CLAUSE.findall(expr)
+        if not clauses:
+            raise ValueError(f"Unsupported filter expression: {expr}")
+        for field, op, literal in clauses:
+            value = json.loads(literal)
+            values = set(value) if op == "in" else {value}
+            column = self.ids if field == "id" else self.columns[field]
+            mask &= np.fromiter((v in values for v in column), dtype=bool, count=len(column))
+        return mask
+
+    # ---------- 检索 ----------
+
+    def search(self, data, anns_field: str = "vector", param: Optional[Dict] = None, limit: int = 10,
+               expr: Optional[str] = None, output_fields: Optional[List[str]] = None) -> List[List[Hit]]:
+        queries = self._decode(self._as_array(data))
+        nprobe = (param or {}).get("params", {}).get("nprobe", self.nprobe)
+        valid = ~self.deleted & self._mask(expr)
+        if nprobe and self.centroids is not None:
+            scores, rows = self._search_ivf(queries, limit, nprobe, valid)
+        else:
+            scores, rows = self._search_exact(queries, limit, valid)
+        return [self._hits(s, r, output_fields or []) for s, r in zip(scores, rows)]
+
+    def _hits(self, scores, rows, output_fields):
+        hits = []
+        for score, row in zip(scores, rows):
+            if row < 0:
+                continue
+            entity = {field: self.columns[field][row] for field in output_fields if field in self.columns}
+            if self.vector_type == "binary":
+                score = (self.dim - score) / 2
+            hits.append(Hit(self.ids[row], float(score), entity))
+        return hits
+
+    @staticmethod
+    def _merge_topk(best_scores, best_rows, scores, rows, k):
+        """
+        将新一块的得分与当前 top-k 合并
+        """
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            rows = np.take_along_axis(rows, top, axis=1)
+        order = np.argsort(-scores, axis=1)
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def _search_exact(self, queries, k, valid, start_row=0):
+        vectors = self.vectors
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+        for start in range(start_row, len(vectors), self.block_size):
+            end = min(start + self.block_size, len(vectors))
+            scores = queries @ self._decode(vectors[start:end]).T
+            scores[:, ~valid[start:end]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, end), scores.shape)
+            best_scores, best_rows = self._merge_topk(best_scores, best_rows, scores, rows, k)
+        best_rows = np.where(np.isfinite(best_scores), best_rows, -1)
+        return best_scores, best_rows
+
+    def _search_ivf(self, queries, k, nprobe, valid):
+        vectors = self.vectors
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([
+                self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists
+            ])
+            candidates = candidates[valid[candidates]]
+            scores = self._decode(vectors[candidates]) @ query
+            scores, rows = self._merge_topk(
+                np.full((1, 0), -np.inf, dtype=np.float32), np.full((1, 0), -1, dtype=np.int64),
+                scores[None, :], candidates[None, :], k
+            )
+            all_scores[i, :scores.shape[1]] = scores[0]
+            all_rows[i, :rows.shape[1]] = rows[0]
+
+        # 建表之后插入的向量精确扫描后合并
+        if self.ivf_rows < len(vectors):
+            tail_scores, tail_rows = self._search_exact(queries, k, valid, start_row=self.ivf_rows)
+            all_scores, all_rows = self._merge_topk(all_scores, all_rows, tail_scores, tail_rows, k)
+        all_rows = np.where(np.isfinite(all_scores), all_rows, -1)
+        return all_scores, all_rows
+
+    # ---------- 近似索引 ----------
+
+    def _assign(self, vectors, centroids):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), self.block_size):
+            block = self._decode(vectors[start:start + self.block_size])
+            labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    def build_ivf(self, nlist: int = 1024, iterations: int = 10, sample_size: int = 100000,
+                  nprobe: Optional[int] = None, seed: int = 0):
+        """
+        以球面 k-means 在样本上训练 nlist 个簇中心，并把全部向量分配到倒排表
+        nprobe 为检索时未指定 nprobe 的默认值（None 表示默认精确检索）
+        """
+        vectors = self.vectors
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist, len(vectors))
+        sample = self._decode(vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.maximum(norms, 1e-12))
+
+        labels = self._assign(vectors, centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.list_rows = np.argsort(labels, kind="stable").astype(np.int64)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))]).astype(np.int64)
+        self.ivf_rows = len(vectors)
+        self.nprobe = nprobe
+
+    # ---------- 持久化 ----------
+
+    def save(self, directory: str):
+        """
+        保存到目录：向量与倒排表为 .npy，其余字段为 JSONL；已删除的行在保存时被压缩掉
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        keep = np.flatnonzero(~self.deleted)
+        np.save(directory / "vectors.npy", np.asarray(self.vectors[keep]))
+        with open(directory / "metadata.jsonl", "w", encoding="utf-8") as f:
+            for row in keep:
+                item = {"id": self.ids[row], **{field: self.columns[field][row] for field in self.columns}}
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+        meta = {"dim": self.dim, "name": self.name, "auto_id": self.schema.auto_id, "vector_type": self.vector_type,
+                "with_text": self.with_text, "ivf_rows": 0, "nprobe": self.nprobe}
+        if self.centroids is not None:
+            # 倒排表中去掉已删除的行，并把行号映射到压缩后的位置
+            new_rows = np.cumsum(~self.deleted) - 1
+            list_rows = np.asarray(self.list_rows)
+            alive = ~self.deleted[list_rows]
+            labels = np.repeat(np.arange(len(self.centroids)), np.diff(self.list_offsets))[alive]
+            np.save(directory / "centroids.npy", self.centroids)
+            np.save(directory / "list_rows.npy", new_rows[list_rows[alive]])
+            np.save(directory / "list_offsets.npy",
+                    np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(self.centroids)))]).astype(np.int64))
+            meta["ivf_rows"] = int(alive.sum())
+        with open(directory / "index.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load_from(cls, directory: str, mmap: bool = True) -> "LocalIndex":
+        directory = Path(directory)
+        with open(directory / "index.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(meta["dim"], name=meta["name"], auto_id=meta["auto_id"], vector_type=meta.get("vector_type", "float"),
+                    with_text=meta.get("with_text", True))
+        with open(directory / "metadata.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                index.ids.append(item["id"])
+                for field in index.columns:
+                    index.columns[field].append(item[field])
+        index._vectors = np.load(directory / "vectors.npy", mmap_mode="r" if mmap else None)
+        index.deleted = np.zeros(len(index.ids), dtype=bool)
+        if meta["ivf_rows"]:
+            index.centroids = np.load(directory / "centroids.npy")
+            index.list_rows = np.load(directory / "list_rows.npy", mmap_mode="r" if mmap else None)
+            index.list_offsets = np.load(directory / "list_offsets.npy")
+            index.ivf_rows = meta["ivf_rows"]
+            index.nprobe = meta.get("nprobe")
+        return index
@@ -0,0 +1,350 @@
+"""
+流水线共享的指标与热点追踪
+
+    计数器  inc("parse_records_total", 3, file_type="pdf")
+    观测值  observe("chunk_size_chars", len(text), content_type="code")
+            observe_many("chunk_size_chars", sizes, content_type="text")
+    计时器  with timer("parse_file_seconds", file_type="pdf"): ...
+    阶段    with stage("parse"): ...   # 记录阶段耗时，并按 configure_profiling 的设置做 cProfile / pyinstrument 采样
+
+观测值（含计时器）按序列保存 count/sum/min/max 和一个固定大小的蓄水池样本用于估计分位数，
+export(path) 按后缀写出 Prometheus 文本文件（.prom / .txt，可交给 node_exporter 的 textfile collector）或 JSON 汇总。
+
+指标保存在进程内的全局注册表中；进程池中的任务在返回前调用 drain() 取走本进程的增量，
+由主进程 merge() 合并，串行运行时 drain() 返回 None，指标直接留在主进程中。
+"""
+import json
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# 每个序列保留的样本数，用于估计分位数
+RESERVOIR_SIZE = 4096
+QUANTILES = (0.5, 0.9, 0.99)
+# Prometheus 指标名前缀
+PREFIX = "rag_"
+
+
+class Summary:
+    """
+    单个观测序列的汇总：count/sum/min/max 与蓄水池样本
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.samples = []
+
+    def add(self, value, rng):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            i = rng.randrange(self.count)
+            if i < RESERVOIR_SIZE:
+                self.samples[i] = value
+
+    def add_many(self, values, rng):
+        """
+        与逐个调用 add 等价的批量版本
+        """
+        values = list(values)
+        if not values:
+            return
+        self.sum += sum(values)
+        self.min = min(self.min, min(values))
+        self.max = max(self.max, max(values))
+        room = max(RESERVOIR_SIZE - len(self.samples), 0)
+        self.samples.extend(values[:room])
+        count = self.count + min(room, len(values))
+        for value in values[room:]:
+            count += 1
+            i = rng.randrange(count)
+            if i < RESERVOIR_SIZE:
+                self.samples[i] = value
+        self.count = count
+
+    def merge(self, other, rng):
+        if not other["count"]:
+            return
+        total = self.count + other["count"]
+        samples = self.samples + other["samples"]
+        if len(samples) > RESERVOIR_SIZE:
+            # 按两边的观测数加权抽样，近似合并后的分布
+            weights = [self.count / len(self.samples)] * len(self.samples) + \
+                      [other["count"] / len(other["samples"])] * len(other["samples"])
+            samples = rng.choices(samples, weights=weights, k=RESERVOIR_SIZE)
+        self.count = total
+        self.sum += other["sum"]
+        self.min = min(self.min, other["min"])
+        self.max = max(self.max, other["max"])
+        self.samples = samples
+
+    def to_dict(self):
+        result = {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "mean": self.sum / self.count if self.count else None,
+        }
+        ordered = sorted(self.samples)
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+        return result
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """
+    线程安全的指标注册表，序列由 (指标名, 标签) 唯一确定
+    """
+
+    def __init__(self, seed=0):
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.counters = {}
+        self.summaries = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary()
+            summary.add(value, self._rng)
+
+    def observe_many(self, name, values, **labels):
+        """
+        一次记录同一序列的多个观测值，热点路径上避免逐个取锁和构造键
+        """
+        key = _key(name, labels)
+        with self._lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary()
+            summary.add_many(values, self._rng)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        以秒为单位观测 with 块的耗时（抛出异常时同样记录）
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _snapshot(self):
+        return {
+            "counters": list(self.counters.items()),
+            "summaries": [(key, {"count": s.count, "sum": s.sum, "min": s.min, "max": s.max,
+                                 "samples": list(s.samples)}) for key, s in self.summaries.items()],
+        }
+
+    def snapshot(self):
+        """
+        返回可 pickle 的指标快照
+        """
+        with self._lock:
+            return self._snapshot()
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.summaries.clear()
+
+    def drain(self):
+        """
+        取走并清空当前指标（进程池任务返回前调用），返回快照
+        """
+        with self._lock:
+            snapshot = self._snapshot()
+            self.counters.clear()
+            self.summaries.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        合并 snapshot()/drain() 的结果；snapshot 为 None 时不做任何事
+        """
+        if snapshot is None:
+            return
+        with self._lock:
+            for key, value in snapshot["counters"]:
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in snapshot["summaries"]:
+                summary = self.summaries.get(key)
+                if summary is None:
+                    summary = self.summaries[key] = Summary()
+                summary.merge(other, self._rng)
+
+    def to_dict(self):
+        """
+        JSON 汇总：{"counters": [...], "summaries": [...]}，每项包含 name、labels 和数值
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            summaries = [{"name": name, "labels": dict(labels), **summary.to_dict()}
+                         for (name, labels), summary in sorted(self.summaries.items())]
+        return {"counters": counters, "summaries": summaries}
+
+    def to_prometheus(self):
+        """
+        渲染为 Prometheus 文本格式：计数器为 counter，观测值为带分位数的 summary
+        """
+        data = self.to_dict()
+        lines = []
+        declared = set()
+
+        def labels_text(labels, extra=None):
+            items = list(labels.items()) + (list(extra.items()) if extra else [])
+            if not items:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in items)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+        for counter in data["counters"]:
+            name = PREFIX + counter["name"]
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{labels_text(counter['labels'])} {counter['value']}")
+        for summary in data["summaries"]:
+            name = PREFIX + summary["name"]
+            if name not in declared:
+                lines.append(f"# TYPE {name} summary")
+                declared.add(name)
+            for q in QUANTILES:
+                value = summary[f"p{round(q * 100)}"]
+                if value is not None:
+                    lines.append(f"{name}{labels_text(summary['labels'], {'quantile': q})} {value}")
+            lines.append(f"{name}_sum{labels_text(summary['labels'])} {summary['sum']}")
+            lines.append(f"{name}_count{labels_text(summary['labels'])} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """
+        按后缀写出指标：.prom / .txt 为 Prometheus 文本格式，其余为 JSON；先写临时文件再替换
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix in (".prom", ".txt"):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        print(f"Metrics written to {path}")
+
+
+# 进程内全局注册表
+METRICS = Metrics()
+
+inc = METRICS.inc
+observe = METRICS.observe
+observe_many = METRICS.observe_many
+timer = METRICS.timer
+export = METRICS.export
+merge = METRICS.merge
+
+
+def drain():
+    """
+    在进程池的工作进程中取走本进程的指标增量；在主进程中返回 None（指标留在原处）
+    """
+    if multiprocessing.parent_process() is None:
+        return None
+    return METRICS.drain()
+
+
+# 需要采样的阶段：{阶段名: (采样器, 输出目录)}
+_PROFILE = {}
+
+
+def configure_profiling(stages, profiler="cprofile", output_dir="data/output/profiles"):
+    """
+    对指定阶段启用性能采样；profiler 为 cprofile 或 pyinstrument（需另外安装）
+    """
+    if profiler not in ("cprofile", "pyinstrument"):
+        raise ValueError(f"Unknown profiler: {profiler}")
+    if profiler == "pyinstrument":
+        try:
+            import pyinstrument  # noqa: F401
+        except ImportError:
+            raise ImportError("pyinstrument is not installed; run `pip install .[profile]` or use cprofile") from None
+    for name in stages or ():
+        _PROFILE[name] = (profiler, output_dir)
+
+
+@contextmanager
+def profile(name, profiler="cprofile", output_dir="data/output/profiles"):
+    """
+    对 with 块做性能采样：cprofile 写出 <name>.prof（可用 snakeviz 查看）并打印累计耗时前 20 的函数，
+    pyinstrument 写出 <name>.html
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        sampler = Profiler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            path = output_dir / f"{name}.html"
+            path.write_text(sampler.output_html(), encoding="utf-8")
+            print(f"Profile of stage '{name}' written to {path}")
+        return
+
+    import cProfile
+    import pstats
+
+    sampler = cProfile.Profile()
+    sampler.enable()
+    try:
+        yield
+    finally:
+        sampler.disable()
+        path = output_dir / f"{name}.prof"
+        sampler.dump_stats(path)
+        print(f"Profile of stage '{name}' written to {path}")
+        pstats.Stats(sampler).sort_stats("cumulative").print_stats(20)
+
+
+@contextmanager
+def stage(name):
+    """
+    记录阶段耗时（stage_seconds{stage=name}）；该阶段由 configure_profiling 启用采样时同时做性能采样
+    """
+    with timer("stage_seconds", stage=name):
+        if name in _PROFILE:
+            profiler, output_dir = _PROFILE[name]
+            with profile(name, profiler, output_dir):
+                yield
+        else:
+            yield
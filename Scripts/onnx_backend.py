@@ -0,0 +1,235 @@
+"""
+EmbeddingClient 的 ONNX Runtime 推理后端（CPU）
+
+首次使用时把 SentenceTransformer 的完整前向（Transformer、Pooling 等全部模块）导出为 ONNX，可选地做动态 int8 量化，
+产物按 模型名 + 权重指纹 缓存在 cache_dir 下，之后直接加载。分词仍使用 SentenceTransformer 自带的分词器，
+输出与 model.encode(normalize_embeddings=False) 相同的句向量，MRL 截断和归一化由 EmbeddingClient 照常处理。
+
+检查与 torch 输出的一致性（余弦相似度低于 --min_cosine 时以非零状态退出）：
+python Scripts/onnx_backend.py --model fangxq/XYZ-embedding --quantize --input data/output/chunks.jsonl --limit 1000
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+DEFAULT_CACHE_DIR = "data/cache/onnx"
+OPSET_VERSION = 17
+# ONNX 图的输入（按此顺序取 SentenceTransformer 分词结果中存在的字段）
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def preprocess(model, texts):
+    """
+    用 SentenceTransformer 的分词器处理文本（新版本为 preprocess，旧版本为 tokenize）
+    """
+    tokenize = getattr(model, "preprocess", None) or model.tokenize
+    return tokenize(texts)
+
+
+def _sentence_embedding_module(model, input_names, constants):
+    """
+    导出用的包装：以位置参数接收分词张量，返回 sentence_embedding
+    （torch 只在导出时导入，embedding_client 导入本模块时不加载 torch）
+    """
+    import torch
+
+    class SentenceEmbedding(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+            # 分词结果中的非张量字段（如新版本的 modality），导出时作为常量传入
+            self.constants = constants
+
+        def forward(self, *inputs):
+            features = dict(zip(input_names, inputs))
+            features.update(self.constants)
+            return self.model(features)["sentence_embedding"]
+
+    return SentenceEmbedding()
+
+
+def model_fingerprint(model):
+    """
+    模型权重的 sha256，权重变化（如模型更新）时缓存的 ONNX 产物随之失效
+    """
+    digest = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    digest.update(str(model.max_seq_length).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def artifact_dir(model, model_name, cache_dir=DEFAULT_CACHE_DIR):
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(model_name)).strip("_")[-64:]
+    return Path(cache_dir) / f"{safe_name}-{model_fingerprint(model)[:16]}"
+
+
+def export_onnx(model, model_name, cache_dir=DEFAULT_CACHE_DIR, quantize=False):
+    """
+    导出（或复用已缓存的）ONNX 模型，返回模型文件路径；quantize=True 时返回动态 int8 量化后的模型
+    """
+    import torch
+
+    directory = artifact_dir(model, model_name, cache_dir)
+    fp32_path = directory / "model.onnx"
+    int8_path = directory / "model.int8.onnx"
+    directory.mkdir(parents=True, exist_ok=True)
+
+    if not fp32_path.exists():
+        print(f"Exporting {model_name} to {fp32_path}...")
+        start = time.perf_counter()
+        sample = preprocess(model, ["ONNX export sample", "导出样例文本"])
+        input_names = [name for name in INPUT_NAMES if name in sample]
+        constants = {k: v for k, v in sample.items() if not isinstance(v, torch.Tensor)}
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["sentence_embedding"] = {0: "batch"}
+        wrapper = _sentence_embedding_module(model, input_names, constants).eval()
+        kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            # 基于 TorchScript 的导出器支持 dynamic_axes，且不依赖 onnxscript
+            kwargs["dynamo"] = False
+        tmp_path = directory / "model.onnx.tmp"
+        was_training = model.training
+        model.eval()
+        with warnings.catch_warnings(), torch.no_grad():
+            warnings.simplefilter("ignore")
+            torch.onnx.export(wrapper, tuple(sample[name].cpu() for name in input_names), str(tmp_path),
+                              input_names=input_names, output_names=["sentence_embedding"],
+                              dynamic_axes=dynamic_axes, opset_version=OPSET_VERSION, **kwargs)
+        model.train(was_training)
+        os.replace(tmp_path, fp32_path)
+        with open(directory / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"model_name": str(model_name), "input_names": input_names, "opset": OPSET_VERSION,
+                       "torch": torch.__version__}, f, indent=2)
+        print(f"Exported in {time.perf_counter() - start:.1f}s.")
+
+    if not quantize:
+        return fp32_path
+    if not int8_path.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"Quantizing {fp32_path} to int8...")
+        tmp_path = directory / "model.int8.onnx.tmp"
+        quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+class OnnxEncoder:
+    """
+    用 ONNX Runtime（CPUExecutionProvider）计算 SentenceTransformer 的句向量
+
+    model 为已加载的 SentenceTransformer，用于分词和首次导出；threads 为 ONNX Runtime 的算子内线程数（默认全部核）
+    """
+
+    def __init__(self, model, model_name, cache_dir=DEFAULT_CACHE_DIR, quantize=False, threads=None):
+        import onnxruntime as ort
+
+        self.model = model
+        self.path = export_onnx(model, model_name, cache_dir, quantize)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(self.path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        print(f"Loaded ONNX model {self.path}")
+
+    def encode_batch(self, texts):
+        """
+        编码一批文本（批内 padding 到最长的一条），返回未归一化的 float32 向量
+        """
+        features = preprocess(self.model, texts)
+        inputs = {name: features[name].cpu().numpy() for name in self.input_names}
+        start = time.perf_counter()
+        embeddings = self.session.run(None, inputs)[0]
+        elapsed = time.perf_counter() - start
+
+        mask = inputs["attention_mask"]
+        tokens = int(mask.sum())
+        metrics.observe("encode_batch_seconds", elapsed)
+        metrics.observe("encode_batch_size", len(texts))
+        metrics.inc("encode_tokens_total", tokens)
+        metrics.inc("encode_padded_tokens_total", mask.size)
+        if elapsed > 0:
+            metrics.observe("encode_batch_tokens_per_second", tokens / elapsed)
+        return embeddings.astype(np.float32, copy=False)
+
+    def encode(self, texts, batch_size=32, batches=None):
+        """
+        按 batches（texts 的下标列表；默认按字符长度降序每 batch_size 条一批）编码，返回与 texts 顺序一致的向量
+        """
+        if batches is None:
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+            batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        embeddings = None
+        for batch in batches:
+            batch_embeddings = self.encode_batch([texts[i] for i in batch])
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+            embeddings[batch] = batch_embeddings
+        if embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return embeddings
+
+
+def cosine_parity(reference, candidate):
+    """
+    逐行计算两组向量的余弦相似度
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return (reference * candidate).sum(axis=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a model to ONNX and check parity with the torch output")
+    parser.add_argument("--model", type=str, default="fangxq/XYZ-embedding")
+    parser.add_argument("--input", type=str, default="data/output/chunks.jsonl", help="Chunks JSONL to compare on")
+    parser.add_argument("--limit", type=int, default=1000, help="Only use the first N chunks")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--quantize", action="store_true", help="Check the dynamic int8 model instead of fp32")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--min_cosine", type=float, default=None,
+                        help="Fail below this cosine similarity (default: 0.9999 for fp32, 0.99 for int8)")
+    args = parser.parse_args(argv)
+
+    from sentence_transformers import SentenceTransformer
+
+    texts = []
+    with open(args.input, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                texts.append(json.loads(line)["text"])
+            if len(texts) >= args.limit:
+                break
+
+    model = SentenceTransformer(args.model, device="cpu")
+    encoder = OnnxEncoder(model, args.model, args.cache_dir, quantize=args.quantize)
+    reference = model.encode(texts, batch_size=args.batch_size, normalize_embeddings=False, show_progress_bar=False)
+    cosine = cosine_parity(reference, encoder.encode(texts, args.batch_size))
+    min_cosine = args.min_cosine or (0.99 if args.quantize else 0.9999)
+    print(f"{len(texts)} texts, cosine vs torch: min={cosine.min():.6f}, mean={cosine.mean():.6f}, "
+          f"p1={np.percentile(cosine, 1):.6f}")
+    if cosine.min() < min_cosine:
+        print(f"Parity check failed: min cosine {cosine.min():.6f} < {min_cosine}")
+        sys.exit(1)
+    print("Parity check passed.")
+
+
+if __name__ == "__main__":
+    main()
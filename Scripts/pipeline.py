@@ -0,0 +1,351 @@
+"""
+流式流水线：在一个进程内串起 解析 → 分块 → 编码 → 写入 Milvus，阶段之间通过有界队列传递数据，
+不再把整个语料依次序列化成 parsed.jsonl / chunks.jsonl / vectorized.jsonl 再读回。
+
+    解析线程 - iter_parsed_files（workers > 1 时使用进程池）逐个文件解析，随即分块（--dedup 时去重）放入分块队列
+    主线程   - 从分块队列凑批编码：凑满 window 条，或队列暂时为空时立即编码已有的分块，降低首批延迟
+    插入线程 - insert_workers 个线程并发写入 Collection
+
+队列有界，下游变慢时上游阻塞，内存占用与语料规模无关。Collection 在写入前加载，第一批分块写入后即可检索。
+--keep_intermediate 时仍按各阶段脚本的格式写出中间文件（向量为 npy 格式），便于排查。
+
+pipeline run --input_dir data/input --collection rag_collection --uri ./milvus.db
+python Scripts/pipeline.py run --input_dir data/input --workers 4 --keep_intermediate data/output
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+try:
+    from . import metrics
+    from .content_store import ContentStoreWriter
+    from .advanced_chunker import iter_chunks
+    from .dedup import Deduplicator, print_report
+    from .embedding_client import EmbeddingClient
+    from .embedding_server import RemoteEmbeddingClient
+    from .import_to_milvus import (
+        DEFAULT_INDEX_PARAMS,
+        DEFAULT_INDEX_TYPE,
+        connect_milvus,
+        create_collection,
+        insert_with_retry,
+        items_to_batch,
+        make_index_params,
+        offload_text,
+    )
+    from .intelligent_parser import iter_parsed_files
+    from .vector_store import NpyVectorWriter, vector_path_for
+except ImportError:
+    import metrics
+    from content_store import ContentStoreWriter
+    from advanced_chunker import iter_chunks
+    from dedup import Deduplicator, print_report
+    from embedding_client import EmbeddingClient
+    from embedding_server import RemoteEmbeddingClient
+    from import_to_milvus import (
+        DEFAULT_INDEX_PARAMS,
+        DEFAULT_INDEX_TYPE,
+        connect_milvus,
+        create_collection,
+        insert_with_retry,
+        items_to_batch,
+        make_index_params,
+        offload_text,
+    )
+    from intelligent_parser import iter_parsed_files
+    from vector_store import NpyVectorWriter, vector_path_for
+
+# 分块队列结束标记
+_DONE = object()
+
+
+class IntermediateWriter:
+    """
+    按各阶段脚本的输出格式写出中间结果：parsed.jsonl、chunks.jsonl、vectorized.jsonl + vectorized.npy
+    """
+
+    def __init__(self, output_dir):
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.parsed = open(output_dir / "parsed.jsonl", "w", encoding="utf-8")
+        self.chunks = open(output_dir / "chunks.jsonl", "w", encoding="utf-8")
+        self.vectorized_path = output_dir / "vectorized.jsonl"
+        self.vectorized = open(self.vectorized_path, "w", encoding="utf-8")
+        self.vector_writer = None
+
+    def write_records(self, records):
+        for obj in records:
+            self.parsed.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+    def write_chunks(self, chunks):
+        for chunk in chunks:
+            self.chunks.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+
+    def write_vectors(self, items, embeddings):
+        if self.vector_writer is None:
+            self.vector_writer = NpyVectorWriter(vector_path_for(self.vectorized_path), embeddings.shape[1])
+        self.vector_writer.write(embeddings)
+        for item in items:
+            self.vectorized.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.parsed.close()
+        self.chunks.close()
+        self.vectorized.close()
+        if self.vector_writer is not None:
+            self.vector_writer.close()
+
+
+def _timed_put(q, item, name):
+    """
+    放入有界队列，记录因下游阻塞（背压）而等待的时间
+    """
+    start = time.perf_counter()
+    q.put(item)
+    metrics.observe("pipeline_put_wait_seconds", time.perf_counter() - start, queue=name)
+
+
+def run_pipeline(input_dir, collection, client, batch_size=32, max_batch_tokens=None, window=256, workers=1,
+                 pdf_workers=1, insert_workers=2, queue_size=8, max_retries=3, with_ids=False, intermediate_dir=None,
+                 deduplicator=None, content_store=None):
+    """
+    对 input_dir 中的全部文件执行 解析 → 分块 → 编码 → 写入，返回统计信息
+
+    collection 只需提供 load/insert/flush 方法（可以是 LocalIndex）；client 为 EmbeddingClient。
+    分块队列最多缓存 queue_size 批（每批至多 window 条）分块，插入队列最多缓存 queue_size 个批次。
+    with_ids=True 时写入 chunk_id 主键（Collection 需以 auto_id=False 创建）。
+    传入 deduplicator（dedup.Deduplicator）时，分块在进入编码前去掉完全重复和近似重复的分块。
+    传入 content_store（content_store.ContentStoreWriter，要求 with_ids=True）时正文写入内容存储，
+    Collection 不含 text 字段；调用方负责 close()。
+    """
+    file_paths = sorted(p for p in Path(input_dir).iterdir() if p.is_file())
+    writer = IntermediateWriter(intermediate_dir) if intermediate_dir else None
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    insert_queue = queue.Queue(maxsize=queue_size)
+    lock = threading.Lock()
+    errors = []
+    source_col = 3 if with_ids else 2
+    if content_store is not None:
+        if not with_ids:
+            raise ValueError("A content store requires with_ids=True")
+        source_col -= 1
+    stats = {"files": 0, "failed_files": 0, "chunks": 0, "rows": 0, "failed_rows": 0, "first_insert_seconds": None}
+    failed_sources = set()
+
+    def producer():
+        try:
+            for file_path, records, error in iter_parsed_files(file_paths, workers=workers, pdf_workers=pdf_workers):
+                if error is not None:
+                    print(f"Error processing {file_path}: {error}")
+                    stats["failed_files"] += 1
+                    continue
+                if writer is not None:
+                    writer.write_records(records)
+                # 同一文件的记录连续送入 iter_chunks，以保持标题上下文
+                piece = []
+                chunks = iter_chunks(records)
+                if deduplicator is not None:
+                    chunks = deduplicator.filter(chunks)
+                for chunk in chunks:
+                    piece.append(chunk)
+                    if len(piece) >= window:
+                        _timed_put(chunk_queue, piece, "chunks")
+                        piece = []
+                if piece:
+                    _timed_put(chunk_queue, piece, "chunks")
+                stats["files"] += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunk_queue.put(_DONE)
+
+    def inserter():
+        while True:
+            entities = insert_queue.get()
+            if entities is None:
+                return
+            rows = len(entities[0])
+            try:
+                insert_with_retry(collection.insert, entities, max_retries=max_retries)
+            except Exception as e:
+                print(f"Batch of {rows} rows failed after {max_retries} retries: {e}")
+                metrics.inc("insert_failed_rows_total", rows)
+                with lock:
+                    stats["failed_rows"] += rows
+                    failed_sources.update(entities[source_col])
+                continue
+            metrics.inc("insert_rows_total", rows)
+            metrics.observe("insert_batch_rows", rows)
+            with lock:
+                stats["rows"] += rows
+                if stats["first_insert_seconds"] is None:
+                    stats["first_insert_seconds"] = time.perf_counter() - start
+                    metrics.observe("pipeline_first_insert_seconds", stats["first_insert_seconds"])
+                    print(f"First {rows} chunks searchable after {stats['first_insert_seconds']:.1f}s")
+
+    # 先加载 Collection，写入的数据随即可以检索
+    collection.load()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=producer, daemon=True)]
+    threads += [threading.Thread(target=inserter, daemon=True) for _ in range(insert_workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        items = []
+        finished = False
+        while not finished or items:
+            if not finished and len(items) < window:
+                # 手上没有分块时阻塞等待；已有分块时不等待，队列为空就先编码已有的分块
+                wait_start = time.perf_counter()
+                try:
+                    piece = chunk_queue.get(block=not items)
+                except queue.Empty:
+                    piece = None
+                if not items:
+                    metrics.observe("pipeline_encode_idle_seconds", time.perf_counter() - wait_start)
+                if piece is _DONE:
+                    finished = True
+                elif piece is not None:
+                    items.extend(piece)
+                    continue
+            if not items:
+                continue
+
+            batch, items = items[:window], items[window:]
+            with metrics.timer("encode_window_seconds"):
+                embeddings = client.encode([item["text"] for item in batch], batch_size=batch_size,
+                                           max_batch_tokens=max_batch_tokens, show_progress_bar=False)
+            metrics.inc("encode_chunks_total", len(batch))
+            stats["chunks"] += len(batch)
+            if writer is not None:
+                writer.write_chunks(batch)
+                writer.write_vectors(batch, embeddings)
+            entities = items_to_batch(batch, embeddings, with_ids=with_ids)
+            if content_store is not None:
+                entities = offload_text(entities, content_store)
+            _timed_put(insert_queue, entities, "insert")
+    finally:
+        for _ in range(insert_workers):
+            insert_queue.put(None)
+        for thread in threads[1:]:
+            thread.join()
+        if writer is not None:
+            writer.close()
+    threads[0].join()
+    if errors:
+        raise errors[0]
+
+    collection.flush()
+    stats["seconds"] = time.perf_counter() - start
+    print(f"Pipeline finished: {stats['files']} files, {stats['chunks']} chunks, {stats['rows']} rows inserted "
+          f"in {stats['seconds']:.1f}s ({stats['rows'] / stats['seconds']:.0f} rows/s).")
+    if stats["failed_files"]:
+        print(f"Failed to parse {stats['failed_files']} files.")
+    if stats["failed_rows"]:
+        print(f"Failed to insert {stats['failed_rows']} rows from {len(failed_sources)} sources.")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming RAG pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="Parse, chunk, embed and insert a directory in one streaming pass")
+    run.add_argument("--input_dir", type=str, default="data/input")
+    run.add_argument("--collection", type=str, default="rag_collection")
+    run.add_argument("--host", type=str, default="localhost")
+    run.add_argument("--port", type=str, default="19530")
+    run.add_argument("--uri", type=str, default=None, help="Milvus URI, e.g. a milvus-lite file ./milvus.db")
+    run.add_argument("--index_type", type=str, default=DEFAULT_INDEX_TYPE)
+    run.add_argument("--index_params", type=str, default=json.dumps(DEFAULT_INDEX_PARAMS),
+                     help="Index build parameters as JSON")
+    run.add_argument("--chunk_ids", action="store_true",
+                     help="Use deterministic chunk ids as primary keys so later runs can use import_to_milvus --upsert")
+    run.add_argument("--content_store", type=str, default=None,
+                     help="Keep chunk text out of Milvus in this local zstd content store (rebuilt each run); implies --chunk_ids")
+    run.add_argument("--model", type=str, default="fangxq/XYZ-embedding", help="Model name")
+    run.add_argument("--truncate_dim", type=int, default=768, help="Dimension to truncate embeddings to")
+    run.add_argument("--cache", type=str, default=None, help="Path to SQLite embedding cache")
+    run.add_argument("--batch_size", type=int, default=32, help="Batch size for encoding")
+    run.add_argument("--max_batch_tokens", type=int, default=None,
+                     help="Build length-sorted batches under this token budget instead of a fixed batch size")
+    run.add_argument("--encode_workers", type=int, default=1,
+                     help="Encode in this many CPU processes, each with its own model copy (1 = in-process)")
+    run.add_argument("--threads_per_worker", type=int, default=None,
+                     help="Torch (or ONNX Runtime) threads per encode process (default: CPU cores / encode_workers)")
+    run.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx"],
+                     help="onnx: export the model once and encode with ONNX Runtime on the CPU")
+    run.add_argument("--onnx_quantize", action="store_true", help="Use a dynamically int8-quantized ONNX model")
+    run.add_argument("--onnx_dir", type=str, default="data/cache/onnx", help="Directory for exported ONNX models")
+    run.add_argument("--server", type=str, default=None,
+                     help="Encode with a running embedding server (http://host:port or unix:/path) instead of loading the model")
+    run.add_argument("--window", type=int, default=256,
+                     help="Maximum chunks per encode call and insert batch; smaller windows reach the index sooner")
+    run.add_argument("--workers", type=int, default=1, help="Number of parser processes (1 = parse in a thread)")
+    run.add_argument("--pdf_workers", type=int, default=1, help="Number of processes per PDF, split by page ranges")
+    run.add_argument("--insert_workers", type=int, default=2, help="Number of concurrent insert threads")
+    run.add_argument("--queue_size", type=int, default=8, help="Capacity of the chunk and insert queues, in batches")
+    run.add_argument("--max_retries", type=int, default=3, help="Retries per failed insert batch")
+    run.add_argument("--dedup", action="store_true", help="Drop exact and near-duplicate chunks before encoding")
+    run.add_argument("--dedup_threshold", type=float, default=0.9,
+                     help="Jaccard similarity above which chunks are near duplicates")
+    run.add_argument("--dedup_log", type=str, default="data/output/chunks.dups.jsonl",
+                     help="Where to record dropped chunks and their canonical chunk")
+    run.add_argument("--keep_intermediate", type=str, default=None,
+                     help="Also write parsed.jsonl, chunks.jsonl and vectorized.jsonl (+ .npy) to this directory")
+    run.add_argument("--metrics", type=str, default=None,
+                     help="Write stage metrics as Prometheus text (.prom) or JSON (.json)")
+    run.add_argument("--profile", type=str, default=None, choices=["cprofile", "pyinstrument"],
+                     help="Profile the whole pipeline run")
+    run.add_argument("--profile_dir", type=str, default="data/output/profiles")
+
+    args = parser.parse_args(argv)
+    if args.profile:
+        metrics.configure_profiling(["pipeline"], args.profile, args.profile_dir)
+
+    client = None
+    deduplicator = None
+    content_store = None
+    with_ids = args.chunk_ids or args.content_store is not None
+    try:
+        if args.server:
+            client = RemoteEmbeddingClient(args.server)
+        else:
+            client = EmbeddingClient(model_name=args.model, truncate_dim=args.truncate_dim, cache_path=args.cache,
+                                     workers=args.encode_workers, threads_per_worker=args.threads_per_worker,
+                                     backend=args.backend, onnx_quantize=args.onnx_quantize, onnx_dir=args.onnx_dir)
+        dim = client.embedding_dim()
+        connect_milvus(args.host, args.port, args.uri)
+        index_params = make_index_params(args.index_type, json.loads(args.index_params))
+        collection = create_collection(args.collection, dim, index_params=index_params, auto_id=not with_ids,
+                                       with_text=args.content_store is None)
+        if args.content_store:
+            content_store = ContentStoreWriter(args.content_store, append=False)
+        if args.dedup:
+            deduplicator = Deduplicator(threshold=args.dedup_threshold, log_path=args.dedup_log)
+        with metrics.stage("pipeline"):
+            run_pipeline(args.input_dir, collection, client, batch_size=args.batch_size,
+                         max_batch_tokens=args.max_batch_tokens, window=args.window, workers=args.workers,
+                         pdf_workers=args.pdf_workers, insert_workers=args.insert_workers, queue_size=args.queue_size,
+                         max_retries=args.max_retries, with_ids=with_ids, intermediate_dir=args.keep_intermediate,
+                         deduplicator=deduplicator, content_store=content_store)
+        if deduplicator is not None:
+            print_report(deduplicator.report(dim))
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        if client is not None:
+            client.close()
+        if deduplicator is not None:
+            deduplicator.close()
+        if content_store is not None:
+            content_store.close()
+        if args.metrics:
+            metrics.export(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+try:
+    from .vector_store import load_vectors, vector_path_for
+except ImportError:
+    from vector_store import load_vectors, vector_path_for
+
+# float 为原始 float32 向量；int8 为标量量化；binary 为按阈值二值化后按位打包
+VECTOR_TYPES = ("float", "int8", "binary")
+
+
+def quantized_path_for(jsonl_path, vector_type):
+    """
+    元数据 JSONL 对应的量化向量文件路径，如 vectorized.int8.npy
+    """
+    return Path(jsonl_path).with_suffix(f".{vector_type}.npy")
+
+
+def calibration_path_for(jsonl_path, vector_type):
+    return Path(jsonl_path).with_suffix(f".{vector_type}.json")
+
+
+class Quantizer:
+    """
+    向量量化器
+
+    - int8：所有维度共用一个缩放系数 scale（校准样本 |v| 的 percentile 分位数），
+      q = clip(round(v * 127 / scale))。共用系数使 int8 内积与原始内积只差一个常数倍，
+      可直接用 IP 度量检索；超出分位数的离群值被截断
+    - binary：v 大于该维阈值记为 1，按位打包为 dim / 8 字节，以 HAMMING 距离检索。
+      阈值取校准样本每一维的中位数：嵌入向量各维的均值通常不为 0，直接按符号二值化时
+      很多位几乎恒为 0 或 1，区分度很低
+    """
+
+    def __init__(self, vector_type: str, dim: int, scale: Optional[float] = None,
+                 thresholds: Optional[np.ndarray] = None):
+        if vector_type not in VECTOR_TYPES:
+            raise ValueError(f"Unknown vector type: {vector_type}")
+        if vector_type == "binary" and dim % 8:
+            raise ValueError(f"Binary vectors require dim to be a multiple of 8, got {dim}")
+        self.vector_type = vector_type
+        self.dim = dim
+        self.scale = scale
+        self.thresholds = None if thresholds is None else np.asarray(thresholds, dtype=np.float32)
+
+    @classmethod
+    def calibrate(cls, vector_type: str, vectors: np.ndarray, percentile: float = 99.9,
+                  sample_size: int = 100000, seed: int = 0) -> "Quantizer":
+        """
+        在向量样本上计算量化所需的校准参数
+        """
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False))
+        sample = np.asarray(vectors[rows], dtype=np.float32)
+        scale = thresholds = None
+        if vector_type == "int8":
+            scale = float(np.percentile(np.abs(sample), percentile)) or 1.0
+        elif vector_type == "binary":
+            thresholds = np.median(sample, axis=0)
+        return cls(vector_type, vectors.shape[1], scale, thresholds)
+
+    @property
+    def metric_type(self) -> str:
+        return "HAMMING" if self.vector_type == "binary" else "IP"
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return {"float": self.dim * 4, "int8": self.dim, "binary": self.dim // 8}[self.vector_type]
+
+    def quantize(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.vector_type == "int8":
+            return np.clip(np.rint(vectors * (127 / self.scale)), -127, 127).astype(np.int8)
+        if self.vector_type == "binary":
+            thresholds = 0 if self.thresholds is None else self.thresholds
+            return np.packbits(vectors > thresholds, axis=-1)
+        return vectors
+
+    def to_milvus(self, vectors: np.ndarray):
+        """
+        转换为 pymilvus 插入/检索接受的格式：BINARY_VECTOR 为每行一个 bytes，INT8_VECTOR 为每行一个 int8 数组
+        """
+        if self.vector_type == "binary":
+            return [row.tobytes() for row in vectors]
+        if self.vector_type == "int8":
+            return list(vectors)
+        return vectors
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "vector_type": self.vector_type,
+                "dim": self.dim,
+                "scale": self.scale,
+                "thresholds": None if self.thresholds is None else self.thresholds.tolist(),
+            }, f)
+
+    @classmethod
+    def load(cls, path) -> "Quantizer":
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["vector_type"], config["dim"], config["scale"], config.get("thresholds"))
+
+
+def quantize_file(input_file, vector_type, recalibrate=False, block_size=65536) -> Quantizer:
+    """
+    将向量文件（元数据 JSONL + float32 .npy）量化为同名的 .<vector_type>.npy，并保存校准参数。
+    已有校准文件时沿用（增量更新时保证新旧向量的量化方式一致），除非 recalibrate=True。
+    float 向量文件保持不变，检索时用于对候选结果重新打分。
+    """
+    vector_path = vector_path_for(input_file)
+    if not vector_path.exists():
+        raise FileNotFoundError(f"Quantization requires float vectors in {vector_path} (embed with --format npy)")
+    vectors = load_vectors(vector_path)
+
+    calibration_path = calibration_path_for(input_file, vector_type)
+    if calibration_path.exists() and not recalibrate:
+        quantizer = Quantizer.load(calibration_path)
+        if quantizer.vector_type != vector_type or quantizer.dim != vectors.shape[1]:
+            raise ValueError(f"{calibration_path} does not match {vector_type} vectors of dim {vectors.shape[1]}")
+        print(f"Using calibration from {calibration_path}")
+    else:
+        quantizer = Quantizer.calibrate(vector_type, vectors)
+        quantizer.save(calibration_path)
+        print(f"Calibrated {vector_type} quantizer on {min(len(vectors), 100000)} sample vectors")
+
+    output_path = quantized_path_for(input_file, vector_type)
+    tmp_path = f"{output_path}.tmp"
+    width = quantizer.dim // 8 if vector_type == "binary" else quantizer.dim
+    dtype = np.uint8 if vector_type == "binary" else np.int8
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(len(vectors), width))
+    for start in range(0, len(vectors), block_size):
+        out[start:start + block_size] = quantizer.quantize(vectors[start:start + block_size])
+    out.flush()
+    del out
+    os.replace(tmp_path, output_path)
+
+    saved = len(vectors) * (quantizer.dim * 4 - quantizer.bytes_per_vector)
+    print(f"Wrote {len(vectors)} {vector_type} vectors to {output_path} "
+          f"({quantizer.bytes_per_vector} bytes/vector, {saved / 1024 / 1024:.1f} MB smaller than float32)")
+    return quantizer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize embedded vectors to int8 or binary")
+    parser.add_argument("--input", type=str, default="data/output/vectorized.jsonl",
+                        help="Vectorized JSONL with a float32 .npy sidecar")
+    parser.add_argument("--vector_type", type=str, required=True, choices=["int8", "binary"])
+    parser.add_argument("--recalibrate", action="store_true", help="Ignore existing calibration data")
+    args = parser.parse_args()
+
+    quantize_file(args.input, args.vector_type, recalibrate=args.recalibrate)
@@ -0,0 +1,414 @@
+import argparse
+import json
+import queue
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from pymilvus import Collection, utility
+
+try:
+    from .content_store import ContentStore
+    from .embedding_client import EmbeddingClient
+    from .embedding_server import RemoteEmbeddingClient
+    from .import_to_milvus import connect_milvus, item_chunk_id
+    from .quantization import Quantizer, calibration_path_for
+    from .vector_store import load_vectors, mrl_prefix, vector_path_for
+except ImportError:
+    from content_store import ContentStore
+    from embedding_client import EmbeddingClient
+    from embedding_server import RemoteEmbeddingClient
+    from import_to_milvus import connect_milvus, item_chunk_id
+    from quantization import Quantizer, calibration_path_for
+    from vector_store import load_vectors, mrl_prefix, vector_path_for
+
+DEFAULT_OUTPUT_FIELDS = ("text", "source", "content_type")
+
+
+def normalize_query(query: str) -> str:
+    """
+    查询文本归一化：NFKC（全角转半角等）并合并空白，作为缓存键和实际编码的文本
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+
+def build_filter(content_type: Union[str, Sequence[str], None] = None,
+                 source: Union[str, Sequence[str], None] = None) -> str:
+    """
+    由 content_type / source 过滤条件生成 Milvus 布尔表达式
+    """
+    clauses = []
+    for field, value in (("content_type", content_type), ("source", source)):
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        clauses.append(f"{field} in {json.dumps(values, ensure_ascii=False)}")
+    return " and ".join(clauses)
+
+
+def collection_fingerprint(collection, use_segments: bool = True) -> tuple:
+    """
+    Collection 内容的指纹：分段 id 与行数，插入、upsert、flush、compaction 后都会变化；
+    不支持查询分段信息时（如 milvus-lite）退化为实体数
+    """
+    if use_segments:
+        infos = utility.get_query_segment_info(collection.name)
+        return tuple(sorted((info.segmentID, info.num_rows) for info in infos))
+    return (collection.num_entities,)
+
+
+def freeze_hits(hits: List[Dict]) -> tuple:
+    """
+    检索结果转为不可变形式存入缓存，调用方修改返回的结果（重排、增删字段）不会影响缓存
+    """
+    return tuple(tuple(hit.items()) for hit in hits)
+
+
+def thaw_hits(frozen: tuple) -> List[Dict]:
+    """
+    由缓存中的不可变结果构造新的 list / dict，每次调用都得到独立的副本
+    """
+    return [dict(hit) for hit in frozen]
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class FloatRescorer:
+    """
+    用磁盘上的 float32 向量（内存映射）对量化索引返回的候选结果重新打分。
+    Collection 主键为 chunk_id，按向量文件中的记录建立 id -> 行号映射。
+    """
+
+    def __init__(self, input_file: str):
+        self.vectors = load_vectors(vector_path_for(input_file))
+        self.rows = {}
+        with open(input_file, "r", encoding="utf-8") as f:
+            row = -1
+            for line in f:
+                if not line.strip():
+                    continue
+                row += 1
+                self.rows[item_chunk_id(json.loads(line))] = row
+
+    def rerank(self, query: np.ndarray, hits: List[Dict], top_k: int) -> List[Dict]:
+        """
+        以 float 内积替换候选结果的得分并重新排序；向量文件中找不到的候选排在最后
+        """
+        rows = [self.rows.get(hit["id"]) for hit in hits]
+        known = [i for i, row in enumerate(rows) if row is not None]
+        scores = np.full(len(hits), -np.inf, dtype=np.float32)
+        if known:
+            order = np.argsort([rows[i] for i in known])
+            sorted_rows = np.asarray([rows[known[i]] for i in order])
+            scores[np.asarray(known)[order]] = np.asarray(self.vectors[sorted_rows]) @ query
+        reranked = []
+        for i in np.argsort(-scores, kind="stable")[:top_k]:
+            reranked.append({**hits[i], "score": float(scores[i])})
+        return reranked
+
+
+class Retriever:
+    """
+    检索接口：用 EmbeddingClient 编码查询，在 Milvus 中做 ANN 检索
+
+    - search_batch：一次调用完成多条查询的编码和检索
+    - search：单条查询；并发调用会在 batch_wait 秒内被合并成一个微批
+    - 查询向量与检索结果分别缓存在 LRU 中，Collection 指纹变化（每 version_ttl 秒检查一次）
+      或调用 invalidate() 时清空结果缓存
+    - 传入 quantizer 时，查询向量按相同方式量化后在 int8/binary Collection 中检索；
+      再传入 rescorer 时先取 top_k * oversample 个候选，用 float 向量重新打分后返回 top_k。
+      二值 Collection 使用 IVF 类索引，检索参数为 nprobe
+    - 传入 coarse_dim 时（MRL 漏斗），以查询向量的前 coarse_dim 维在低维 Collection 中检索候选，
+      再由 rescorer 用全维向量重新打分
+    - 传入 content_store 时（Collection 不含 text 字段），text 不向 Milvus 请求，
+      而是在 ANN 检索（及重新打分）之后按 chunk_id 从本地内容存储批量取回
+    """
+
+    def __init__(self, collection, client, ef: int = 64, top_k: int = 5,
+                 output_fields: Sequence[str] = DEFAULT_OUTPUT_FIELDS,
+                 embedding_cache_size: int = 10000, result_cache_size: int = 10000,
+                 batch_wait: float = 0.005, max_batch: int = 32, version_ttl: float = 5.0,
+                 latency_window: int = 10000, quantizer: Optional[Quantizer] = None,
+                 rescorer: Optional[FloatRescorer] = None, oversample: int = 4, nprobe: int = 16,
+                 coarse_dim: Optional[int] = None, content_store: Optional[ContentStore] = None):
+        self.collection = collection
+        self.content_store = content_store
+        self.client = client
+        self.quantizer = quantizer
+        self.rescorer = rescorer
+        self.oversample = oversample
+        self.nprobe = nprobe
+        self.coarse_dim = coarse_dim
+        self.ef = ef
+        self.top_k = top_k
+        self.output_fields = tuple(output_fields)
+        self.embedding_cache = LRUCache(embedding_cache_size)
+        self.result_cache = LRUCache(result_cache_size)
+        self.batch_wait = batch_wait
+        self.max_batch = max_batch
+        self.version_ttl = version_ttl
+        self.latencies = deque(maxlen=latency_window)
+        self.stats = {"queries": 0, "result_hits": 0, "embedding_hits": 0}
+        self.stats_lock = threading.Lock()
+
+        try:
+            self._use_segments = True
+            self._fingerprint = collection_fingerprint(collection)
+        except Exception:
+            self._use_segments = False
+            self._fingerprint = collection_fingerprint(collection, use_segments=False)
+        self._fingerprint_checked = time.monotonic()
+        self._requests = queue.Queue()
+        self._worker = None
+        if batch_wait > 0:
+            self._worker = threading.Thread(target=self._batch_loop, daemon=True)
+            self._worker.start()
+
+    # ---------- 公共接口 ----------
+
+    def search(self, query: str, top_k: Optional[int] = None, ef: Optional[int] = None,
+               content_type=None, source=None, output_fields: Optional[Sequence[str]] = None) -> List[Dict]:
+        start = time.perf_counter()
+        params = self._params(top_k, ef, content_type, source, output_fields)
+        query = normalize_query(query)
+        self._check_version()
+
+        cached = self.result_cache.get((query, params))
+        if cached is not None:
+            self._record(start, 1, result_hits=1)
+            return thaw_hits(cached)
+
+        if self._worker is None:
+            hits = self._search_many([query], params)[0]
+        else:
+            future = Future()
+            self._requests.put((query, params, future))
+            hits = future.result()
+        self._record(start, 1)
+        return hits
+
+    def search_batch(self, queries: List[str], top_k: Optional[int] = None, ef: Optional[int] = None,
+                     content_type=None, source=None, output_fields: Optional[Sequence[str]] = None) -> List[List[Dict]]:
+        start = time.perf_counter()
+        params = self._params(top_k, ef, content_type, source, output_fields)
+        queries = [normalize_query(q) for q in queries]
+        self._check_version()
+
+        cached = [self.result_cache.get((q, params)) for q in queries]
+        missing = list(dict.fromkeys(q for q, r in zip(queries, cached) if r is None))
+        found = {}
+        if missing:
+            found = dict(zip(missing, map(freeze_hits, self._search_many(missing, params))))
+        # 重复的查询也各自得到独立的结果副本
+        results = [thaw_hits(r if r is not None else found[q]) for q, r in zip(queries, cached)]
+        self._record(start, len(queries), result_hits=len(queries) - len(missing))
+        return results
+
+    def invalidate(self):
+        """
+        Collection 内容变化后清空结果缓存（查询向量与 Collection 无关，无需清空），并重新打开已更新的内容存储
+        """
+        self.result_cache.clear()
+        if self.content_store is not None:
+            self.content_store.refresh()
+
+    def latency_stats(self) -> Dict[str, float]:
+        # 微批线程会并发追加，先在锁内复制，避免迭代时 deque 被修改
+        with self.stats_lock:
+            stats = dict(self.stats)
+            latencies = list(self.latencies)
+        latencies = np.asarray(latencies) * 1000
+        if len(latencies):
+            stats.update(p50_ms=float(np.percentile(latencies, 50)), p99_ms=float(np.percentile(latencies, 99)))
+        return stats
+
+    # ---------- 内部实现 ----------
+
+    def _params(self, top_k, ef, content_type, source, output_fields):
+        return (
+            top_k or self.top_k,
+            ef or self.ef,
+            build_filter(content_type, source),
+            tuple(output_fields) if output_fields is not None else self.output_fields,
+        )
+
+    def _record(self, start, queries, result_hits=0):
+        elapsed = (time.perf_counter() - start) / max(queries, 1)
+        with self.stats_lock:
+            self.stats["queries"] += queries
+            self.stats["result_hits"] += result_hits
+            self.latencies.extend([elapsed] * queries)
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._fingerprint_checked < self.version_ttl:
+            return
+        self._fingerprint_checked = now
+        fingerprint = collection_fingerprint(self.collection, self._use_segments)
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self.invalidate()
+
+    def _embed(self, queries: List[str]) -> np.ndarray:
+        vectors = [self.embedding_cache.get(q) for q in queries]
+        missing = [q for q, v in zip(queries, vectors) if v is None]
+        with self.stats_lock:
+            self.stats["embedding_hits"] += len(queries) - len(missing)
+        if missing:
+            encoded = self.client.encode(missing, show_progress_bar=False)
+            for q, v in zip(missing, encoded):
+                self.embedding_cache.put(q, v)
+            found = dict(zip(missing, encoded))
+            vectors = [v if v is not None else found[q] for q, v in zip(queries, vectors)]
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _search_many(self, queries: List[str], params) -> List[List[Dict]]:
+        top_k, ef, expr, output_fields = params
+        vectors = self._embed(queries)
+        data, metric_type, limit = vectors, "IP", top_k
+        if self.coarse_dim is not None:
+            data = mrl_prefix(vectors, self.coarse_dim)
+        if self.quantizer is not None:
+            data = self.quantizer.to_milvus(self.quantizer.quantize(data))
+            metric_type = self.quantizer.metric_type
+        if self.rescorer is not None:
+            limit = top_k * self.oversample
+        search_params = {"nprobe": self.nprobe} if metric_type == "HAMMING" else {"ef": max(ef, limit)}
+        hydrate = self.content_store is not None and "text" in output_fields
+        milvus_fields = [field for field in output_fields if not (hydrate and field == "text")]
+        results = self.collection.search(
+            data=data,
+            anns_field="vector",
+            param={"metric_type": metric_type, "params": search_params},
+            limit=limit,
+            expr=expr or None,
+            output_fields=milvus_fields
+        )
+        all_hits = []
+        for vector, result in zip(vectors, results):
+            hits = [
+                {"id": hit.id, "score": hit.score, **{field: hit.entity.get(field) for field in milvus_fields}}
+                for hit in result
+            ]
+            if self.rescorer is not None:
+                hits = self.rescorer.rerank(vector, hits, top_k)
+            all_hits.append(hits)
+        if hydrate:
+            # 整个微批的 top-k 一次取回正文
+            self.content_store.hydrate([hit for hits in all_hits for hit in hits])
+        for query, hits in zip(queries, all_hits):
+            self.result_cache.put((query, params), freeze_hits(hits))
+        return all_hits
+
+    def _batch_loop(self):
+        """
+        后台微批线程：收集 batch_wait 秒内（至多 max_batch 条）的单条查询，按参数分组后批量检索
+        """
+        while True:
+            requests = [self._requests.get()]
+            deadline = time.perf_counter() + self.batch_wait
+            while len(requests) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    requests.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for query, params, future in requests:
+                groups.setdefault(params, []).append((query, future))
+            for params, items in groups.items():
+                queries = list(dict.fromkeys(q for q, _ in items))
+                try:
+                    found = dict(zip(queries, map(freeze_hits, self._search_many(queries, params))))
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
+                    continue
+                for query, future in items:
+                    future.set_result(thaw_hits(found[query]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the RAG collection")
+    parser.add_argument("--query", type=str, action="append", required=True, help="Query text (repeatable)")
+    parser.add_argument("--collection", type=str, default="rag_collection")
+    parser.add_argument("--model", type=str, default="fangxq/XYZ-embedding")
+    parser.add_argument("--truncate_dim", type=int, default=768)
+    parser.add_argument("--server", type=str, default=None,
+                        help="Encode queries with a running embedding server (http://host:port or unix:/path)")
+    parser.add_argument("--top_k", type=int, default=5)
+    parser.add_argument("--ef", type=int, default=64)
+    parser.add_argument("--content_type", type=str, action="append", default=None)
+    parser.add_argument("--source", type=str, action="append", default=None)
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=str, default="19530")
+    parser.add_argument("--uri", type=str, default=None)
+    parser.add_argument("--vector_type", type=str, default="float", choices=["float", "int8", "binary"],
+                        help="Vector type the collection was imported with")
+    parser.add_argument("--vectors", type=str, default="data/output/vectorized.jsonl",
+                        help="Vectorized JSONL with the float .npy sidecar and calibration data "
+                             "(quantized or coarse collections)")
+    parser.add_argument("--oversample", type=int, default=4, help="Candidates per result to rescore with float vectors")
+    parser.add_argument("--nprobe", type=int, default=16, help="nprobe for binary (IVF) collections")
+    parser.add_argument("--coarse_dim", type=int, default=None,
+                        help="The collection holds MRL prefixes of this dim; rerank candidates with the full vectors")
+    parser.add_argument("--content_store", type=str, default=None,
+                        help="The collection was imported with --content_store; read chunk text from this directory")
+    args = parser.parse_args()
+
+    connect_milvus(args.host, args.port, args.uri)
+    collection = Collection(args.collection)
+    collection.load()
+    if args.server:
+        client = RemoteEmbeddingClient(args.server)
+    else:
+        client = EmbeddingClient(model_name=args.model, truncate_dim=args.truncate_dim)
+    quantizer = rescorer = None
+    if args.vector_type != "float":
+        quantizer = Quantizer.load(calibration_path_for(args.vectors, args.vector_type))
+    if args.vector_type != "float" or args.coarse_dim:
+        rescorer = FloatRescorer(args.vectors)
+    retriever = Retriever(collection, client, ef=args.ef, top_k=args.top_k, batch_wait=0,
+                          quantizer=quantizer, rescorer=rescorer, oversample=args.oversample, nprobe=args.nprobe,
+                          coarse_dim=args.coarse_dim,
+                          content_store=ContentStore(args.content_store) if args.content_store else None)
+
+    results = retriever.search_batch(args.query, content_type=args.content_type, source=args.source)
+    for query, hits in zip(args.query, results):
+        print(f"Query: {query}")
+        for hit in hits:
+            print(f"  Score: {hit['score']:.4f}, Type: {hit.get('content_type')}, Source: {hit.get('source')}")
+            print(f"    {str(hit.get('text', ''))[:80]!r}")
+    print(retriever.latency_stats())
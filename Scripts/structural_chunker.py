@@ -0,0 +1,469 @@
+"""
+单遍结构化分块引擎：advanced_chunker 的 native 引擎所用的两个基本构件
+
+    scan_markdown     - 逐行扫描一次文档，同时跟踪标题栈、围栏代码块和短行密度，
+                        产出与 MarkdownHeaderTextSplitter(strip_headers=True) 相同的 (标题元数据, 正文) 分段，
+                        分段按 ``` 围栏切成与 split_code_and_text 相同的文本段和代码段，
+                        并附带文本段的行数与短行数，分块时无需再按行或按正则切分一遍
+    RecursiveSplitter - 与 RecursiveCharacterTextSplitter(keep_separator=True) 输出一致的递归切分与合并，
+                        字面分隔符用 str.split 代替正则，短于 chunk_size 的文本直接返回，
+                        按单字符切分时直接按窗口切片
+
+两者的输出与 LangChain 逐字节一致（包括重叠、去除首尾空白和非打印字符的处理），
+一致性由 benchmarks/check_chunker.py 在 data/input 和随机生成的 Markdown 上对比两种引擎来验证。
+"""
+import re
+import sys
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# 可能改变结构的行：标题和围栏；其余行（包括空行）都在区域内由正则整体处理。
+# 模式以换行开头（文本前补一个换行），正则引擎可以直接跳到下一个换行处匹配，而不是在每个字符上尝试行首
+_STRUCTURAL_LINE = re.compile(r"\n(?:(#+)(?=[ \n]|\Z)|```|~~~)")
+# 一个或多个空行：段落分隔
+_BLANK_LINES = re.compile(r"\n\n+")
+# 与 advanced_chunker.split_code_and_text 相同的代码块模式，只用于围栏不规整的分段
+_CODE_BLOCK = re.compile(r"```(\w*)\n(.*?)```", re.DOTALL)
+_FENCE_LANGUAGE = re.compile(r"\w*")
+_SHORT_LINE_PATTERNS = {}
+
+# scan_markdown 产出的片段：(正文, 语言, 行数, 短行数)，语言为 None 表示文本段
+Segment = Tuple[str, Optional[str], int, int]
+
+
+def _printable(line: str) -> str:
+    return "".join(filter(str.isprintable, line))
+
+
+def _strip_lines(text: str) -> str:
+    return "\n".join(map(str.strip, text.split("\n")))
+
+
+def _normalize_lines(text: str) -> Optional[str]:
+    """
+    对整篇文本做逐行 strip 再去掉非打印字符（与 MarkdownHeaderTextSplitter 的逐行处理等价），
+    去掉字符后行首尾又出现空白时返回 None（此时短行统计需要逐行处理）
+    """
+    text = _strip_lines(text)
+    if not text.replace("\n", " ").isprintable():
+        hidden = "".join(re.escape(c) for c in set(text) if c != "\n" and not c.isprintable())
+        text = re.sub(f"[{hidden}]+", "", text)
+        if _strip_lines(text) != text:
+            return None
+    return text
+
+
+def _short_line_pattern(short_line: int):
+    pattern = _SHORT_LINE_PATTERNS.get(short_line)
+    if pattern is None:
+        # Python 3.11 起支持占有量词，长行匹配失败时不再逐字符回溯
+        possessive = "+" if sys.version_info >= (3, 11) else ""
+        pattern = _SHORT_LINE_PATTERNS[short_line] = re.compile(
+            f"\\n[^\\n]{{1,{short_line - 1}}}{possessive}(?=\\n|\\Z)")
+    return pattern
+
+
+def _header_levels(headers_to_split_on):
+    levels = {}
+    for sep, name in headers_to_split_on:
+        if sep.strip("#"):
+            raise ValueError(f"Only '#' header separators are supported, got {sep!r}")
+        levels[len(sep)] = name
+    return levels
+
+
+def scan_markdown(text: str, headers_to_split_on: Sequence[Tuple[str, str]],
+                  short_line: int = 50) -> Iterator[Tuple[Dict[str, str], List[Segment]]]:
+    """
+    按 Markdown 标题切分文本，产出 (标题元数据, 片段列表)；片段为 (正文, 语言, 行数, 短行数)
+
+    语义与 MarkdownHeaderTextSplitter 相同：每行去除首尾空白和非打印字符；标题行本身不计入正文；
+    ``` / ~~~ 围栏内的行（含空行）原样保留且不识别标题；围栏外的空行结束一个段落，
+    标题相同的相邻段落以 "  \\n" 连接为一个分段。分段再按 split_code_and_text 的规则切成文本段和代码段：
+    文本段的语言为 None，代码段的语言为围栏标注（可为空串）。短行数统计文本段中去除空白后长度在 (0, short_line)
+    之间的行；代码段的 chunk_size 与密度无关，行数和短行数记为 0。
+
+    整篇文本先用正则一次完成逐行规范化，之后只有标题、围栏和空行需要逐个处理，
+    普通行作为原文切片并入段落，行数和短行数也在切片上由正则统计；代码段直接取第一步记录的 ``` 围栏，
+    只有围栏之外还出现 ```、围栏未闭合或标注不是单词时才对分段重新做一遍正则切分。
+    """
+    levels = _header_levels(headers_to_split_on)
+    normalized = _normalize_lines(text)
+    if normalized is None:
+        yield from _scan_lines(text, levels, short_line)
+        return
+    text = "\n" + normalized
+
+    # 第一步：按标题行把文本分成区域 (起点, 终点, 标题, 区域内的围栏代码块)；
+    # 起点和终点都指向换行符，围栏内的行不识别标题
+    regions = []
+    stack = []  # [(级别, 名称, 标题文本)]
+    headers = {}  # 当前标题路径；每次变化时新建，已记录的区域不会被修改
+    fences = []
+    region_start = 0
+    position = 0
+    while True:
+        match = _STRUCTURAL_LINE.search(text, position)
+        if match is None:
+            break
+        newline = match.start()
+        p = newline + 1
+        end = text.find("\n", p)
+        if end < 0:
+            end = len(text)
+        position = end
+        if match.group(1) is not None:
+            level = len(match.group(1))
+            name = levels.get(level)
+            if name is None:
+                continue
+            regions.append((region_start, newline, headers, fences))
+            fences = []
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, name, text[p + level:end].strip()))
+            headers = {name: data for _, name, data in stack}
+            region_start = end
+            continue
+        if text[p] == "`":
+            if text.count("```", p, end) != 1:
+                continue
+            fence = "```"
+        else:
+            fence = "~~~"
+        # 围栏内不识别标题，直接跳到第一个以同样围栏开头的行；未闭合的围栏一直延续到文末
+        close = text.find("\n" + fence, end)
+        if close < 0:
+            fences.append((p, len(text)))
+            break
+        fences.append((p, close))
+        position = close + 1
+    regions.append((region_start, len(text), headers, fences))
+
+    # 第二步：区域内空行分隔的段落以 "  \\n" 连接，标题相同的相邻区域合并为一个分段；
+    # 同时记录分段内 ``` 代码块的位置和语言，短行数按代码块分开统计到前后的文本段
+    short = _short_line_pattern(short_line)
+    parts = []
+    section_meta = None
+    section_length = line_count = short_count = 0
+    code_blocks = []  # [(起点, 终点, 语言, 之前文本段的短行数)]，位置相对于分段正文
+    regular = True  # 分段中的 ``` 是否都属于第一步记录的规整围栏
+    for start, end, meta, region_fences in regions:
+        content, offsets = _region_text(text, start, end, region_fences)
+        if not content:
+            continue
+        if parts and meta is not section_meta and meta != section_meta:
+            yield section_meta, _section_segments("  \n".join(parts), line_count, short_count, code_blocks,
+                                                  regular, short_line)
+            parts = []
+            section_length = line_count = short_count = 0
+            code_blocks = []
+            regular = True
+        if not parts:
+            section_meta = meta
+        else:
+            section_length += 3
+        if regular:
+            position = start
+            backticks = 0
+            for (fence_start, fence_end), offset in zip(region_fences, offsets):
+                if text[fence_start] != "`":
+                    continue
+                language = text[fence_start + 3:text.find("\n", fence_start)]
+                if fence_end == len(text) or not _FENCE_LANGUAGE.fullmatch(language):
+                    regular = False
+                    break
+                backticks += 1
+                short_count += len(short.findall(text, position, fence_start))
+                block_start = section_length + offset
+                code_blocks.append((block_start, block_start + fence_end - fence_start, language, short_count))
+                # 闭合行 ``` 之后的部分属于下一个文本段
+                position = text.find("\n", fence_end + 1)
+                if position < 0:
+                    position = len(text)
+                tail = text[fence_end + 4:position].strip()
+                short_count = 1 if 0 < len(tail) < short_line else 0
+            if regular and text.count("```", start, end) == 2 * backticks:
+                short_count += len(short.findall(text, position, end))
+            else:
+                regular = False
+        parts.append(content)
+        section_length += len(content)
+        line_count += content.count("\n") + 1
+    if parts:
+        yield section_meta, _section_segments("  \n".join(parts), line_count, short_count, code_blocks,
+                                              regular, short_line)
+
+
+def _region_text(text: str, start: int, end: int, fences: List[Tuple[int, int]]) -> Tuple[str, List[int]]:
+    """
+    区域正文及各围栏在正文中的起点：去掉首尾空行，围栏外的连续空行替换为 "  \\n"，围栏内的行原样保留
+    """
+    if not fences:
+        content = text[start:end].strip("\n")
+        return (_BLANK_LINES.sub("  \n", content) if "\n\n" in content else content), []
+    pieces = []
+    offsets = []
+    length = 0
+    position = start
+    for i, (fence_start, fence_end) in enumerate(fences):
+        outside = text[position:fence_start]
+        if i == 0:
+            outside = outside.lstrip("\n")
+        outside = _BLANK_LINES.sub("  \n", outside)
+        pieces.append(outside)
+        offsets.append(length + len(outside))
+        pieces.append(text[fence_start:fence_end])
+        length = offsets[-1] + fence_end - fence_start
+        position = fence_end
+    pieces.append(_BLANK_LINES.sub("  \n", text[position:end].rstrip("\n")))
+    return "".join(pieces), offsets
+
+
+def _section_segments(text: str, line_count: int, short_count: int, code_blocks, regular: bool,
+                      short_line: int) -> List[Segment]:
+    """
+    由 scan_markdown 记录的代码块位置切出分段的文本段和代码段；
+    代码块为 (围栏起点, 围栏内容终点, 语言, 之前文本段的短行数)，short_count 为最后一个文本段的短行数
+    """
+    if not regular:
+        return _split_code_blocks(text, short_line)
+    if not code_blocks:
+        return [(text, None, line_count, short_count)]
+    segments = []
+    last = 0
+    for block_start, block_end, language, short_before in code_blocks:
+        if block_start > last:
+            segment = text[last:block_start]
+            segments.append((segment, None, segment.count("\n") + 1, short_before))
+        # 围栏内容为 "```语言\n代码"，代码块正文包含闭合行之前的换行
+        body_start = block_start + len(language) + 4
+        segments.append((text[body_start:block_end] + "\n" if body_start <= block_end else "", language, 0, 0))
+        last = block_end + 4
+    if last < len(text):
+        segment = text[last:]
+        segments.append((segment, None, segment.count("\n") + 1, short_count))
+    return segments
+
+
+def _split_code_blocks(text: str, short_line: int) -> List[Segment]:
+    """
+    与 split_code_and_text 相同的正则切分，并逐行统计文本段的短行数；用于围栏不规整的分段
+    """
+    segments = []
+    last = 0
+    for match in _CODE_BLOCK.finditer(text):
+        if match.start() > last:
+            segments.append(_text_segment(text[last:match.start()], short_line))
+        segments.append((match.group(2), match.group(1), 0, 0))
+        last = match.end()
+    if last < len(text) or not segments:
+        segments.append(_text_segment(text[last:], short_line))
+    return segments
+
+
+def _text_segment(text: str, short_line: int) -> Segment:
+    lines = text.split("\n")
+    return text, None, len(lines), sum(1 for line in lines if 0 < len(line.strip()) < short_line)
+
+
+def _scan_lines(text: str, levels: Dict[int, str], short_line: int):
+    """
+    scan_markdown 的逐行实现，用于去掉非打印字符后行首尾又出现空白的文本
+    """
+    stack = []
+    headers = {}
+    section_meta = None
+    section_lines = []
+    line_count = short_count = 0
+    in_entry = False  # 当前是否处于一个未结束的段落中
+    fence = None
+
+    for line in text.split("\n"):
+        s = line.strip()
+        stripped = True
+        if not s.isprintable():
+            s = _printable(s)
+            stripped = False
+
+        if fence is not None:
+            if s.startswith(fence):
+                fence = None
+                in_code = False
+            else:
+                in_code = True
+        elif s.startswith("```") and s.count("```") == 1:
+            fence = "```"
+            in_code = True
+        elif s.startswith("~~~"):
+            fence = "~~~"
+            in_code = True
+        else:
+            in_code = False
+
+        if not in_code:
+            if not s:
+                in_entry = False
+                continue
+            if s[0] == "#":
+                level = len(s) - len(s.lstrip("#"))
+                name = levels.get(level)
+                if name is not None and (len(s) == level or s[level] == " "):
+                    in_entry = False
+                    while stack and stack[-1][0] >= level:
+                        stack.pop()
+                    stack.append((level, name, s[level:].strip()))
+                    headers = {name: data for _, name, data in stack}
+                    continue
+
+        if not in_entry:
+            # 新段落：标题与当前分段相同时接在其后，否则先产出当前分段
+            in_entry = True
+            if section_lines:
+                if headers is section_meta or headers == section_meta:
+                    section_lines[-1] += "  "
+                else:
+                    yield section_meta, _lines_segments(section_lines, line_count, short_count, short_line)
+                    section_lines = []
+                    line_count = short_count = 0
+                    section_meta = headers
+            else:
+                section_meta = headers
+
+        section_lines.append(s)
+        line_count += 1
+        size = len(s) if stripped else len(s.strip())
+        if 0 < size < short_line:
+            short_count += 1
+
+    if section_lines:
+        yield section_meta, _lines_segments(section_lines, line_count, short_count, short_line)
+
+
+def _lines_segments(lines: List[str], line_count: int, short_count: int, short_line: int) -> List[Segment]:
+    text = "\n".join(lines)
+    if "```" in text:
+        return _split_code_blocks(text, short_line)
+    return [(text, None, line_count, short_count)]
+
+
+class RecursiveSplitter:
+    """
+    递归字符切分：依次尝试 separators 中第一个在文本中出现的分隔符，分隔符保留在后一段的开头，
+    不短于 chunk_size 的片段用后续分隔符继续切分，其余片段合并为不超过 chunk_size 的分块，相邻分块重叠至多 chunk_overlap
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, separators: Sequence[str] = ("\n\n", "\n", " ", ""),
+                 is_separator_regex: bool = False):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+        # 正则分隔符预编译的查找 / 切分模式，字面分隔符为 None（用 in 和 str.split）
+        self._patterns = [re.compile(sep) if is_separator_regex and sep else None for sep in self.separators]
+        self._split_patterns = [re.compile(f"({sep})") if is_separator_regex and sep else None
+                                for sep in self.separators]
+
+    def split_text(self, text: str) -> List[str]:
+        # 整段短于 chunk_size 时合并结果就是原文本身
+        if len(text) < self.chunk_size:
+            text = text.strip()
+            return [text] if text else []
+        chunks = []
+        self._split(text, 0, chunks)
+        return chunks
+
+    def _split(self, text: str, first: int, chunks: List[str]):
+        index = len(self.separators) - 1
+        last = True
+        for i in range(first, len(self.separators)):
+            sep = self.separators[i]
+            if not sep:
+                index = i
+                break
+            pattern = self._patterns[i]
+            if (sep in text) if pattern is None else (pattern.search(text) is not None):
+                index, last = i, i == len(self.separators) - 1
+                break
+
+        sep = self.separators[index]
+        if not sep:
+            self._merge_chars(text, chunks)
+            return
+        pattern = self._split_patterns[index]
+        if pattern is None:
+            parts = text.split(sep)
+            splits = [sep + part for part in parts]
+            if parts[0]:
+                splits[0] = parts[0]
+            else:
+                del splits[0]
+        else:
+            parts = pattern.split(text)
+            splits = [parts[0]]
+            splits.extend([parts[i] + parts[i + 1] for i in range(1, len(parts) - 1, 2)])
+            splits = [s for s in splits if s]
+
+        chunk_size = self.chunk_size
+        if max(map(len, splits)) < chunk_size:
+            self._merge(splits, chunks)
+            return
+        good = []
+        for s in splits:
+            if len(s) < chunk_size:
+                good.append(s)
+                continue
+            if good:
+                self._merge(good, chunks)
+                good = []
+            if last:
+                chunks.append(s)
+            else:
+                self._split(s, index + 1, chunks)
+        if good:
+            self._merge(good, chunks)
+
+    def _merge(self, splits: List[str], chunks: List[str]):
+        """
+        把短于 chunk_size 的片段依次合并：放不下下一个片段时产出当前分块，再从头部弹出片段，
+        直到剩余部分不超过 chunk_overlap 且能放下该片段。用片段长度的前缀和二分查找每个分块的边界，
+        Python 层的循环次数与分块数而不是片段数成正比
+        """
+        chunk_size, chunk_overlap = self.chunk_size, self.chunk_overlap
+        bounds = list(accumulate(map(len, splits), initial=0))
+        count = len(splits)
+        start = 0
+        while True:
+            # 第一个放不下的片段
+            stop = bisect_right(bounds, bounds[start] + chunk_size) - 1
+            if stop >= count:
+                break
+            doc = "".join(splits[start:stop]).strip()
+            if doc:
+                chunks.append(doc)
+            start = max(bisect_left(bounds, bounds[stop] - chunk_overlap, start, stop + 1),
+                        bisect_left(bounds, bounds[stop + 1] - chunk_size, start, stop + 1))
+        doc = "".join(splits[start:]).strip()
+        if doc:
+            chunks.append(doc)
+
+    def _merge_chars(self, text: str, chunks: List[str]):
+        # 按单字符切分再合并，等价于步长 chunk_size - chunk_overlap 的定长窗口
+        chunk_size = self.chunk_size
+        if chunk_size < 2:
+            # 单个字符已不短于 chunk_size，原样作为分块
+            chunks.extend(text)
+            return
+        step = max(chunk_size - self.chunk_overlap, 1)
+        start = 0
+        while start + chunk_size < len(text):
+            doc = text[start:start + chunk_size].strip()
+            if doc:
+                chunks.append(doc)
+            start += step
+        doc = text[start:].strip()
+        if doc:
+            chunks.append(doc)
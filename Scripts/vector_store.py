@@ -0,0 +1,126 @@
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+# .npy 头部固定为 128 字节，便于在写入完成后原地改写行数
+NPY_HEADER_LEN = 128
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def vector_path_for(jsonl_path):
+    """
+    元数据 JSONL 对应的向量文件路径（同名 .npy）
+    """
+    return Path(jsonl_path).with_suffix(".npy")
+
+
+def _npy_header(rows, dim):
+    header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (rows, dim)
+    header = header.ljust(NPY_HEADER_LEN - len(NPY_MAGIC) - 2 - 1) + "\n"
+    return NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class NpyVectorWriter:
+    """
+    以追加方式写入连续的 float32 向量矩阵（标准 .npy 格式）
+
+    行数事先未知：先写入占位头部，close() 时再按实际行数改写，
+    因此可以边编码边写入，也可以在已有文件末尾继续追加。
+    追加时可通过 rows 指定保留的行数（例如断点续跑时回退到上一个检查点），多余的行会被截掉。
+    """
+
+    def __init__(self, path, dim, append=False, rows=None):
+        self.path = Path(path)
+        self.dim = dim
+        self.rows = 0
+        if append and self.path.exists():
+            self.rows = read_shape(self.path)[0] if rows is None else rows
+            self.f = open(self.path, "r+b")
+            self.f.seek(NPY_HEADER_LEN + self.rows * dim * 4)
+            self.f.truncate()
+        else:
+            self.f = open(self.path, "wb")
+            self.f.write(_npy_header(0, dim))
+
+    def write(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}")
+        self.f.write(vectors.tobytes())
+        self.rows += len(vectors)
+
+    def flush(self):
+        """
+        改写头部中的行数并刷盘（fsync），之后文件即可被正常读取，检查点也可以放心记录当前行数
+        """
+        position = self.f.tell()
+        self.f.seek(0)
+        self.f.write(_npy_header(self.rows, self.dim))
+        self.f.seek(position)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_shape(path):
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, _ = np.lib.format.read_array_header_2_0(f)
+    return shape
+
+
+def load_vectors(path):
+    """
+    以内存映射方式打开向量文件，不把整个矩阵读入内存
+    """
+    return np.load(path, mmap_mode="r")
+
+
+def prefix_path_for(jsonl_path, dim):
+    """
+    MRL 前缀向量文件路径，如 vectorized.d128.npy
+    """
+    return Path(jsonl_path).with_suffix(f".d{dim}.npy")
+
+
+def mrl_prefix(vectors, dim):
+    """
+    取 Matryoshka 向量的前 dim 维并重新归一化
+    """
+    prefix = np.asarray(vectors, dtype=np.float32)[..., :dim]
+    norms = np.linalg.norm(prefix, axis=-1, keepdims=True)
+    return prefix / np.maximum(norms, 1e-12)
+
+
+def write_prefix_vectors(jsonl_path, dims, block_size=65536):
+    """
+    由全维向量文件按块生成各个前缀维度的向量文件（无需重新编码），返回 {dim: path}
+    """
+    vectors = load_vectors(vector_path_for(jsonl_path))
+    paths = {}
+    for dim in sorted(set(dims)):
+        if dim >= vectors.shape[1]:
+            continue
+        path = prefix_path_for(jsonl_path, dim)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with NpyVectorWriter(tmp_path, dim) as writer:
+            for start in range(0, len(vectors), block_size):
+                writer.write(mrl_prefix(vectors[start:start + block_size], dim))
+        os.replace(tmp_path, path)
+        paths[dim] = path
+        print(f"Wrote {len(vectors)} {dim}-dim prefix vectors to {path}")
+    return paths
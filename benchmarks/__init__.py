@@ -0,0 +1,3 @@
+"""
+流水线各阶段的性能基准脚本，在仓库根目录下以 ``python -m benchmarks.<name>`` 运行
+"""
@@ -0,0 +1,86 @@
+"""
+对比两种全量导入方式的耗时：
+    indexed - 先建 HNSW 索引再插入（原有流程）
+    bulk    - 无索引插入全部数据，最后一次性构建索引
+
+python -m benchmarks.bench_bulk_load --uri ./bench_milvus.db --rows 100000 --dim 768
+python -m benchmarks.bench_bulk_load --host localhost --port 19530 --rows 1000000
+
+milvus-lite 不会在写入过程中真正构建 HNSW 索引，两种方式的差异应以 Milvus standalone 上的结果为准。
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from pymilvus import utility
+
+from Scripts.import_to_milvus import (
+    build_index,
+    connect_milvus,
+    create_collection,
+    import_data,
+    make_index_params,
+)
+from Scripts.vector_store import NpyVectorWriter
+
+
+def write_synthetic(path, rows, dim, seed=0):
+    """
+    生成随机单位向量及对应的元数据文件（npy 向量格式）
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w", encoding="utf-8") as f, NpyVectorWriter(Path(path).with_suffix(".npy"), dim) as writer:
+        for start in range(0, rows, 10000):
+            n = min(10000, rows - start)
+            vectors = rng.standard_normal((n, dim), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            writer.write(vectors)
+            for i in range(start, start + n):
+                item = {"text": f"chunk {i}", "metadata": {"source": f"doc_{i // 100}", "page": -1, "content_type": "text"}}
+                f.write(json.dumps(item) + "\n")
+
+
+def run(mode, collection_name, input_file, dim, index_params, batch_size, workers):
+    start = time.perf_counter()
+    if mode == "indexed":
+        collection = create_collection(collection_name, dim, index_params=index_params)
+        import_data(collection, input_file, batch_size=batch_size, workers=workers)
+        utility.wait_for_index_building_complete(collection_name)
+    else:
+        collection = create_collection(collection_name, dim, with_index=False)
+        import_data(collection, input_file, batch_size=batch_size, workers=workers)
+        build_index(collection, index_params)
+    elapsed = time.perf_counter() - start
+    utility.drop_collection(collection_name)
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark indexed inserts vs bulk load with deferred index build")
+    parser.add_argument("--uri", type=str, default=None)
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=str, default="19530")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch_size", type=int, default=5000)
+    parser.add_argument("--insert_workers", type=int, default=2)
+    parser.add_argument("--index_type", type=str, default="HNSW")
+    parser.add_argument("--index_params", type=str, default='{"M": 16, "efConstruction": 256}')
+    args = parser.parse_args()
+
+    connect_milvus(args.host, args.port, args.uri)
+    index_params = make_index_params(args.index_type, json.loads(args.index_params))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = str(Path(tmp) / "vectorized.jsonl")
+        write_synthetic(input_file, args.rows, args.dim)
+        for mode in ("indexed", "bulk"):
+            results[mode] = run(mode, f"bench_bulk_{mode}", input_file, args.dim, index_params,
+                                args.batch_size, args.insert_workers)
+
+    for mode, elapsed in results.items():
+        print(f"{mode:>8}: {elapsed:.1f}s, {args.rows / elapsed:.0f} rows/s")
+    print(f"speedup: {results['indexed'] / results['bulk']:.2f}x")
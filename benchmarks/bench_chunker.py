@@ -0,0 +1,103 @@
+"""
+分块阶段吞吐基准：比较 native（单遍结构化分块）与 langchain（原 LangChain 分块器链）两种引擎
+
+    engine - 只测 iter_chunks，解析结果预先读入内存，取 --repeat 次中最快的一次
+    stage  - 完整的 chunk_documents，包括读写 JSONL
+
+语料默认由 benchmarks.corpus 按 --scale 生成后用 intelligent_parser 解析；也可用 --corpus 指定原始文件目录，
+或用 --parsed 直接指定解析结果。输出 docs/s、chunks/s、MB/s 和 native 相对 langchain 的加速比，
+并确认两种引擎产出的分块数相同（逐条一致性见 benchmarks/check_chunker.py）。
+
+python -m benchmarks.bench_chunker --scale 16 --workers 4
+python -m benchmarks.bench_chunker --parsed data/output/parsed.jsonl --repeat 5 --output chunker.json
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+from Scripts.advanced_chunker import ENGINES, chunk_documents, iter_chunks
+from Scripts.intelligent_parser import process_directory
+
+
+def best_of(func, repeat):
+    """
+    运行 repeat 次，返回 (最短耗时, 最后一次的返回值)
+    """
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def throughput(seconds, docs, chunks, size):
+    return {
+        "seconds": seconds,
+        "docs_per_s": docs / seconds,
+        "chunks_per_s": chunks / seconds,
+        "mb_per_s": size / 1024 / 1024 / seconds,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunking engine throughput benchmark")
+    parser.add_argument("--parsed", type=str, default=None, help="Parsed JSONL (default: parse --corpus)")
+    parser.add_argument("--corpus", type=str, default=None, help="Existing corpus directory (default: generate one)")
+    parser.add_argument("--scale", type=float, default=8.0, help="Synthetic corpus scale (files per type = 4 * scale)")
+    parser.add_argument("--workers", type=int, default=1, help="Parser worker processes")
+    parser.add_argument("--engines", type=str, nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per engine; the fastest is reported")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parsed = args.parsed
+        if parsed is None:
+            corpus_dir = args.corpus
+            if corpus_dir is None:
+                corpus_dir = os.path.join(tmp, "corpus")
+                print(f"Generating corpus (scale={args.scale}) in {corpus_dir}...")
+                generate_corpus(corpus_dir, args.scale)
+            parsed = os.path.join(tmp, "parsed.jsonl")
+            process_directory(corpus_dir, parsed, workers=args.workers)
+
+        with open(parsed, "r", encoding="utf-8") as f:
+            docs = [json.loads(line) for line in f if line.strip()]
+        size = os.path.getsize(parsed)
+        content_mb = sum(len(doc.get("content", "").encode("utf-8")) for doc in docs) / 1024 / 1024
+        print(f"{len(docs)} parsed records, {content_mb:.1f} MB of content")
+
+        results = {"records": len(docs), "content_mb": content_mb, "engine": {}, "stage": {}, "speedup": {}}
+        for engine in args.engines:
+            seconds, chunks = best_of(lambda: sum(1 for _ in iter_chunks(docs, engine=engine)), args.repeat)
+            results["engine"][engine] = dict(throughput(seconds, len(docs), chunks, content_mb * 1024 * 1024),
+                                             chunks=chunks)
+            output = str(Path(tmp) / f"chunks_{engine}.jsonl")
+            seconds, _ = best_of(lambda: chunk_documents(parsed, output, engine=engine), args.repeat)
+            results["stage"][engine] = throughput(seconds, len(docs), chunks, size)
+
+    for mode in ("engine", "stage"):
+        for engine, result in results[mode].items():
+            print(f"{mode:>6} {engine:>9}: {result['seconds']:.3f}s, {result['docs_per_s']:.0f} docs/s, "
+                  f"{result['chunks_per_s']:.0f} chunks/s, {result['mb_per_s']:.1f} MB/s")
+        if len(results[mode]) == len(ENGINES):
+            speedup = results[mode]["langchain"]["seconds"] / results[mode]["native"]["seconds"]
+            results["speedup"][mode] = speedup
+            print(f"{mode:>6}   speedup: x{speedup:.1f}")
+    counts = {engine: result["chunks"] for engine, result in results["engine"].items()}
+    if len(set(counts.values())) > 1:
+        print(f"WARNING: engines produced different chunk counts: {counts}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,159 @@
+"""
+本地内容存储基准：正文从 Milvus 移入 zstd 内容存储后的体积变化，以及 top-k 正文回填（hydration）的延迟
+
+    体积     - 正文原始字节数 / 压缩后字节数；每行字段载荷的估算（正文 + float32 向量 + 元数据），即 Milvus 中少占的部分
+    回填延迟 - 以 LocalIndex（不含 text）检索 top-k，再用 ContentStore.get_many 取回整批结果的正文，
+               分别测量块缓存为空（cold）和已预热（warm）时每批的 p50/p99
+    --milvus - 另外把数据分别导入含 text / 不含 text 的 Collection，比较 "检索并返回 text" 与 "检索 + 本地回填" 的每批延迟
+
+python -m benchmarks.bench_content_store --input data/output/vectorized.jsonl --top_k 10 --batch 16
+python -m benchmarks.bench_content_store --input data/output/vectorized.jsonl --milvus --uri ./bench.db --output content_store.json
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_recall import load_input, make_queries
+from Scripts.content_store import ContentStore, ContentStoreWriter
+from Scripts.import_to_milvus import connect_milvus, create_collection, item_chunk_id, make_index_params
+from Scripts.local_index import LocalIndex
+
+
+def load_items(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99))}
+
+
+def metadata_columns(items):
+    meta = [item.get("metadata", {}) for item in items]
+    return ([str(m.get("source", "")) for m in meta], [int(m.get("page", -1) or -1) for m in meta],
+            [str(m.get("content_type", "text")) for m in meta])
+
+
+def measure_hydration(store, index, queries, k, batch, cold):
+    latencies = []
+    for start in range(0, len(queries), batch):
+        hits = index.search(queries[start:start + batch], limit=k, output_fields=["source"])
+        ids = [hit.id for result in hits for hit in result]
+        if cold:
+            store.cache.clear()
+        begin = time.perf_counter()
+        store.get_many(ids)
+        latencies.append(time.perf_counter() - begin)
+    return percentiles(latencies)
+
+
+def measure_milvus(collection, queries, k, batch, ef, output_fields, store=None):
+    param = {"metric_type": "IP", "params": {"ef": max(ef, k)}}
+    latencies = []
+    for start in range(0, len(queries), batch):
+        begin = time.perf_counter()
+        results = collection.search(queries[start:start + batch], "vector", param, limit=k, output_fields=output_fields)
+        if store is not None:
+            store.get_many([hit.id for result in results for hit in result])
+        latencies.append(time.perf_counter() - begin)
+    return percentiles(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local chunk text store against storing text in Milvus")
+    parser.add_argument("--input", type=str, default="data/output/vectorized.jsonl",
+                        help="Vectorized JSONL with text (uses the .npy sidecar if present)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=16, help="Queries per search call")
+    parser.add_argument("--block_size", type=int, default=64 * 1024)
+    parser.add_argument("--level", type=int, default=9)
+    parser.add_argument("--milvus", action="store_true", help="Also compare collections with and without a text field")
+    parser.add_argument("--ef", type=int, default=64)
+    parser.add_argument("--index_params", type=str, default='{"M": 16, "efConstruction": 256}')
+    parser.add_argument("--uri", type=str, default=None)
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=str, default="19530")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    items = load_items(args.input)
+    vectors = load_input(args.input)
+    n, dim = vectors.shape
+    ids = [item_chunk_id(item) for item in items]
+    texts = [item.get("text", "") for item in items]
+    sources, pages, content_types = metadata_columns(items)
+    queries = make_queries(vectors, args.queries)
+    k = args.top_k
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        with ContentStoreWriter(tmp, append=False, block_size=args.block_size, level=args.level) as writer:
+            writer.add(ids, texts)
+            raw_bytes = writer.raw_bytes
+        build_seconds = time.perf_counter() - start
+        store = ContentStore(tmp)
+        sizes = store.size_stats()
+
+        meta_bytes = sum(len(s.encode("utf-8")) + len(c.encode("utf-8")) for s, c in zip(sources, content_types)) + n * 16
+        results = {
+            "rows": n,
+            "dim": dim,
+            "top_k": k,
+            "text_mb": raw_bytes / 1024 / 1024,
+            "store_mb": (sizes["compressed_bytes"] + sizes["index_bytes"]) / 1024 / 1024,
+            "compression_ratio": raw_bytes / max(sizes["compressed_bytes"], 1),
+            "build_mb_per_s": raw_bytes / 1024 / 1024 / build_seconds,
+            # Milvus 中每行的字段载荷（不含索引结构）：有 text / 无 text
+            "row_bytes_with_text": (raw_bytes + n * dim * 4 + meta_bytes) / n,
+            "row_bytes_without_text": (n * dim * 4 + meta_bytes) / n,
+        }
+        print(f"{n} chunks: {results['text_mb']:.1f} MB text -> {results['store_mb']:.1f} MB store "
+              f"(x{results['compression_ratio']:.1f}, {results['build_mb_per_s']:.0f} MB/s); "
+              f"Milvus field payload {results['row_bytes_with_text']:.0f} -> {results['row_bytes_without_text']:.0f} bytes/row")
+
+        index = LocalIndex(dim, auto_id=False, with_text=False)
+        index.insert([ids, vectors, sources, pages, content_types])
+        for cold in (True, False):
+            name = "hydrate_cold" if cold else "hydrate_warm"
+            results[name] = measure_hydration(store, index, queries, k, args.batch, cold)
+            print(f"{name}: top-{k} x {args.batch} queries p50 {results[name]['p50_ms']:.2f} ms, "
+                  f"p99 {results[name]['p99_ms']:.2f} ms")
+
+        if args.milvus:
+            from pymilvus import utility
+
+            connect_milvus(args.host, args.port, args.uri)
+            index_params = make_index_params("HNSW", json.loads(args.index_params))
+            for with_text in (True, False):
+                name = "bench_content_text" if with_text else "bench_content_store"
+                collection = create_collection(name, dim, index_params=index_params, auto_id=False, with_text=with_text)
+                for begin in range(0, n, 1000):
+                    end = min(begin + 1000, n)
+                    columns = [ids[begin:end], vectors[begin:end], sources[begin:end], pages[begin:end],
+                               content_types[begin:end]]
+                    if with_text:
+                        columns.insert(1, texts[begin:end])
+                    collection.insert(columns)
+                collection.flush()
+                collection.load()
+                if with_text:
+                    results["milvus_text_field"] = measure_milvus(collection, queries, k, args.batch, args.ef,
+                                                                  ["text", "source", "content_type"])
+                else:
+                    store.cache.clear()
+                    results["milvus_store"] = measure_milvus(collection, queries, k, args.batch, args.ef,
+                                                             ["source", "content_type"], store=store)
+                utility.drop_collection(name)
+            for name in ("milvus_text_field", "milvus_store"):
+                print(f"{name}: search + text p50 {results[name]['p50_ms']:.2f} ms, p99 {results[name]['p99_ms']:.2f} ms")
+        store.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
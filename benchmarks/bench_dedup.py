@@ -0,0 +1,153 @@
+"""
+分块去重基准：在分块结果中注入已知的重复分块，测量去重的准确率、召回率和吞吐；
+指定 --model 时再测量去重前后的编码耗时与 top-k 冗余度
+
+    完全重复 - 原分块加上 "# 第N页" 页码行并改变来源（模拟重复的页眉、重复渲染的表格）
+    近似重复 - 原分块随机替换少量字符（--near_edit_rate）
+
+top-k 冗余度：以原分块为查询，在全部分块的向量中取 top-k，结果中与排在前面的结果属于同一原分块的比例。
+
+python -m benchmarks.bench_dedup --input data/output/chunks.jsonl --dup_rate 0.3
+python -m benchmarks.bench_dedup --input data/output/chunks.jsonl --model bench_model/st --truncate_dim 64 --output dedup.json
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from Scripts.dedup import Deduplicator, normalize_text, print_report, shingle_hashes
+
+
+def load_chunks(path, limit=None):
+    chunks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                chunks.append(json.loads(line))
+            if limit and len(chunks) >= limit:
+                break
+    return chunks
+
+
+def mutate(text, rng, rate):
+    chars = list(text)
+    for _ in range(max(1, int(len(chars) * rate))):
+        chars[rng.randrange(len(chars))] = rng.choice("的数据系统模型向量检索文档")
+    return "".join(chars)
+
+
+def inject_duplicates(chunks, rng, dup_rate, near_share, edit_rate):
+    """
+    返回 (混入重复后的分块, 每个分块所属原分块的下标, 注入的是否为重复)
+    """
+    # 按排序键混入：重复分块总是排在其原分块之后
+    items = [(i, chunk, i, False) for i, chunk in enumerate(chunks)]
+    for _ in range(int(len(chunks) * dup_rate)):
+        i = rng.randrange(len(chunks))
+        original = chunks[i]
+        meta = dict(original["metadata"], source=f"{original['metadata'].get('source')}#copy", chunk_index=rng.randrange(1000))
+        if rng.random() < near_share:
+            text = mutate(original["text"], rng, edit_rate)
+        else:
+            text = f"# 第{rng.randint(1, 99)}页\n{original['text']}"
+        items.append((rng.uniform(i, len(chunks)), {"text": text, "metadata": meta}, i, True))
+    items.sort(key=lambda item: item[0])
+    return [c for _, c, _, _ in items], [g for _, _, g, _ in items], [d for _, _, _, d in items]
+
+
+def jaccard(a, b, shingle_size):
+    a = set(shingle_hashes(normalize_text(a), shingle_size).tolist())
+    b = set(shingle_hashes(normalize_text(b), shingle_size).tolist())
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def topk_redundancy(embeddings, groups, queries, k):
+    """
+    每个查询的 top-k 结果中，与排在前面的某个结果同属一个原分块的比例（取平均）
+    """
+    scores = queries @ embeddings.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    redundant = [1 - len({groups[j] for j in row}) / len(row) for row in top]
+    return float(np.mean(redundant))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate chunk elimination")
+    parser.add_argument("--input", type=str, default="data/output/chunks.jsonl")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N chunks")
+    parser.add_argument("--dup_rate", type=float, default=0.3, help="Injected duplicates per original chunk")
+    parser.add_argument("--near_share", type=float, default=0.5, help="Share of injected duplicates that are edited")
+    parser.add_argument("--near_edit_rate", type=float, default=0.005, help="Fraction of characters replaced in near duplicates")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--num_perm", type=int, default=128)
+    parser.add_argument("--shingle_size", type=int, default=5)
+    parser.add_argument("--model", type=str, default=None, help="Also measure encode time and top-k redundancy")
+    parser.add_argument("--truncate_dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    originals = load_chunks(args.input, args.limit)
+    chunks, groups, injected = inject_duplicates(originals, rng, args.dup_rate, args.near_share, args.near_edit_rate)
+    print(f"{len(originals)} chunks + {sum(injected)} injected duplicates")
+
+    deduplicator = Deduplicator(threshold=args.threshold, num_perm=args.num_perm, shingle_size=args.shingle_size)
+    start = time.perf_counter()
+    kept = [deduplicator.keep(chunk) for chunk in chunks]
+    elapsed = time.perf_counter() - start
+    report = deduplicator.report(args.truncate_dim)
+    print_report(report)
+
+    dropped = [not k for k in kept]
+    true_positives = sum(d and i for d, i in zip(dropped, injected))
+    # 编辑后与原分块的实际 Jaccard 相似度已低于阈值的注入分块不算漏检
+    detectable = [i and jaccard(chunk["text"], originals[g]["text"], args.shingle_size) >= args.threshold
+                  for chunk, g, i in zip(chunks, groups, injected)]
+    results = {
+        "chunks": len(chunks),
+        "injected": sum(injected),
+        "dropped": sum(dropped),
+        "precision": true_positives / sum(dropped) if sum(dropped) else 1.0,
+        "recall": true_positives / sum(injected) if sum(injected) else 1.0,
+        "recall_above_threshold": sum(d and t for d, t in zip(dropped, detectable)) / sum(detectable)
+        if sum(detectable) else 1.0,
+        "seconds": elapsed,
+        "chunks_per_s": len(chunks) / elapsed,
+        "report": report,
+    }
+    print(f"Precision {results['precision']:.3f}, recall {results['recall']:.3f} "
+          f"({results['recall_above_threshold']:.3f} of duplicates with Jaccard >= {args.threshold}), "
+          f"{results['chunks_per_s']:.0f} chunks/s")
+
+    if args.model:
+        from Scripts.embedding_client import EmbeddingClient
+
+        client = EmbeddingClient(model_name=args.model, truncate_dim=args.truncate_dim)
+        texts = [chunk["text"] for chunk in chunks]
+        kept_index = [i for i, k in enumerate(kept) if k]
+        client.encode(texts[:32], show_progress_bar=False)
+        start = time.perf_counter()
+        embeddings = client.encode(texts, show_progress_bar=False)
+        encode_before = time.perf_counter() - start
+        start = time.perf_counter()
+        client.encode([texts[i] for i in kept_index], show_progress_bar=False)
+        encode_after = time.perf_counter() - start
+
+        query_index = rng.sample(range(len(originals)), min(args.queries, len(originals)))
+        queries = client.encode([originals[i]["text"] for i in query_index], show_progress_bar=False)
+        before = topk_redundancy(embeddings, groups, queries, args.top_k)
+        after = topk_redundancy(embeddings[kept_index], [groups[i] for i in kept_index], queries, args.top_k)
+        results.update(encode_seconds_before=encode_before, encode_seconds_after=encode_after,
+                       topk_redundancy_before=before, topk_redundancy_after=after)
+        print(f"Encode: {encode_before:.2f}s -> {encode_after:.2f}s; "
+              f"top-{args.top_k} redundancy: {before:.1%} -> {after:.1%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
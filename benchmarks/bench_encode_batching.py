@@ -0,0 +1,63 @@
+"""
+对比 EmbeddingClient.encode 的固定 batch_size 组批与 token 预算组批的吞吐
+
+python -m benchmarks.bench_encode_batching --input data/output/chunks.jsonl --max_batch_tokens 8192
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from Scripts.embedding_client import EmbeddingClient
+
+
+def load_texts(input_path, limit=None):
+    texts = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            texts.append(json.loads(line)["text"])
+            if limit and len(texts) >= limit:
+                break
+    return texts
+
+
+def timed_encode(client, texts, **kwargs):
+    start = time.perf_counter()
+    embeddings = client.encode(texts, **kwargs)
+    return embeddings, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fixed-size vs token-budget batching")
+    parser.add_argument("--input", type=str, default="data/output/chunks.jsonl")
+    parser.add_argument("--model", type=str, default="fangxq/XYZ-embedding")
+    parser.add_argument("--truncate_dim", type=int, default=768)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--max_batch_tokens", type=int, default=8192)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N chunks")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = load_texts(args.input, args.limit)
+    client = EmbeddingClient(model_name=args.model, truncate_dim=args.truncate_dim)
+    lengths = client.token_lengths(texts)
+    print(f"{len(texts)} texts, tokens: mean={np.mean(lengths):.0f}, min={min(lengths)}, max={max(lengths)}")
+
+    # 预热
+    client.encode(texts[:args.batch_size], batch_size=args.batch_size)
+
+    fixed_times, budget_times = [], []
+    for _ in range(args.repeat):
+        fixed, elapsed = timed_encode(client, texts, batch_size=args.batch_size)
+        fixed_times.append(elapsed)
+        budget, elapsed = timed_encode(client, texts, max_batch_tokens=args.max_batch_tokens)
+        budget_times.append(elapsed)
+
+    fixed_time, budget_time = min(fixed_times), min(budget_times)
+    diff = float(np.abs(fixed - budget).max())
+    print(f"fixed batch_size={args.batch_size}: {fixed_time:.2f}s, {len(texts) / fixed_time:.1f} texts/s")
+    print(f"token budget={args.max_batch_tokens}: {budget_time:.2f}s, {len(texts) / budget_time:.1f} texts/s")
+    print(f"speedup: {fixed_time / budget_time:.2f}x, max abs diff: {diff:.2e}")
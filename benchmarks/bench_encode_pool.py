@@ -0,0 +1,91 @@
+"""
+测量 EmbeddingClient 在不同编码进程数 × 每进程 torch 线程数下的吞吐，用于为不同机型选择 --workers / --threads_per_worker
+
+    workers=1 - 在当前进程内编码，torch 线程数设为 threads
+    workers>1 - 多进程编码池，每个进程一份模型、threads 个线程
+
+python -m benchmarks.bench_encode_pool --input data/output/chunks.jsonl --workers 1 2 4 8 --threads 1 2 4
+python -m benchmarks.bench_encode_pool --model bench_model/st --limit 2000 --output encode_pool.json
+
+默认跳过 workers × threads 超过 CPU 核数的组合（--oversubscribe 时保留）。
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.bench_encode_batching import load_texts
+from Scripts.embedding_client import EmbeddingClient
+
+
+def measure(client, texts, repeat, **kwargs):
+    """
+    完整预热一次（确保所有编码进程都已加载模型）后重复编码 repeat 次，返回 (向量, 最短耗时)
+    """
+    client.encode(texts, show_progress_bar=False, **kwargs)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = client.encode(texts, show_progress_bar=False, **kwargs)
+        times.append(time.perf_counter() - start)
+    return embeddings, min(times)
+
+
+if __name__ == "__main__":
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark encode throughput vs worker processes and threads")
+    parser.add_argument("--input", type=str, default="data/output/chunks.jsonl")
+    parser.add_argument("--model", type=str, default="fangxq/XYZ-embedding")
+    parser.add_argument("--truncate_dim", type=int, default=768)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--max_batch_tokens", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N chunks")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4], help="Torch threads per worker")
+    parser.add_argument("--oversubscribe", action="store_true", help="Also run workers x threads > CPU cores")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    texts = load_texts(args.input, args.limit)
+    configs = [(w, t) for w in args.workers for t in args.threads if args.oversubscribe or w * t <= cpu_count]
+    kwargs = {"batch_size": args.batch_size, "max_batch_tokens": args.max_batch_tokens}
+    print(f"{len(texts)} texts, {cpu_count} CPU cores, configs (workers, threads): {configs}")
+
+    reference = None
+    tokens = None
+    results = []
+    for workers, threads in configs:
+        if workers == 1:
+            torch.set_num_threads(threads)
+        client = EmbeddingClient(model_name=args.model, device="cpu", truncate_dim=args.truncate_dim,
+                                 workers=workers, threads_per_worker=threads)
+        if tokens is None:
+            tokens = sum(client.token_lengths(texts))
+        embeddings, elapsed = measure(client, texts, args.repeat, **kwargs)
+        client.close()
+        if reference is None:
+            reference = embeddings
+        results.append({
+            "workers": workers,
+            "threads": threads,
+            "seconds": elapsed,
+            "texts_per_s": len(texts) / elapsed,
+            "tokens_per_s": tokens / elapsed,
+            "max_abs_diff": float(np.abs(embeddings - reference).max()),
+        })
+
+    baseline = results[0]["texts_per_s"]
+    for r in results:
+        print(f"workers={r['workers']:>2} threads={r['threads']:>2}: {r['seconds']:.2f}s, {r['texts_per_s']:.1f} texts/s, "
+              f"{r['tokens_per_s']:.0f} tokens/s, x{r['texts_per_s'] / baseline:.2f}, max abs diff {r['max_abs_diff']:.1e}")
+    best = max(results, key=lambda r: r["texts_per_s"])
+    print(f"Best: --workers {best['workers']} --threads_per_worker {best['threads']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"texts": len(texts), "tokens": tokens, "cpu_count": cpu_count, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,151 @@
+"""
+对比单一分辨率检索与 MRL 漏斗检索：
+    single - 在全维向量上检索
+    funnel - 在前 coarse_dim 维（重新归一化）上检索 top_k * oversample 个候选，再用全维向量重新打分
+报告 recall@k（以全维精确检索为基准）、QPS 和索引中向量占用的内存
+
+python -m benchmarks.bench_mrl_funnel --input data/output/vectorized.jsonl --coarse_dims 128 256 --oversample 4 8
+python -m benchmarks.bench_mrl_funnel --rows 200000 --dim 768 --nlist 1024 --nprobe 16
+python -m benchmarks.bench_mrl_funnel --input data/output/vectorized.jsonl --milvus --uri ./bench_milvus.db
+
+前缀检索只有在 MRL 训练过的嵌入上才有意义，应以真实向量文件（--input）的结果为准；
+合成数据按维度递减的方差模拟“前面的维度信息量更大”，仅用于检查流程。
+"""
+import argparse
+import json
+
+import numpy as np
+from pymilvus import utility
+
+from benchmarks.bench_recall import (
+    build_milvus,
+    load_input,
+    make_queries,
+    recall_at_k,
+    synthetic_vectors,
+    timed_search,
+)
+from Scripts.import_to_milvus import connect_milvus, make_index_params
+from Scripts.local_index import LocalIndex
+from Scripts.vector_store import mrl_prefix
+
+
+def synthetic_mrl_vectors(rows, dim, seed=0):
+    vectors = synthetic_vectors(rows, dim, seed=seed)
+    vectors *= 1 / np.sqrt(1 + np.arange(dim, dtype=np.float32) / 16)
+    return mrl_prefix(vectors, dim)
+
+
+def local_funnel(index, full_vectors, coarse_dim, k, oversample, nprobe):
+    """
+    在 index 上检索候选（查询取前 coarse_dim 维），再用全维向量重新打分；coarse_dim 为 None 时直接返回 top-k
+    """
+    param = {"metric_type": "IP", "params": {"nprobe": nprobe} if nprobe else {}}
+
+    def search(queries):
+        coarse = queries if coarse_dim is None else mrl_prefix(queries, coarse_dim)
+        limit = k if coarse_dim is None else k * oversample
+        results = []
+        for query, hits in zip(queries, index.search(coarse, "vector", param, limit=limit)):
+            ids = np.asarray([hit.id for hit in hits])
+            if coarse_dim is not None:
+                ids = ids[np.argsort(-(full_vectors[ids] @ query))[:k]]
+            results.append(ids.tolist())
+        return results
+
+    return search
+
+
+def milvus_funnel(collection, full_vectors, coarse_dim, k, oversample, ef):
+    def search(queries):
+        coarse = queries if coarse_dim is None else mrl_prefix(queries, coarse_dim)
+        limit = k if coarse_dim is None else k * oversample
+        param = {"metric_type": "IP", "params": {"ef": max(ef, limit)}}
+        results = []
+        for query, hits in zip(queries, collection.search(coarse, "vector", param, limit=limit, output_fields=["text"])):
+            ids = np.asarray([int(hit.entity.get("text")) for hit in hits])
+            if coarse_dim is not None:
+                ids = ids[np.argsort(-(full_vectors[ids] @ query))[:k]]
+            results.append(ids.tolist())
+        return results
+
+    return search
+
+
+def build_local(vectors, nlist):
+    n = len(vectors)
+    index = LocalIndex(vectors.shape[1])
+    index.insert([[""] * n, vectors, [""] * n, [-1] * n, ["text"] * n])
+    if nlist:
+        index.build_ivf(nlist=nlist)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark MRL funnel search against single-resolution search")
+    parser.add_argument("--input", type=str, default=None, help="Vectorized JSONL (uses the .npy sidecar if present)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=16, help="Queries per search call")
+    parser.add_argument("--coarse_dims", type=int, nargs="+", default=[128, 256])
+    parser.add_argument("--oversample", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--nlist", type=int, default=0, help="Build IVF indexes with this many lists (0: exact scan)")
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--milvus", action="store_true", help="Also compare HNSW collections in Milvus")
+    parser.add_argument("--ef", type=int, default=64)
+    parser.add_argument("--index_params", type=str, default='{"M": 16, "efConstruction": 256}')
+    parser.add_argument("--uri", type=str, default=None)
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=str, default="19530")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    vectors = load_input(args.input) if args.input else synthetic_mrl_vectors(args.rows, args.dim)
+    queries = make_queries(vectors, args.queries)
+    n, dim = vectors.shape
+    k = args.top_k
+    nprobe = args.nprobe if args.nlist else None
+    coarse_dims = [d for d in args.coarse_dims if d < dim]
+    print(f"Corpus {vectors.shape}, {len(queries)} queries, k={k}")
+
+    truth, _ = timed_search(local_funnel(build_local(vectors, 0), vectors, None, k, 1, None), queries, args.batch)
+    results = []
+
+    def record(backend, coarse_dim, oversample, search):
+        found, qps = timed_search(search, queries, args.batch)
+        index_dim = coarse_dim or dim
+        results.append({
+            "backend": backend,
+            "index_dim": index_dim,
+            "oversample": oversample,
+            "recall": recall_at_k(found, truth),
+            "qps": qps,
+            "index_vector_mb": n * index_dim * 4 / 1024 / 1024,
+        })
+
+    for coarse_dim in [None] + coarse_dims:
+        index = build_local(vectors if coarse_dim is None else mrl_prefix(vectors, coarse_dim), args.nlist)
+        for oversample in ([1] if coarse_dim is None else args.oversample):
+            record("local", coarse_dim, oversample, local_funnel(index, vectors, coarse_dim, k, oversample, nprobe))
+
+    if args.milvus:
+        connect_milvus(args.host, args.port, args.uri)
+        index_params = make_index_params("HNSW", json.loads(args.index_params))
+        for coarse_dim in [None] + coarse_dims:
+            name = f"bench_mrl_{coarse_dim or dim}"
+            collection = build_milvus(vectors if coarse_dim is None else mrl_prefix(vectors, coarse_dim), name, index_params)
+            for oversample in ([1] if coarse_dim is None else args.oversample):
+                record("milvus_hnsw", coarse_dim, oversample, milvus_funnel(collection, vectors, coarse_dim, k, oversample, args.ef))
+            utility.drop_collection(name)
+
+    for r in results:
+        mode = "single" if r["index_dim"] == dim else f"funnel x{r['oversample']}"
+        print(f"{r['backend']:>12} {r['index_dim']:>5}d {mode:>11}: recall@{k}={r['recall']:.4f}, "
+              f"{r['qps']:.0f} QPS, index vectors {r['index_vector_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rows": n, "dim": dim, "top_k": k, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,78 @@
+"""
+比较 EmbeddingClient 的 torch / ONNX fp32 / ONNX int8 后端在 CPU 上的编码吞吐，以及与 torch 输出的余弦一致性
+
+python -m benchmarks.bench_onnx --input data/output/chunks.jsonl --threads 4
+python -m benchmarks.bench_onnx --model bench_model/st --limit 2000 --output onnx.json
+
+各后端使用相同的 MRL 截断维度和组批方式；torch 与 ONNX Runtime 的线程数都设为 --threads。
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+
+from benchmarks.bench_encode_batching import load_texts
+from benchmarks.bench_encode_pool import measure
+from Scripts.embedding_client import EmbeddingClient
+from Scripts.onnx_backend import cosine_parity
+
+BACKENDS = {
+    "torch": {"backend": "torch"},
+    "onnx-fp32": {"backend": "onnx"},
+    "onnx-int8": {"backend": "onnx", "onnx_quantize": True},
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark torch vs ONNX Runtime (fp32 / int8) CPU encoding")
+    parser.add_argument("--input", type=str, default="data/output/chunks.jsonl")
+    parser.add_argument("--model", type=str, default="fangxq/XYZ-embedding")
+    parser.add_argument("--truncate_dim", type=int, default=768)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--max_batch_tokens", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N chunks")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Torch / ONNX Runtime threads")
+    parser.add_argument("--backends", type=str, nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--onnx_dir", type=str, default="data/cache/onnx")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    texts = load_texts(args.input, args.limit)
+    torch.set_num_threads(args.threads)
+    kwargs = {"batch_size": args.batch_size, "max_batch_tokens": args.max_batch_tokens}
+    print(f"{len(texts)} texts, {args.threads} threads, backends: {args.backends}")
+
+    reference = None
+    results = []
+    for name in args.backends:
+        client = EmbeddingClient(model_name=args.model, device="cpu", truncate_dim=args.truncate_dim,
+                                 threads_per_worker=args.threads, onnx_dir=args.onnx_dir, **BACKENDS[name])
+        embeddings, elapsed = measure(client, texts, args.repeat, **kwargs)
+        if reference is None:
+            # 吞吐和一致性都以第一个后端（默认 torch）为基准
+            reference = embeddings
+        size = os.path.getsize(client.onnx.path) if client.onnx is not None else None
+        client.close()
+        cosine = cosine_parity(reference, embeddings)
+        results.append({
+            "backend": name,
+            "seconds": elapsed,
+            "texts_per_s": len(texts) / elapsed,
+            "min_cosine": float(cosine.min()),
+            "mean_cosine": float(cosine.mean()),
+            "model_mb": size / 1024 / 1024 if size is not None else None,
+        })
+
+    baseline = results[0]["texts_per_s"]
+    for r in results:
+        model_mb = f", model {r['model_mb']:.1f} MB" if r["model_mb"] is not None else ""
+        print(f"{r['backend']:>10}: {r['seconds']:.2f}s, {r['texts_per_s']:.1f} texts/s, x{r['texts_per_s'] / baseline:.2f}, "
+              f"cosine vs {results[0]['backend']} min {r['min_cosine']:.6f} mean {r['mean_cosine']:.6f}{model_mb}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"texts": len(texts), "threads": args.threads, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,233 @@
+"""
+端到端流水线基准：在合成语料上依次运行各阶段，测量 docs/s、chunks/s、MB/s 和峰值 RSS
+    parse  - intelligent_parser.process_directory
+    chunk  - advanced_chunker.chunk_documents
+    encode - EmbeddingClient.encode（默认使用离线构建的随机微型模型）
+    import - import_data 导入本地向量索引 LocalIndex
+
+python -m benchmarks.bench_pipeline --scale 4 --workers 4
+python -m benchmarks.bench_pipeline --corpus bench_corpus --model bench_model/st --output bench_results/v2.json --compare bench_results/v1.json
+
+结果写入 JSON（含 git 提交、Python 版本、参数、语料规模和 Scripts/metrics 收集的细粒度指标），--compare 与之前的结果逐阶段对比。
+峰值 RSS 在安装 psutil 时按 50ms 采样本进程及其子进程的 RSS 之和，否则退化为本进程自启动以来的峰值。
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.tiny_model import build_tiny_model, corpus_texts
+from Scripts import metrics
+from Scripts.advanced_chunker import chunk_documents
+from Scripts.embedding_client import EmbeddingClient
+from Scripts.import_to_milvus import import_data
+from Scripts.intelligent_parser import process_directory
+from Scripts.local_index import LocalIndex
+from Scripts.vector_store import NpyVectorWriter, read_shape, vector_path_for
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class PeakRSS:
+    """
+    在 with 块执行期间记录峰值常驻内存（MB）
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        process = psutil.Process()
+        while True:
+            try:
+                rss = process.memory_info().rss
+                rss += sum(child.memory_info().rss for child in process.children(recursive=True))
+            except psutil.Error:
+                rss = 0
+            self.peak = max(self.peak, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        if psutil is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if psutil is not None:
+            self._stop.set()
+            self._thread.join()
+        else:
+            import resource
+            # Linux 上 ru_maxrss 单位为 KB
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    @property
+    def peak_mb(self):
+        return self.peak / 1024 / 1024
+
+
+def file_size(*paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def count_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def run_stage(name, func, docs, input_bytes, count_chunks):
+    """
+    运行一个阶段并返回指标；count_chunks 在阶段结束后调用，返回该阶段产出（或处理）的分块数
+    """
+    print(f"\n=== {name} ===")
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+    chunks = count_chunks()
+    result = {
+        "seconds": elapsed,
+        "docs": docs,
+        "chunks": chunks,
+        "input_mb": input_bytes / 1024 / 1024,
+        "docs_per_s": docs / elapsed,
+        "chunks_per_s": chunks / elapsed,
+        "mb_per_s": input_bytes / 1024 / 1024 / elapsed,
+        "peak_rss_mb": rss.peak_mb,
+    }
+    print(f"{name}: {elapsed:.2f}s, {result['docs_per_s']:.1f} docs/s, {result['chunks_per_s']:.1f} chunks/s, "
+          f"{result['mb_per_s']:.2f} MB/s, peak RSS {result['peak_rss_mb']:.0f} MB")
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """
+    逐阶段打印与基线结果的吞吐比值和峰值内存变化
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for stage, current in results["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if old is None:
+            continue
+        ratios = ", ".join(f"{metric} x{current[metric] / old[metric]:.2f}"
+                           for metric in ("docs_per_s", "chunks_per_s", "mb_per_s") if old[metric])
+        print(f"{stage:>7}: {ratios}, peak RSS {old['peak_rss_mb']:.0f} -> {current['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end pipeline throughput benchmark")
+    parser.add_argument("--corpus", type=str, default=None, help="Existing corpus directory (default: generate one)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Synthetic corpus scale (files per type = 4 * scale)")
+    parser.add_argument("--workdir", type=str, default=None, help="Directory for intermediate files (default: temp dir)")
+    parser.add_argument("--model", type=str, default=None, help="Embedding model (default: build a tiny random model)")
+    parser.add_argument("--truncate_dim", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="Parser worker processes")
+    parser.add_argument("--pdf_workers", type=int, default=1)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--max_batch_tokens", type=int, default=None)
+    parser.add_argument("--insert_workers", type=int, default=2)
+    parser.add_argument("--stages", type=str, nargs="+", default=["parse", "chunk", "encode", "import"],
+                        choices=["parse", "chunk", "encode", "import"])
+    parser.add_argument("--output", type=str, default=None,
+                        help="Result JSON path (default: bench_results/pipeline_<time>_<commit>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="Previous result JSON to compare against")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    workdir = Path(args.workdir or tmp.name)
+    workdir.mkdir(parents=True, exist_ok=True)
+    corpus_dir = Path(args.corpus) if args.corpus else workdir / "corpus"
+    if args.corpus is None:
+        print(f"Generating corpus (scale={args.scale}) in {corpus_dir}...")
+        generate_corpus(corpus_dir, args.scale)
+    corpus_files = sorted(p for p in corpus_dir.iterdir() if p.is_file())
+    corpus = {"files": len(corpus_files), "bytes": sum(p.stat().st_size for p in corpus_files)}
+
+    parsed = workdir / "parsed.jsonl"
+    chunks = workdir / "chunks.jsonl"
+    vectorized = workdir / "vectorized.jsonl"
+    stages = {}
+    docs = corpus["files"]
+
+    if "parse" in args.stages:
+        stages["parse"] = run_stage(
+            "parse", lambda: process_directory(str(corpus_dir), str(parsed), workers=args.workers, pdf_workers=args.pdf_workers),
+            docs, corpus["bytes"], lambda: count_lines(parsed))
+
+    if "chunk" in args.stages:
+        stages["chunk"] = run_stage(
+            "chunk", lambda: chunk_documents(str(parsed), str(chunks)),
+            docs, file_size(parsed), lambda: count_lines(chunks))
+
+    if "encode" in args.stages:
+        model = args.model or build_tiny_model(workdir / "model", corpus_texts(corpus_dir))
+        client = EmbeddingClient(model_name=model, truncate_dim=args.truncate_dim)
+        # 模型加载不计入编码阶段的耗时
+        client.load_model()
+        with open(chunks, "r", encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        texts = [item["text"] for item in items]
+        embeddings = []
+        stages["encode"] = run_stage(
+            "encode", lambda: embeddings.append(client.encode(texts, batch_size=args.batch_size,
+                                                               max_batch_tokens=args.max_batch_tokens,
+                                                               show_progress_bar=False)),
+            docs, sum(len(t.encode("utf-8")) for t in texts), lambda: len(texts))
+
+        # 写出 import 阶段的输入（元数据 JSONL + npy 向量），不计入耗时
+        with open(vectorized, "w", encoding="utf-8") as f, \
+                NpyVectorWriter(vector_path_for(vectorized), embeddings[0].shape[1]) as writer:
+            writer.write(embeddings[0])
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    if "import" in args.stages:
+        index = LocalIndex(read_shape(vector_path_for(vectorized))[1])
+        stages["import"] = run_stage(
+            "import", lambda: import_data(index, str(vectorized), batch_size=1000, workers=args.insert_workers),
+            docs, file_size(vectorized, vector_path_for(vectorized)), lambda: index.num_entities)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "corpus": corpus,
+        "stages": stages,
+        "metrics": metrics.METRICS.to_dict(),
+    }
+    output = Path(args.output or f"bench_results/pipeline_{time.strftime('%Y%m%d-%H%M%S')}_{results['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    tmp.cleanup()
@@ -0,0 +1,96 @@
+"""
+量化向量的内存节省与召回损失报告：
+    对 int8 / binary，分别测量只用量化向量检索（coarse）与取 top_k * oversample 个候选后
+    用 float 向量重新打分（rescore）的 recall@k，基准为 float32 精确检索
+
+python -m benchmarks.bench_quantization --rows 200000 --dim 768 --oversample 2 4 8
+python -m benchmarks.bench_quantization --input data/output/vectorized.jsonl --output quantization_report.json
+
+内存按向量本身估算，另给出 HNSW 图（第 0 层每个向量 2 * M 个 4 字节邻居）在内的每向量字节数。
+"""
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks.bench_recall import load_input, make_queries, recall_at_k, synthetic_vectors
+from Scripts.local_index import LocalIndex
+from Scripts.quantization import Quantizer
+
+
+def build_index(vectors, quantizer):
+    index = LocalIndex(quantizer.dim, vector_type=quantizer.vector_type)
+    n = len(vectors)
+    index.insert([[""] * n, quantizer.quantize(vectors), [""] * n, [-1] * n, ["text"] * n])
+    return index
+
+
+def search_ids(index, queries, limit):
+    return [[hit.id for hit in hits] for hits in index.search(queries, limit=limit)]
+
+
+def rescore(vectors, queries, candidates, k):
+    """
+    用 float 向量对候选重新打分，返回每条查询的 top-k id
+    """
+    results = []
+    for query, ids in zip(queries, candidates):
+        ids = np.asarray(ids)
+        scores = vectors[ids] @ query
+        results.append(ids[np.argsort(-scores)[:k]].tolist())
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report memory saved vs recall lost for int8/binary vectors")
+    parser.add_argument("--input", type=str, default=None, help="Vectorized JSONL (uses the .npy sidecar if present)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--oversample", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--M", type=int, default=16, help="HNSW M used for the per-vector memory estimate")
+    parser.add_argument("--output", type=str, default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    vectors = load_input(args.input) if args.input else synthetic_vectors(args.rows, args.dim)
+    queries = make_queries(vectors, args.queries)
+    n, dim = vectors.shape
+    k = args.top_k
+    truth = search_ids(build_index(vectors, Quantizer("float", dim)), queries, k)
+    graph_bytes = 2 * args.M * 4
+
+    report = []
+    for vector_type in ("float", "int8", "binary"):
+        quantizer = Quantizer.calibrate(vector_type, vectors)
+        vector_bytes = quantizer.bytes_per_vector
+        row = {
+            "vector_type": vector_type,
+            "bytes_per_vector": vector_bytes,
+            "hnsw_bytes_per_vector": vector_bytes + graph_bytes,
+            "total_mb": n * vector_bytes / 1024 / 1024,
+            "memory_saved": 1 - vector_bytes / (dim * 4),
+            "recall": {},
+        }
+        if vector_type != "float":
+            index = build_index(vectors, quantizer)
+            candidates = search_ids(index, quantizer.quantize(queries), k * max(args.oversample))
+            row["recall"]["coarse"] = recall_at_k([c[:k] for c in candidates], truth)
+            for oversample in args.oversample:
+                reranked = rescore(vectors, queries, [c[:k * oversample] for c in candidates], k)
+                row["recall"][f"rescore_x{oversample}"] = recall_at_k(reranked, truth)
+        else:
+            row["recall"]["exact"] = 1.0
+        report.append(row)
+
+    print(f"Corpus {vectors.shape}, {len(queries)} queries, k={k}")
+    for row in report:
+        recalls = ", ".join(f"{name}={value:.4f}" for name, value in row["recall"].items())
+        print(f"{row['vector_type']:>7}: {row['bytes_per_vector']:>5} B/vector "
+              f"({row['hnsw_bytes_per_vector']} B with HNSW graph), {row['total_mb']:.1f} MB, "
+              f"saved {row['memory_saved']:.1%} | recall@{k}: {recalls}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rows": n, "dim": dim, "top_k": k, "results": report}, f, indent=2)
+        print(f"Report written to {args.output}")
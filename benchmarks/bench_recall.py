@@ -0,0 +1,142 @@
+"""
+以 LocalIndex 精确检索为基准，测量近似检索的 recall@k 与 QPS：
+    local IVF   - 不同 nprobe
+    Milvus HNSW - 不同 ef（指定 --milvus 时）
+
+python -m benchmarks.bench_recall --rows 200000 --dim 256 --nlist 1024 --nprobe 4 16 64
+python -m benchmarks.bench_recall --input data/output/vectorized.jsonl --milvus --uri ./bench_milvus.db --ef 16 64 256
+
+不指定 --input 时生成带簇结构的合成向量；指定时使用向量文件（优先读取同名 .npy）中的向量，查询取自其中的随机行并加噪声。
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from pymilvus import utility
+
+from Scripts.import_to_milvus import connect_milvus, create_collection, import_data, make_index_params
+from Scripts.local_index import LocalIndex
+from Scripts.vector_store import NpyVectorWriter, load_vectors, vector_path_for
+
+
+def synthetic_vectors(rows, dim, clusters=256, spread=0.3, seed=0):
+    """
+    生成 clusters 个簇中心附近的单位向量（比均匀随机向量更接近真实嵌入的分布）
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    vectors = centers[rng.integers(0, clusters, rows)]
+    vectors += rng.standard_normal((rows, dim), dtype=np.float32) * (spread / np.sqrt(dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def load_input(input_file):
+    vector_path = vector_path_for(input_file)
+    if vector_path.exists():
+        return np.asarray(load_vectors(vector_path), dtype=np.float32)
+    with open(input_file, "r", encoding="utf-8") as f:
+        return np.asarray([json.loads(line)["vector"] for line in f if line.strip()], dtype=np.float32)
+
+
+def make_queries(vectors, n, noise=0.05, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), n, replace=n > len(vectors))].copy()
+    queries += rng.standard_normal(queries.shape, dtype=np.float32) * (noise / np.sqrt(vectors.shape[1]))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def recall_at_k(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def timed_search(search, queries, batch):
+    """
+    按 batch 条一组检索，返回每条查询的结果 id 列表与 QPS
+    """
+    found = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        found.extend(search(queries[i:i + batch]))
+    return found, len(queries) / (time.perf_counter() - start)
+
+
+def local_search(index, k, nprobe=None):
+    param = {"metric_type": "IP", "params": {"nprobe": nprobe} if nprobe else {}}
+    return lambda q: [[hit.id for hit in hits] for hits in index.search(q, "vector", param, limit=k)]
+
+
+def milvus_search(collection, k, ef):
+    param = {"metric_type": "IP", "params": {"ef": ef}}
+    return lambda q: [[int(hit.entity.get("text")) for hit in hits]
+                      for hits in collection.search(q, "vector", param, limit=k, output_fields=["text"])]
+
+
+def build_milvus(vectors, name, index_params, batch_size=5000):
+    """
+    通过 import_data 导入，text 字段存放行号，用于与精确检索结果对齐
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = Path(tmp) / "vectorized.jsonl"
+        with open(input_file, "w", encoding="utf-8") as f, NpyVectorWriter(vector_path_for(input_file), vectors.shape[1]) as writer:
+            writer.write(vectors)
+            for i in range(len(vectors)):
+                f.write(json.dumps({"text": str(i), "metadata": {"source": f"doc_{i // 100}"}}) + "\n")
+        collection = create_collection(name, vectors.shape[1], index_params=index_params)
+        import_data(collection, str(input_file), batch_size=batch_size)
+    utility.wait_for_index_building_complete(name)
+    collection.load()
+    return collection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recall@k and QPS of approximate search against exact search")
+    parser.add_argument("--input", type=str, default=None, help="Vectorized JSONL (uses the .npy sidecar if present)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=16, help="Queries per search call")
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--milvus", action="store_true", help="Also benchmark Milvus HNSW")
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--index_params", type=str, default='{"M": 16, "efConstruction": 256}')
+    parser.add_argument("--uri", type=str, default=None)
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=str, default="19530")
+    args = parser.parse_args()
+
+    vectors = load_input(args.input) if args.input else synthetic_vectors(args.rows, args.dim)
+    queries = make_queries(vectors, args.queries)
+    k = args.top_k
+    print(f"Corpus {vectors.shape}, {len(queries)} queries, k={k}")
+
+    index = LocalIndex(vectors.shape[1])
+    index.insert([[""] * len(vectors), vectors, [""] * len(vectors), [-1] * len(vectors), ["text"] * len(vectors)])
+    truth, qps = timed_search(local_search(index, k), queries, args.batch)
+    results = [{"method": "exact", "param": None, "recall": 1.0, "qps": qps}]
+
+    start = time.perf_counter()
+    index.build_ivf(nlist=args.nlist)
+    print(f"IVF build: {time.perf_counter() - start:.1f}s ({args.nlist} lists)")
+    for nprobe in args.nprobe:
+        found, qps = timed_search(local_search(index, k, nprobe), queries, args.batch)
+        results.append({"method": "local_ivf", "param": f"nprobe={nprobe}", "recall": recall_at_k(found, truth), "qps": qps})
+
+    if args.milvus:
+        connect_milvus(args.host, args.port, args.uri)
+        name = "bench_recall"
+        collection = build_milvus(vectors, name, make_index_params("HNSW", json.loads(args.index_params)))
+        for ef in args.ef:
+            found, qps = timed_search(milvus_search(collection, k, max(ef, k)), queries, args.batch)
+            results.append({"method": "milvus_hnsw", "param": f"ef={ef}", "recall": recall_at_k(found, truth), "qps": qps})
+        utility.drop_collection(name)
+
+    for r in results:
+        print(f"{r['method']:>12} {str(r['param'] or ''):>12}: recall@{k}={r['recall']:.4f}, {r['qps']:.0f} QPS")
@@ -0,0 +1,171 @@
+"""
+分块引擎一致性检查：native 与 langchain 两种引擎在同一输入上的分块结果（正文与元数据）逐条比较
+
+    解析结果 - --input 指定解析 JSONL；否则用 intelligent_parser 解析 --input_dir（默认 data/input）
+    随机文档 - --fuzz N 生成 N 篇覆盖边界情况的随机 Markdown：多级与不合法的标题、``` / ~~~ 围栏（含未闭合、
+               行内 ```、带语言名）、制表符 / 全角空格 / 零宽字符 / CRLF、无空格的长行、各语言的代码、表格记录
+    分块器   - 同时以随机的 chunk_size / chunk_overlap / 分隔符直接比较 RecursiveSplitter 与 RecursiveCharacterTextSplitter
+
+发现不一致时打印前几处差异并以非零状态退出。
+
+python -m benchmarks.check_chunker
+python -m benchmarks.check_chunker --input data/output/parsed.jsonl --fuzz 2000 --seed 1
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from Scripts.advanced_chunker import get_separators_for_language, iter_chunks
+from Scripts.intelligent_parser import process_directory
+from Scripts.structural_chunker import RecursiveSplitter
+
+HEADER_LINES = ["# 标题", "## 小节", "### 条目", "#### 四级", "#无空格", "#", "##", "  ## 缩进标题 ", "###   多个空格   ",
+                "# 标题", "## 小节"]
+FENCE_LINES = ["```", "```python", "```py", "```js", "```go", "```java", "```cpp", "```c++", "~~~", "~~~py", "```a```",
+               "  ```  ", "``` python", "```\t", "````"]
+BLANK_LINES = ["", "", "", "   ", "\t", "\u3000", "\r"]
+CODE_LINES = ["class Worker:", "def run(data):", "    return data", "function main() {", "func main() {",
+              "type Item struct {", "int x = 1;", "public void run() {", "const a = 1;", "}", "    # 注释", ""]
+WORDS = "数据 系统 模型 向量 检索 文档 城市 星球 信号 记忆 算法 协议 token vector index search".split()
+ODD_CHARS = ["\t", "\u3000", "\u200b", "\x00", "\xa0", "\ufeff", " ", "  "]
+
+
+def random_text_line(rng):
+    kind = rng.random()
+    if kind < 0.5:
+        line = "".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30)))
+    elif kind < 0.7:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 120)))
+    elif kind < 0.85:
+        # 没有空格的长行，触发逐字符切分
+        line = "".join(rng.choice(WORDS) for _ in range(rng.randint(200, 700)))
+    elif kind < 0.95:
+        line = "-" * rng.randint(1, 60)
+    else:
+        line = "".join(rng.choice(WORDS + ODD_CHARS) for _ in range(rng.randint(1, 40)))
+    if rng.random() < 0.05:
+        line = rng.choice(ODD_CHARS) + line
+    if rng.random() < 0.05:
+        line += rng.choice(ODD_CHARS)
+    if rng.random() < 0.05:
+        line += " ```inline``` "
+    return line
+
+
+def random_markdown(rng):
+    lines = []
+    for _ in range(rng.randint(0, 80)):
+        kind = rng.random()
+        if kind < 0.12:
+            lines.append(rng.choice(HEADER_LINES))
+        elif kind < 0.2:
+            lines.append(rng.choice(FENCE_LINES))
+        elif kind < 0.4:
+            lines.append(rng.choice(BLANK_LINES))
+        elif kind < 0.55:
+            lines.append(rng.choice(CODE_LINES))
+        else:
+            lines.append(random_text_line(rng))
+    text = "\n".join(lines)
+    if rng.random() < 0.3:
+        text += "\n" * rng.randint(1, 3)
+    if rng.random() < 0.1:
+        text = text.replace("\n", "\r\n")
+    return text
+
+
+def fuzz_docs(rng, count):
+    docs = []
+    for i in range(count):
+        doc = {"source": f"fuzz_{i // 4}.md", "file_type": rng.choice(["md", "docx", "pdf"]),
+               "content": random_markdown(rng)}
+        if rng.random() < 0.3:
+            doc["page"] = rng.randint(0, 5)
+        if rng.random() < 0.1:
+            doc["is_table"] = True
+        docs.append(doc)
+    return docs
+
+
+def compare_engines(docs, label, show=5):
+    """
+    比较两种引擎的输出，返回不一致的分块数
+    """
+    native = list(iter_chunks(docs, engine="native"))
+    reference = list(iter_chunks(docs, engine="langchain"))
+    mismatches = 0
+    for i in range(max(len(native), len(reference))):
+        a = native[i] if i < len(native) else None
+        b = reference[i] if i < len(reference) else None
+        if a != b:
+            mismatches += 1
+            if mismatches <= show:
+                print(f"[{label}] chunk {i} differs:\n  native:    {json.dumps(a, ensure_ascii=False)[:300]}\n"
+                      f"  langchain: {json.dumps(b, ensure_ascii=False)[:300]}")
+    print(f"{label}: {len(docs)} records, {len(reference)} chunks (langchain) / {len(native)} chunks (native), "
+          f"{mismatches} mismatches")
+    return mismatches
+
+
+def compare_splitters(rng, count, show=5):
+    """
+    以随机参数直接比较两种递归切分器，返回不一致的次数
+    """
+    mismatches = 0
+    for i in range(count):
+        chunk_size = rng.choice([1, 2, 3, 5, 8, 13, 30, 60, 120, 300, 800])
+        chunk_overlap = rng.randint(0, chunk_size)
+        language = rng.choice([None, None, "", "python", "js", "java", "go", "cpp"])
+        text = random_markdown(rng)
+        if language is None:
+            kwargs = {}
+        else:
+            kwargs = {"separators": get_separators_for_language(language), "is_separator_regex": True}
+        expected = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                  **kwargs).split_text(text)
+        actual = RecursiveSplitter(chunk_size, chunk_overlap, **kwargs).split_text(text)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= show:
+                print(f"[splitter] case {i} differs (chunk_size={chunk_size}, overlap={chunk_overlap}, "
+                      f"language={language!r}): {len(actual)} vs {len(expected)} chunks")
+    print(f"splitter: {count} random cases, {mismatches} mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the native chunking engine matches the LangChain one")
+    parser.add_argument("--input", type=str, default=None, help="Parsed JSONL (default: parse --input_dir)")
+    parser.add_argument("--input_dir", type=str, default="data/input", help="Raw documents to parse and compare")
+    parser.add_argument("--fuzz", type=int, default=500, help="Number of random Markdown documents")
+    parser.add_argument("--splitter_cases", type=int, default=2000, help="Number of random splitter comparisons")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # 超过 chunk_size 的分块会让 LangChain 逐条打印警告
+    logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parsed = args.input
+        if parsed is None:
+            parsed = str(Path(tmp) / "parsed.jsonl")
+            process_directory(args.input_dir, parsed)
+        with open(parsed, "r", encoding="utf-8") as f:
+            docs = [json.loads(line) for line in f if line.strip()]
+
+    rng = random.Random(args.seed)
+    failures = compare_engines(docs, parsed if args.input else args.input_dir)
+    if args.fuzz:
+        failures += compare_engines(fuzz_docs(rng, args.fuzz), "fuzz")
+    if args.splitter_cases:
+        failures += compare_splitters(rng, args.splitter_cases)
+    if failures:
+        print("FAILED: the native engine does not match the LangChain engine")
+        sys.exit(1)
+    print("OK: both engines produce identical chunks")
@@ -0,0 +1,162 @@
+"""
+生成可按规模缩放的合成语料，用于流水线基准测试：
+    prose_*.md - 长篇中文散文（多级标题 + 段落）
+    code_*.md  - 代码较多的 Markdown，覆盖 get_separators_for_language 支持的各种语言
+    doc_*.docx - 带标题层级的 DOCX
+    table_*.pdf - 每页包含中文段落和一张带框线表格的 PDF
+
+python -m benchmarks.corpus --output bench_corpus --scale 4
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+
+import pymupdf
+from docx import Document
+
+WORDS = (
+    "数据 系统 模型 向量 检索 文档 城市 星球 信号 记忆 时间 工程师 实验 网络 服务器 意识 "
+    "算法 协议 能源 海洋 飞船 边界 规则 历史 未来 语言 结构 节点 频率 观测 样本 密钥 "
+    "分析 构建 传输 解析 计算 发现 记录 修复 等待 追踪 融合 压缩 验证 迁移 回溯 扩展"
+).split()
+ADJECTIVES = "巨大的 安静的 复杂的 古老的 陌生的 稳定的 透明的 遥远的 沉默的 精确的".split()
+CLAUSE_PUNCT = list("，，，；")
+SENTENCE_PUNCT = list("。。！？")
+
+CODE_LANGUAGES = ("python", "javascript", "typescript", "java", "go", "cpp", "c")
+
+
+def sentence(rng, min_words=6, max_words=18):
+    parts = []
+    for i in range(rng.randint(min_words, max_words)):
+        if rng.random() < 0.2:
+            parts.append(rng.choice(ADJECTIVES))
+        parts.append(rng.choice(WORDS))
+        if i and rng.random() < 0.15:
+            parts.append(rng.choice(CLAUSE_PUNCT))
+    return "".join(parts) + rng.choice(SENTENCE_PUNCT)
+
+
+def paragraph(rng, min_sentences=4, max_sentences=12):
+    return "".join(sentence(rng) for _ in range(rng.randint(min_sentences, max_sentences)))
+
+
+def prose_markdown(rng, target_chars):
+    lines = [f"# 第{rng.randint(1, 9)}卷 {rng.choice(WORDS)}{rng.choice(WORDS)}"]
+    size = 0
+    chapter = 0
+    while size < target_chars:
+        chapter += 1
+        lines.append(f"\n## 第{chapter}章 {rng.choice(ADJECTIVES)}{rng.choice(WORDS)}\n")
+        for section in range(rng.randint(1, 3)):
+            lines.append(f"### {chapter}.{section + 1} {rng.choice(WORDS)}\n")
+            for _ in range(rng.randint(3, 8)):
+                text = paragraph(rng)
+                lines.append(text + "\n")
+                size += len(text)
+    return "\n".join(lines)
+
+
+def code_block(rng, language):
+    name = f"{rng.choice(['load', 'parse', 'build', 'merge', 'encode', 'index'])}_{rng.randint(0, 999)}"
+    body_lines = rng.randint(3, 12)
+    if language == "python":
+        body = "\n".join(f"    value_{i} = compute(value_{i - 1 if i else 0}, {i})" for i in range(body_lines))
+        return f"class Worker{rng.randint(0, 99)}:\n    pass\n\n\ndef {name}(data):\n{body}\n    return data\n"
+    if language in ("javascript", "typescript"):
+        typed = ": number" if language == "typescript" else ""
+        body = "\n".join(f"  let value{i}{typed} = compute(value{max(i - 1, 0)}, {i});" for i in range(body_lines))
+        return f"const LIMIT = {rng.randint(1, 100)};\n\nfunction {name}(data) {{\n{body}\n  return data;\n}}\n"
+    if language == "java":
+        body = "\n".join(f"        int value{i} = compute({i});" for i in range(body_lines))
+        return f"public class Worker{rng.randint(0, 99)} {{\n    public int {name}(int data) {{\n{body}\n        return data;\n    }}\n}}\n"
+    if language == "go":
+        body = "\n".join(f"\tvalue{i} := compute({i})" for i in range(body_lines))
+        return f"type Worker struct {{\n\tid int\n}}\n\nfunc {name}(data int) int {{\n{body}\n\treturn data\n}}\n"
+    body = "\n".join(f"    int value{i} = compute({i});" for i in range(body_lines))
+    return f"struct Worker {{\n    int id;\n}};\n\nint {name}(int data) {{\n{body}\n    return data;\n}}\n"
+
+
+def code_markdown(rng, target_chars):
+    lines = [f"# {rng.choice(WORDS)}模块开发笔记"]
+    size = 0
+    while size < target_chars:
+        language = rng.choice(CODE_LANGUAGES)
+        lines.append(f"\n## {language} 实现：{rng.choice(WORDS)}{rng.choice(WORDS)}\n")
+        lines.append(paragraph(rng, 1, 3) + "\n")
+        for _ in range(rng.randint(1, 3)):
+            code = code_block(rng, language)
+            lines.append(f"```{language}\n{code}```\n")
+            size += len(code)
+    return "\n".join(lines)
+
+
+def write_docx(path, rng, target_chars):
+    doc = Document()
+    doc.add_heading(f"{rng.choice(WORDS)}{rng.choice(WORDS)}报告", level=1)
+    size = 0
+    section = 0
+    while size < target_chars:
+        section += 1
+        doc.add_heading(f"{section}. {rng.choice(ADJECTIVES)}{rng.choice(WORDS)}", level=2)
+        for sub in range(rng.randint(1, 3)):
+            doc.add_heading(f"{section}.{sub + 1} {rng.choice(WORDS)}", level=3)
+            for _ in range(rng.randint(2, 5)):
+                text = paragraph(rng)
+                doc.add_paragraph(text)
+                size += len(text)
+    doc.save(path)
+
+
+def write_pdf(path, rng, pages):
+    doc = pymupdf.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = "\n".join(paragraph(rng, 2, 4) for _ in range(3))
+        page.insert_textbox(pymupdf.Rect(50, 50, 545, 420), text, fontname="china-s", fontsize=10)
+
+        # 带框线的表格：表头 + 数值行
+        rows, cols = rng.randint(3, 8), rng.randint(3, 5)
+        left, top, width, height = 60, 440, 95, 20
+        for r in range(rows + 1):
+            page.draw_line((left, top + r * height), (left + cols * width, top + r * height))
+        for c in range(cols + 1):
+            page.draw_line((left + c * width, top), (left + c * width, top + rows * height))
+        for r in range(rows):
+            for c in range(cols):
+                value = f"列{c + 1}" if r == 0 else str(rng.randint(0, 9999))
+                page.insert_text((left + c * width + 5, top + r * height + 14), value, fontname="china-s", fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def generate_corpus(output_dir, scale=1.0, seed=0, prose_chars=100000, code_chars=40000, docx_chars=40000, pdf_pages=10):
+    """
+    生成合成语料，每种类型 max(1, round(4 * scale)) 个文件，返回各类型的文件数和总字节数
+    """
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    count = max(1, round(4 * scale))
+    for i in range(count):
+        (output_dir / f"prose_{i:04d}.md").write_text(prose_markdown(rng, prose_chars), encoding="utf-8")
+        (output_dir / f"code_{i:04d}.md").write_text(code_markdown(rng, code_chars), encoding="utf-8")
+        write_docx(output_dir / f"doc_{i:04d}.docx", rng, docx_chars)
+        write_pdf(output_dir / f"table_{i:04d}.pdf", rng, pdf_pages)
+
+    files = sorted(p for p in output_dir.iterdir() if p.is_file())
+    summary = {"files": len(files), "bytes": sum(p.stat().st_size for p in files)}
+    for suffix in ("md", "docx", "pdf"):
+        summary[suffix] = sum(1 for p in files if p.suffix == f".{suffix}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus for pipeline benchmarks")
+    parser.add_argument("--output", type=str, default="bench_corpus")
+    parser.add_argument("--scale", type=float, default=1.0, help="Files per type = 4 * scale")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(generate_corpus(args.output, args.scale, args.seed), indent=2))
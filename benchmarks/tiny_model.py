@@ -0,0 +1,62 @@
+"""
+离线构建一个随机初始化的微型 SentenceTransformer，代替真实嵌入模型做吞吐基准
+（不需要访问 Hugging Face，向量没有语义，只用于测量流水线开销）
+
+python -m benchmarks.tiny_model --output bench_model --corpus bench_corpus
+"""
+import argparse
+from pathlib import Path
+
+
+def build_tiny_model(output_dir, texts, vocab_size=4000, hidden_size=64, layers=2, heads=2, seed=0):
+    """
+    在 texts 上训练 WordPiece 分词器，配一个随机初始化的小型 BERT 与均值池化，保存为 SentenceTransformer 目录
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from tokenizers import BertWordPieceTokenizer
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    output_dir = Path(output_dir)
+    hf_dir = output_dir / "hf"
+    hf_dir.mkdir(parents=True, exist_ok=True)
+
+    tokenizer = BertWordPieceTokenizer(handle_chinese_chars=True, lowercase=True)
+    tokenizer.train_from_iterator(texts, vocab_size=vocab_size)
+    tokenizer.save_model(str(hf_dir))
+    BertTokenizerFast(vocab_file=str(hf_dir / "vocab.txt")).save_pretrained(hf_dir)
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=tokenizer.get_vocab_size(), hidden_size=hidden_size, num_hidden_layers=layers,
+                        num_attention_heads=heads, intermediate_size=hidden_size * 2)
+    BertModel(config).save_pretrained(hf_dir)
+
+    transformer = models.Transformer(str(hf_dir), max_seq_length=512)
+    pooling = models.Pooling(hidden_size, pooling_mode="mean")
+    model_dir = output_dir / "st"
+    SentenceTransformer(modules=[transformer, pooling]).save(str(model_dir))
+    return str(model_dir)
+
+
+def corpus_texts(corpus_dir, limit_chars=2_000_000):
+    """
+    读取语料目录中的 Markdown 文本，用于训练分词器
+    """
+    texts, size = [], 0
+    for path in sorted(Path(corpus_dir).glob("*.md")):
+        text = path.read_text(encoding="utf-8")
+        texts.extend(text.splitlines())
+        size += len(text)
+        if size >= limit_chars:
+            break
+    return texts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a tiny random SentenceTransformer for offline benchmarks")
+    parser.add_argument("--output", type=str, default="bench_model")
+    parser.add_argument("--corpus", type=str, default="bench_corpus", help="Corpus directory to train the tokenizer on")
+    parser.add_argument("--hidden_size", type=int, default=64)
+    args = parser.parse_args()
+
+    print(build_tiny_model(args.output, corpus_texts(args.corpus), hidden_size=args.hidden_size))
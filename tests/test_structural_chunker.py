@@ -0,0 +1,105 @@
+"""
+native 结构化分块引擎与 LangChain 分块器链的一致性测试
+
+iter_chunks 的两种引擎逐条比较（正文与元数据），scan_markdown / RecursiveSplitter 分别与
+MarkdownHeaderTextSplitter + split_code_and_text / RecursiveCharacterTextSplitter 直接比较。
+更大规模的随机对比见 benchmarks/check_chunker.py。
+"""
+import random
+
+import pytest
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+from benchmarks.check_chunker import fuzz_docs, random_markdown
+from Scripts.advanced_chunker import (HEADERS_TO_SPLIT_ON, SHORT_LINE_CHARS, density_chunk_size,
+                                      determine_chunk_size, get_separators_for_language, iter_chunks,
+                                      split_code_and_text)
+from Scripts.structural_chunker import RecursiveSplitter, scan_markdown
+
+PY_CODE = "\n".join(f"def handler_{i}(event):\n    return process(event, retries={i})\n" for i in range(30))
+CJK_LINE = "向量检索系统把文档切分为语义连贯的分块，再为每个分块计算嵌入向量并写入索引。" * 3
+
+DOCS = {
+    "fenced_code": f"# 指南\n\n说明文字。\n\n```python\n{PY_CODE}```\n\n之后的文字。\n\n```\n```\n",
+    "fence_variants": "## 变体\n\n```js\nconst a = 1;\n```tail\n\n````\nx\n````\n\n~~~py\n```inside```\n~~~\n\n"
+                      "行内 ```code``` 写法\n\n```c++\nint x;\n```\n\n``` python\nprint(1)\n```\n",
+    "unclosed_fence": "# 标题\n\n正文\n\n```go\nfunc main() {\n# 不是标题\n",
+    "nested_headers": "# 一\n\n甲\n\n## 二\n\n乙\n\n### 三\n\n丙\n\n#### 四级不切分\n\n丁\n\n## 二'\n\n戊\n\n# 一'\n\n己\n"
+                      "\n```\n# 围栏内不是标题\n```\n\n# 一'\n\n庚\n",
+    "cjk": "# 中文\n\n" + "\n".join([CJK_LINE] * 12) + "\n\n## 短行\n\n" + "\n".join(["短句。"] * 40),
+    "text_at_limit": "\n\n".join("a" * n for n in (798, 799, 800, 801, 1600)),
+    "dense_at_limit": "\n".join(["item"] * 59) + "\n\n" + "\n".join(["word " * 12] * 60),
+    "code_at_limit": "".join(f"```python\n{'x' * n}\n```\n\n" for n in (798, 799, 800, 801)),
+    "odd_whitespace": "#\t标题\r\n\n　正文​ \n\n```py\t\n  code \n```\n",
+}
+
+
+def _chunks(docs, engine):
+    return list(iter_chunks(docs, engine=engine))
+
+
+@pytest.mark.parametrize("name", sorted(DOCS))
+def test_engines_match(name):
+    docs = [{"source": f"{name}.md", "file_type": "md", "content": DOCS[name]}]
+    native = _chunks(docs, "native")
+    assert native
+    assert native == _chunks(docs, "langchain")
+
+
+def test_engines_match_with_code_and_sizes():
+    # 确认用例确实覆盖了代码段和两种文本 chunk_size
+    docs = [{"source": f"{name}.md", "file_type": "md", "content": content} for name, content in DOCS.items()]
+    native = _chunks(docs, "native")
+    assert native == _chunks(docs, "langchain")
+    kinds = {(chunk["metadata"]["content_type"], chunk["metadata"]["chunk_size"]) for chunk in native}
+    assert {("code", 800), ("text", 800), ("text", 300)} <= kinds
+
+
+def test_header_context_across_records():
+    docs = [
+        {"source": "a.md", "file_type": "md", "content": "# 第一章\n\n正文"},
+        {"source": "a.md", "file_type": "md", "content": "没有标题的续页", "page": 2},
+        {"source": "a.md", "file_type": "md", "content": "| a | b |", "is_table": True},
+        {"source": "b.md", "file_type": "md", "content": "新文件"},
+    ]
+    assert _chunks(docs, "native") == _chunks(docs, "langchain")
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_engines_match_fuzz(seed):
+    docs = fuzz_docs(random.Random(seed), 200)
+    assert _chunks(docs, "native") == _chunks(docs, "langchain")
+
+
+@pytest.mark.parametrize("name", sorted(DOCS))
+def test_scan_markdown_segments(name):
+    text = DOCS[name]
+    expected = []
+    for doc in MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON).split_text(text):
+        for seg in split_code_and_text(doc.page_content):
+            content_type = "code" if seg["type"] == "code" else "text"
+            expected.append((doc.metadata, seg["content"], seg.get("language") if content_type == "code" else None,
+                             determine_chunk_size(seg["content"], content_type)))
+    actual = []
+    for headers, segments in scan_markdown(text, HEADERS_TO_SPLIT_ON, SHORT_LINE_CHARS):
+        for seg_text, language, line_count, short_count in segments:
+            if language is None:
+                chunk_size = density_chunk_size(short_count, line_count)
+            else:
+                chunk_size = determine_chunk_size(seg_text, "code")
+            actual.append((headers, seg_text, language, chunk_size))
+    assert actual == expected
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(300, 30), (800, 80), (50, 0), (13, 13), (1, 0)])
+@pytest.mark.parametrize("language", [None, "", "python", "js", "go"])
+def test_recursive_splitter_matches_langchain(chunk_size, chunk_overlap, language):
+    kwargs = {} if language is None else {"separators": get_separators_for_language(language),
+                                          "is_separator_regex": True}
+    expected_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+    splitter = RecursiveSplitter(chunk_size, chunk_overlap, **kwargs)
+    rng = random.Random(chunk_size * 31 + chunk_overlap)
+    texts = [PY_CODE, CJK_LINE * 4, "a" * chunk_size, "a" * (chunk_size + 1), ""] + \
+            [random_markdown(rng) for _ in range(20)]
+    for text in texts:
+        assert splitter.split_text(text) == expected_splitter.split_text(text)